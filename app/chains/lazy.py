@@ -0,0 +1,54 @@
+import threading
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+
+class LazyRunnable(Runnable[Any, Any]):
+    """
+    Stands in for a runnable that is expensive to import or build.
+    Chains can be composed around it at import time; the real runnable is
+    built by load() (called from the app lifespan) or on first use.
+    Calls are forwarded unchanged, so callbacks, caching and streaming
+    behave exactly as with the wrapped runnable.
+    """
+
+    def __init__(self, factory: Callable[[], Runnable], name: Optional[str] = None):
+        self.factory = factory
+        self.name = name
+        self._runnable: Optional[Runnable] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Runnable:
+        """Build the wrapped runnable once and return it."""
+        if self._runnable is None:
+            with self._lock:
+                if self._runnable is None:
+                    self._runnable = self.factory()
+        return self._runnable
+
+    @property
+    def loaded(self) -> bool:
+        return self._runnable is not None
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.load().invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self.load().ainvoke(input, config, **kwargs)
+
+    def batch(self, inputs: List[Any], config: Any = None, *, return_exceptions: bool = False,
+              **kwargs: Any) -> List[Any]:
+        return self.load().batch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+
+    async def abatch(self, inputs: List[Any], config: Any = None, *, return_exceptions: bool = False,
+                     **kwargs: Any) -> List[Any]:
+        return await self.load().abatch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        yield from self.load().stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None,
+                      **kwargs: Any) -> AsyncIterator[Any]:
+        async for chunk in self.load().astream(input, config, **kwargs):
+            yield chunk
@@ -0,0 +1,302 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import (
+    ensure_config,
+    get_async_callback_manager_for_config,
+    get_callback_manager_for_config,
+    get_executor_for_config,
+    patch_config,
+)
+
+
+class Stage:
+    """
+    A named step of a Pipeline.
+    The stage receives the pipeline input when it has no dependencies, the
+    output of its single dependency, or a dict of outputs keyed by dependency
+    name when it has several.
+
+    shortcut=(dep, resolve) lets a stage finish early: once `dep` is done,
+    resolve(value of dep) is the stage's value unless it returns None. The
+    runnable and the other dependencies are then never run (unless another
+    stage needs them); `dep` is not part of the runnable's input.
+    """
+
+    def __init__(self, name: str, runnable: Runnable, deps: Sequence[str] = (),
+                 group: Optional[str] = None, internal: bool = False,
+                 shortcut: Optional[Tuple[str, Callable[[Any], Any]]] = None):
+        self.name = name
+        self.runnable = runnable
+        self.deps = tuple(deps)
+        self.group = group  # nest the output under result[group][name]
+        self.internal = internal  # computed but left out of the result
+        self.shortcut = shortcut
+        if shortcut is not None and shortcut[0] not in self.deps:
+            raise ValueError(f"Stage {name} shortcut dependency {shortcut[0]} is not in its deps")
+
+    @property
+    def input_deps(self) -> Tuple[str, ...]:
+        """Dependencies whose outputs make up the runnable's input"""
+        if self.shortcut is None:
+            return self.deps
+        return tuple(dep for dep in self.deps if dep != self.shortcut[0])
+
+    def resolve_shortcut(self, values: Dict[str, Any]) -> Any:
+        """The shortcut value, or None when the stage has to run"""
+        dep, resolve = self.shortcut
+        return resolve(values[dep])
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps!r})"
+
+
+class Pipeline(Runnable[Dict[str, Any], Dict[str, Any]]):
+    """
+    Runs a set of named stages as a dependency graph.
+    Every stage starts as soon as the stages it depends on have finished, so
+    independent LLM calls run concurrently instead of one after another.
+    """
+
+    def __init__(self, stages: Iterable[Stage], name: Optional[str] = None,
+                 outputs: Optional[Iterable[str]] = None):
+        self.stages = _toposort(list(stages))
+        self.name = name
+        # Stages whose values end up in the result, all public stages by default
+        self.outputs = (set(outputs) if outputs is not None
+                        else {s.name for s in self.stages if not s.internal})
+
+    def select(self, *outputs: str) -> "Pipeline":
+        """
+        Return a pipeline that only computes the given outputs.
+        Stages that none of the requested outputs depend on are dropped, so
+        callers only pay for the LLM calls they actually use.
+        """
+        by_name = {stage.name: stage for stage in self.stages}
+        needed = set()
+        pending = list(outputs)
+        while pending:
+            name = pending.pop()
+            if name not in by_name:
+                raise ValueError(f"Unknown pipeline output: {name}")
+            if name not in needed:
+                needed.add(name)
+                pending.extend(by_name[name].deps)
+        return Pipeline([s for s in self.stages if s.name in needed],
+                        name=self.name, outputs=outputs)
+
+    def _stage_input(self, stage: Stage, input: Any, values: Dict[str, Any]) -> Any:
+        deps = stage.input_deps
+        if not deps:
+            return input
+        if len(deps) == 1:
+            return values[deps[0]]
+        return {dep: values[dep] for dep in deps}
+
+    def _needed(self, values: Dict[str, Any]) -> Set[str]:
+        """
+        Stages the outputs still depend on, given the values computed so far.
+        A stage with a shortcut only needs its shortcut dependency until that
+        one is done, and nothing more if the shortcut applies.
+        """
+        by_name = {stage.name: stage for stage in self.stages}
+        needed: Set[str] = set()
+        pending = [name for name in self.outputs if name in by_name]
+        while pending:
+            name = pending.pop()
+            if name in needed:
+                continue
+            needed.add(name)
+            stage = by_name[name]
+            if name in values:
+                continue
+            if stage.shortcut is not None:
+                if stage.shortcut[0] not in values:
+                    pending.append(stage.shortcut[0])
+                    continue
+                if stage.resolve_shortcut(values) is not None:
+                    continue
+            pending.extend(stage.deps)
+        return needed
+
+    def _assemble(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for stage in self.stages:
+            if stage.name not in self.outputs or stage.name not in values:
+                continue
+            if stage.group:
+                result.setdefault(stage.group, {})[stage.name] = values[stage.name]
+            else:
+                result[stage.name] = values[stage.name]
+        return result
+
+    def invoke(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None,
+               **kwargs: Any) -> Dict[str, Any]:
+        config = ensure_config(config)
+        callback_manager = get_callback_manager_for_config(config)
+        run_manager = callback_manager.on_chain_start(
+            None, input,
+            name=config.get("run_name") or self.get_name(),
+            run_id=config.pop("run_id", None),
+        )
+
+        def _invoke_stage(stage: Stage, stage_input: Any) -> Any:
+            child_config = patch_config(
+                config, callbacks=run_manager.get_child(f"stage:{stage.name}"))
+            return stage.runnable.invoke(stage_input, child_config)
+
+        values: Dict[str, Any] = {}
+        try:
+            with get_executor_for_config(config) as executor:
+                started: Set[str] = set()
+                running = {}
+                while True:
+                    # Resolve shortcuts and submit every needed stage whose
+                    # dependencies are all available
+                    progress = False
+                    needed = self._needed(values)
+                    for stage in self.stages:
+                        if stage.name not in needed or stage.name in values or stage.name in started:
+                            continue
+                        if stage.shortcut is not None and stage.shortcut[0] in values:
+                            value = stage.resolve_shortcut(values)
+                            if value is not None:
+                                values[stage.name] = value
+                                progress = True
+                                continue
+                        if all(d in values for d in stage.deps):
+                            started.add(stage.name)
+                            future = executor.submit(
+                                _invoke_stage, stage, self._stage_input(stage, input, values))
+                            running[future] = stage
+                    if not running:
+                        if progress:
+                            continue
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        values[running.pop(future).name] = future.result()
+            output = self._assemble(values)
+        except BaseException as e:
+            run_manager.on_chain_error(e)
+            raise
+        run_manager.on_chain_end(output)
+        return output
+
+    async def ainvoke(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None,
+                      **kwargs: Any) -> Dict[str, Any]:
+        return await self._arun(input, config)
+
+    async def astream_stages(self, input: Dict[str, Any], config: Optional[RunnableConfig] = None,
+                             stream: Sequence[str] = ()) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run the pipeline and yield progress events as they happen.
+        Emits {"event": "stage_start"|"stage_end", "stage", "data"} for every
+        stage, {"event": "token", "stage", "data"} for each chunk of the
+        stages listed in `stream` (which run through astream), and finally
+        {"event": "end", "data": result}.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def _run() -> None:
+            try:
+                result = await self._arun(input, config, emit=queue.put_nowait, stream=stream)
+                queue.put_nowait({"event": "end", "stage": None, "data": result})
+            finally:
+                queue.put_nowait(finished)
+
+        task = asyncio.create_task(_run())
+        try:
+            while (event := await queue.get()) is not finished:
+                yield event
+            await task  # re-raise a pipeline failure
+        finally:
+            task.cancel()
+
+    async def _arun(self, input: Dict[str, Any], config: Optional[RunnableConfig],
+                    emit: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    stream: Sequence[str] = ()) -> Dict[str, Any]:
+        config = ensure_config(config)
+        callback_manager = get_async_callback_manager_for_config(config)
+        run_manager = await callback_manager.on_chain_start(
+            None, input,
+            name=config.get("run_name") or self.get_name(),
+            run_id=config.pop("run_id", None),
+        )
+
+        values: Dict[str, Any] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        by_name = {stage.name: stage for stage in self.stages}
+
+        def _demand(name: str) -> asyncio.Task:
+            # Stages start when first needed, so skipped branches never run
+            if name not in tasks:
+                tasks[name] = asyncio.create_task(_ainvoke_stage(by_name[name]))
+            return tasks[name]
+
+        async def _ainvoke_stage(stage: Stage) -> None:
+            if stage.shortcut is not None:
+                await _demand(stage.shortcut[0])
+                value = stage.resolve_shortcut(values)
+                if value is not None:
+                    values[stage.name] = value
+                    if emit:
+                        emit({"event": "stage_start", "stage": stage.name, "data": None})
+                        emit({"event": "stage_end", "stage": stage.name, "data": value})
+                    return
+            for dep in stage.deps:
+                await _demand(dep)
+            child_config = patch_config(
+                config, callbacks=run_manager.get_child(f"stage:{stage.name}"))
+            stage_input = self._stage_input(stage, input, values)
+            if emit:
+                emit({"event": "stage_start", "stage": stage.name, "data": None})
+            if emit and stage.name in stream:
+                value = None
+                async for chunk in stage.runnable.astream(stage_input, child_config):
+                    emit({"event": "token", "stage": stage.name, "data": chunk})
+                    value = chunk if value is None else value + chunk
+            else:
+                value = await stage.runnable.ainvoke(stage_input, child_config)
+            values[stage.name] = value
+            if emit:
+                emit({"event": "stage_end", "stage": stage.name, "data": value})
+
+        try:
+            try:
+                await asyncio.gather(*(_demand(name) for name in self._needed(values)))
+            finally:
+                for task in list(tasks.values()):
+                    task.cancel()
+            output = self._assemble(values)
+        except BaseException as e:
+            await run_manager.on_chain_error(e)
+            raise
+        await run_manager.on_chain_end(output)
+        return output
+
+
+def _toposort(stages: List[Stage]) -> List[Stage]:
+    """Order stages so that every stage comes after its dependencies."""
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate pipeline stage: {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+
+    ordered: List[Stage] = []
+    done = set()
+    while len(ordered) < len(stages):
+        ready = [s for s in stages if s.name not in done and all(d in done for d in s.deps)]
+        if not ready:
+            raise ValueError("Pipeline stages contain a dependency cycle")
+        ordered.extend(ready)
+        done.update(s.name for s in ready)
+    return ordered
@@ -1,39 +1,95 @@
 import os
-import io
-import bcrypt
-import re
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import JSONResponse, FileResponse,StreamingResponse
-from langchain.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
+import json
+import logging
+import math
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Header, Query
+from fastapi.responses import JSONResponse, FileResponse,StreamingResponse, Response
+from langchain_core.prompts import ChatPromptTemplate
 from fastapi.middleware.cors import CORSMiddleware
-from langchain.schema.output_parser import StrOutputParser
-from langchain.schema.runnable import RunnableParallel, RunnableLambda
-import pandas as pd
-from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.runnables import RunnableLambda
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import config
 from .models.model import *
+from .models.advice import Income, Expense, IncomeExtraction, ExpenseExtraction
+from .utils.budget_parser import (parse_incomes, parse_expenses, format_line_items, merge_line_items,
+                                  dump_line_items, load_incomes, load_expenses)
+from .utils.chunking import split_note
+from .utils.fast_extract import extract_budget
+from .utils.near_duplicate import NoteIndex, NoteIndexRecorder
+from .services.rollup_service import apply_rollups, remove_rollups, user_trends
+from .services.job_service import SUCCEEDED, JobQueueFull, JobResult, JobRetryLater, JobRunner
+from .chains.lazy import LazyRunnable
+from .routers.budget import router as budget_router
+from .chains.pipeline import Pipeline, Stage
+from .utils.llm_cache import TieredLLMCache
+from .utils.metrics import (StageMetricsCallback, TimingMiddleware, count_client_retries,
+                            fast_path_results, instrument_engine, registry, timed, timed_iter)
+from .utils.export_cache import ExportCache
+from .utils.rate_limit import LLMRateLimiter, RateLimitExceeded, RateLimitUsageCallback
+from .utils.security import (InvalidToken, acheck_password, ahash_password, issue_token,
+                             revocations, verify_token)
+from .utils.spreadsheet import (BUFFERED_FORMATS, ExportFormatError, negotiate_export_format,
+                                iter_budget_export, iter_export_file, write_budget_export, export_media_type,
+                                export_headers)
+from .utils.cpu_pool import PoolSaturated, cpu_pool
+from .utils.write_behind import QueueFull, WriteBehindQueue, WriterClosed
+from .utils.singleflight import CoalescedRunnable, SingleFlight, normalize_text
 
-# Load environment variables
-load_dotenv(override=True)
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_API_KEY = config.GROQ_API_KEY
+
+logger = logging.getLogger(__name__)
+
+# Response cache shared by every chain stage and helper that calls the LLM
+llm_cache = TieredLLMCache(config.LLM_CACHE_DATABASE_URL,
+                           memory_size=config.LLM_CACHE_MEMORY_SIZE,
+                           max_rows=config.LLM_CACHE_MAX_ROWS,
+                           ttl_seconds=config.LLM_CACHE_TTL_SECONDS,
+                           evict_every=config.LLM_CACHE_EVICT_EVERY) if config.LLM_CACHE_ENABLED else None
+
+# Admission control for every call the pipeline makes to Groq (cache hits skip it)
+llm_rate_limiter = LLMRateLimiter(requests_per_minute=config.LLM_REQUESTS_PER_MINUTE,
+                                  tokens_per_minute=config.LLM_TOKENS_PER_MINUTE,
+                                  max_queue=config.LLM_MAX_QUEUE,
+                                  max_wait_seconds=config.LLM_MAX_WAIT_SECONDS,
+                                  estimated_tokens=config.LLM_ESTIMATED_TOKENS) if config.LLM_RATE_LIMIT_ENABLED else None
+
+# Stage/LLM timings and token counts for /metrics (DB timings and Groq client retries are hooked up in the lifespan)
+stage_metrics = StageMetricsCallback()
+
+# Branches of processed notes, reused for near-duplicate notes
+note_index = NoteIndex(config.NEAR_DUPLICATE_DATABASE_URL,
+                       max_entries=config.NEAR_DUPLICATE_MAX_ENTRIES,
+                       threshold=config.NEAR_DUPLICATE_THRESHOLD) if config.NEAR_DUPLICATE_ENABLED else None
+
+# Callbacks of every pipeline run
+pipeline_callbacks = [stage_metrics] + ([NoteIndexRecorder(note_index)] if note_index is not None else [])
 
 # Initialize Groq API
-llm = ChatGroq(api_key=GROQ_API_KEY,
-               model="llama-3.3-70b-versatile",
-               temperature=0.2,
-               max_retries=2)
+def build_llm():
+    """Groq chat client, imported and built once per worker by the lifespan"""
+    from langchain_groq import ChatGroq
 
+    return ChatGroq(api_key=GROQ_API_KEY,
+                    model="llama-3.3-70b-versatile",
+                    temperature=0.2,
+                    max_retries=2,
+                    cache=llm_cache,
+                    rate_limiter=llm_rate_limiter,
+                    callbacks=[RateLimitUsageCallback(llm_rate_limiter)] if llm_rate_limiter else None)
 
-# Initialize FastAPI
-app = FastAPI()
+# The chains below are composed around this placeholder at import time
+llm = LazyRunnable(build_llm, name="ChatGroq")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Endpoints are registered on a router and mounted by create_app()
+router = APIRouter()
 
 
 # Define prompts
@@ -48,15 +104,20 @@ prompt_template = ChatPromptTemplate.from_messages(
     ]
 )
 
+# Income and expenses are extracted as JSON and validated against the Income/Expense models
+income_parser = PydanticOutputParser(pydantic_object=IncomeExtraction)
+expenses_parser = PydanticOutputParser(pydantic_object=ExpenseExtraction)
+
 income_prompt = ChatPromptTemplate.from_template(
     
-    "Extract the income details from the following input: {user_input}"
-)
+    "Extract the income details from the following input: {user_input}\n\n{format_instructions}"
+).partial(format_instructions=income_parser.get_format_instructions())
 
 expenses_prompt = ChatPromptTemplate.from_template(
     
     "List the different expense categories and their estimated amounts from this input: {user_input}"
-)
+    "\n\n{format_instructions}"
+).partial(format_instructions=expenses_parser.get_format_instructions())
 concerns_prompt = ChatPromptTemplate.from_template(
     
     "Identify the financial concerns mentioned in this input: {user_input}"
@@ -75,117 +136,158 @@ def analyze_concerns(user_input):
     "Analyze user concerns"
     return concerns_prompt.format_prompt(user_input=user_input)
 
-def financial_advice(concerns):
-    """Generates financial advice based on concerns"""
-    advice_prompt = f"Provide financial advice based on these concerns:\n {concerns}"
-    return llm.invoke(advice_prompt).content
+def parse_income_output(text):
+    "Typed incomes from the model's JSON, falling back to the line parser"
+    try:
+        return income_parser.parse(text).incomes
+    except OutputParserException:
+        return parse_incomes(text)
 
-def budget_summary(income, expenses):
-    """Generates structured budget summary"""
-    summary_prompt = f"Create a structured budget with Income:\n {income}\n **Expenses:**\n {expenses}."
-    return llm.invoke(summary_prompt).content
+def parse_expenses_output(text):
+    "Typed expenses from the model's JSON, falling back to the line parser"
+    try:
+        return expenses_parser.parse(text).expenses
+    except OutputParserException:
+        return parse_expenses(text)
 
-def format_output(user_input):
-    format_prompt = ("Format this input to be injected into a webpage"
+def chunk_note(x):
+    "Split long notes into chunks (short notes stay whole) for the map stages"
+    return [{'user_input': chunk} for chunk in
+            split_note(x['user_input'], config.LONG_NOTE_CHUNK_CHARS, config.LONG_NOTE_MAX_CHUNKS)]
+
+def known_branches(x):
+    "Branches known without the LLM: reused from a near-duplicate note or parsed locally, else None"
+    known = note_index.lookup(x['user_input']) if note_index is not None else None
+    known = known or {}
+    if config.FAST_PATH_ENABLED and not ("income" in known and "expenses" in known):
+        extracted = extract_budget(x['user_input'])
+        fast_path_results.inc(result="hit" if extracted else "miss")
+        known.update(extracted or {})
+    return known or None
+
+def join_chunk_outputs(texts):
+    "Concerns found in each chunk, as one text"
+    return texts[0] if len(texts) == 1 else "\n\n".join(texts)
+
+def advice_prompt(concerns):
+    "Prompt for financial advice based on concerns"
+    return f"Provide financial advice based on these concerns:\n {concerns}"
+
+def summary_prompt(branches):
+    "Prompt for a structured budget from the income and expenses branches"
+    return (f"Create a structured budget with Income:\n {format_line_items(branches['income'])}\n"
+            f" **Expenses:**\n {format_line_items(branches['expenses'])}.")
+
+def format_prompt(user_input):
+    "Prompt to format text for a webpage"
+    return ("Format this input to be injected into a webpage"
     "do not include any additional response but just the formatted input: "
     f"{user_input}")
-    return llm.invoke(format_prompt).content
+
+# JSON mode for the structured extraction branches
+json_llm = llm.bind(response_format={"type": "json_object"})
 
 # Runnable chains for income, expenses and concerns 
 income_branch_chain = (
-    RunnableLambda(lambda x: analyze_income(x)) | llm | StrOutputParser()
+    RunnableLambda(lambda x: analyze_income(x)) | json_llm | StrOutputParser() | RunnableLambda(parse_income_output)
 )
 
 expenses_branch_chain = (
-    RunnableLambda(lambda x: analyze_expenses(x)) | llm | StrOutputParser()
+    RunnableLambda(lambda x: analyze_expenses(x)) | json_llm | StrOutputParser() | RunnableLambda(parse_expenses_output)
 )
 
 concerns_branch_chain = (
     RunnableLambda(lambda x: analyze_concerns(x)) | llm | StrOutputParser()
 )
 
+# Runnable chains for advice, summary and formatting (these support astream)
+advice_chain = RunnableLambda(advice_prompt) | llm | StrOutputParser()
+summary_chain = RunnableLambda(summary_prompt) | llm | StrOutputParser()
+format_chain = RunnableLambda(format_prompt) | llm | StrOutputParser()
 
-# Combined parallel chain
-chain = (
-    prompt_template
-    | llm
-    | StrOutputParser()
-    | RunnableParallel(branches={
-        "income": income_branch_chain, 
-        "expenses": expenses_branch_chain,
-        "concerns": concerns_branch_chain
-        
 
-    })
-    | RunnableLambda(lambda x: {"advice": financial_advice(x["branches"]["concerns"]), **x})
-    | RunnableLambda(lambda x: {"summary": budget_summary(x["branches"]["income"], x["branches"]["expenses"]), **x})
-    | RunnableLambda(lambda x: {"formatted_advice": format_output(x["advice"]), **x})
-    | RunnableLambda(lambda x: {"formatted_summary": format_output(x["summary"]), **x})
+insight_chain = prompt_template | llm | StrOutputParser()
+
+# Pipeline stages; each stage runs as soon as the stages it depends on are done.
+# Long notes are mapped chunk by chunk (insight, income, expenses and concerns run
+# concurrently for every chunk) and merged into one list of line items
+# before advice and summary, so latency follows the chunk size, not the note size.
+# Branches the fast path knows (a near-duplicate note's, or parsed locally) skip
+# their LLM calls, and the insight call too when nothing else needs it; advice and
+# summary prompts that did not change are then answered by the LLM cache.
+chain = Pipeline([
+    Stage("fast_path", RunnableLambda(known_branches), internal=True),
+    Stage("insight", RunnableLambda(chunk_note) | insight_chain.map(), internal=True),
+    Stage("income", income_branch_chain.map() | RunnableLambda(merge_line_items),
+          deps=["fast_path", "insight"], group="branches",
+          shortcut=("fast_path", lambda known: known.get("income") if known else None)),
+    Stage("expenses", expenses_branch_chain.map() | RunnableLambda(merge_line_items),
+          deps=["fast_path", "insight"], group="branches",
+          shortcut=("fast_path", lambda known: known.get("expenses") if known else None)),
+    Stage("concerns", concerns_branch_chain.map() | RunnableLambda(join_chunk_outputs),
+          deps=["fast_path", "insight"], group="branches",
+          shortcut=("fast_path", lambda known: known.get("concerns") if known else None)),
+    Stage("advice", advice_chain, deps=["concerns"]),
+    Stage("summary", summary_chain, deps=["income", "expenses"]),
+    Stage("formatted_advice", format_chain, deps=["advice"]),
+    Stage("formatted_summary", format_chain, deps=["summary"]),
+])
+
+# Outputs each endpoint needs; only the stages behind them are run
+STREAMED_STAGES = ("income", "expenses", "concerns", "advice", "summary")
+anonymous_advice_pipeline = chain.select("formatted_advice", "formatted_summary")
+
+# Concurrent requests for the same note share one in-flight pipeline run
+pipeline_flight = SingleFlight()
+
+def coalesced(pipeline, name):
+    return CoalescedRunnable(pipeline.with_config(callbacks=pipeline_callbacks), pipeline_flight, name=name,
+                             key=lambda x: normalize_text(x['user_input']))
+
+anonymous_advice_chain = coalesced(anonymous_advice_pipeline, "anonymous_advice")
+budget_branches_chain = coalesced(chain.select("income", "expenses"), "budget_branches")
+user_advice_chain = coalesced(chain.select("income", "expenses", "advice", "summary"), "user_advice")
 
-)
 #Function to convert income and expenses details into spreedsheets
-def generate_budget_spreadsheet(income: str, expenses: str):
-    """Generates an Excel spreadsheet from extracted budget details."""
-    
-    # Extract Income Details
-    income_lines = income.split("\n")[1:]  # Skip the header line
-    income_data = [line.split(": ") for line in income_lines if ": " in line]
-    
-    # Extract Expense Details
-    expenses_lines = expenses.split("\n")[1:]  # Skip the header line
-    expenses_data = [line.split(": ") for line in expenses_lines if ": " in line]
+def generate_budget_spreadsheet(incomes: list[Income], expenses: list[Expense]) -> str:
+    """
+    Generates an Excel spreadsheet from extracted budget details (on the CPU
+    pool) and returns the path of the file; stream it with iter_export_file,
+    which deletes it once read.
+    """
+    with timed("spreadsheet"):
+        return cpu_pool.run(write_budget_export, list(incomes), list(expenses), "xlsx")
 
-    # Create DataFrames
-    df_income = pd.DataFrame(income_data, columns=["Source", "Amount"])
-    df_expenses = pd.DataFrame(expenses_data, columns=["Category", "Amount"])
-    
-    # Convert Amounts to Numeric Values (Handle Ranges)
-    
-    def clean_amount(value):
-        value = value.replace(",", "").strip()  # Remove commas and trim spaces
-        # Extract all numeric values using regex
-        numbers = re.findall(r'\d+', value)  # Finds all numbers in the string
-        if not numbers:
-            return 0  # Default to 0 if no numbers are found
-        
-        # Convert extracted numbers to integers
-        numbers = list(map(int, numbers))
-        if len(numbers) == 1:
-            return numbers[0]  # Single value, return as-is
-        if len(numbers) > 1:
-            return sum(numbers) // len(numbers)  # If range or multiple values, return average
-        return 0  # Fallback in case of unexpected input
-
-    df_income["Amount"] = df_income["Amount"].apply(clean_amount)
-    df_expenses["Amount"] = df_expenses["Amount"].apply(clean_amount)
-    
-    # Calculate Summary
-    total_income = df_income["Amount"].sum()
-    total_expenses = df_expenses["Amount"].sum()
-    savings = total_income - total_expenses
-    
-    # Create Excel File
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df_income.to_excel(writer, sheet_name="Income", index=False)
-        df_expenses.to_excel(writer, sheet_name="Expenses", index=False)
-        
-        # Summary Sheet
-        wb = writer.book
-        ws = wb.create_sheet(title="Summary")
-        ws.append(["Total Income", total_income])
-        ws.append(["Total Expenses", total_expenses])
-        ws.append(["Savings", savings])
-    
-    output.seek(0)  # Move to start for streaming
-    
-    return output  # Return file-like object
+
+def budget_export_chunks(incomes, expenses, export_format: str):
+    """
+    Chunks of a budget export. xlsx and parquet are written to a temporary
+    file on the CPU pool and streamed from it (this call waits for the file,
+    run it off the event loop); csv is streamed as it is written.
+    """
+    if export_format in BUFFERED_FORMATS:
+        with timed("spreadsheet"):
+            path = cpu_pool.run(write_budget_export, list(incomes), list(expenses), export_format)
+        return iter_export_file(path)
+    return timed_iter("spreadsheet", iter_budget_export(incomes, expenses, export_format))
+
+
+async def budget_export_response(incomes, expenses, format: str | None, accept: str | None):
+    """Stream a budget export in the format picked from ?format= or the Accept header"""
+    try:
+        export_format = negotiate_export_format(format, accept)
+        chunks = await run_in_threadpool(budget_export_chunks, incomes, expenses, export_format)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    #for fastapi direct response link
+    return StreamingResponse(chunks, media_type=export_media_type(export_format),
+                             headers=export_headers(export_format))
 
 
-@app.post("/advice")
-def get_anonymous_advice(request:JournalNote):
+@router.post("/advice")
+async def get_anonymous_advice(request:JournalNote):
     #Provide advice for random users 
-    result= chain.invoke({'user_input':request.message})
+    result= await anonymous_advice_chain.ainvoke({'user_input':request.message})
     advice= result["formatted_advice"]
     summary= result["formatted_summary"]
     
@@ -195,179 +297,839 @@ def get_anonymous_advice(request:JournalNote):
                 
     })
     
-@app.post("/download-budget")
-def get_anonymous_budget(request:JournalNote):
-    #Provide advice for random users 
-    result= chain.invoke({'user_input':request.message})
+def sse_event(event: str, data) -> str:
+    "Encode one Server-Sent Event"
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.post("/advice/stream")
+async def stream_anonymous_advice(request:JournalNote):
+    #Stream stage progress and advice/summary tokens as Server-Sent Events
+    async def event_stream():
+        try:
+            async for event in anonymous_advice_pipeline.astream_stages(
+                    {'user_input':request.message}, config={"callbacks": pipeline_callbacks},
+                    stream=("advice", "summary")):
+                if event["event"] == "end":
+                    yield sse_event("result", {
+                        "Financial Advice": event["data"]["formatted_advice"],
+                        "Budget Summary": event["data"]["formatted_summary"],
+                    })
+                elif event["stage"] not in STREAMED_STAGES:
+                    continue
+                elif event["event"] == "stage_start":
+                    yield sse_event("stage-start", {"stage": event["stage"]})
+                elif event["event"] == "token":
+                    yield sse_event("token", {"stage": event["stage"], "text": event["data"]})
+                else:
+                    yield sse_event("stage-complete", {"stage": event["stage"], "output": event["data"]})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/download-budget")
+async def get_anonymous_budget(request:JournalNote, format: str | None = None,
+                               accept: str | None = Header(None)):
+    #Extract only the income and expenses needed for the spreadsheet
+    result= await budget_branches_chain.ainvoke({'user_input':request.message})
             
-    #Generate Excel file 
-    excel_file=generate_budget_spreadsheet(income=result["branches"]["income"],
-                                                  expenses=result["branches"]["expenses"])
-    #for fastapi direct response link
-    return StreamingResponse(excel_file, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=budget.xlsx"})
+    #Stream the export (xlsx, csv or parquet); xlsx and parquet are built on the CPU pool
+    return await budget_export_response(result["branches"]["income"], result["branches"]["expenses"],
+                                        format, accept)
     
     
-def get_user(password:str,username:str):
-    db= SessionLocal()
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not bcrypt.checkpw(password.encode("utf-8"), user.hashed_password.encode("utf-8")):
+async def get_user(db: Session, password:str,username:str):
+    #DB lookup on the threadpool, bcrypt on its dedicated executor
+    user = await run_in_threadpool(lambda: db.query(User).filter(User.username == username).first())
+    if not user or not await acheck_password(password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     return {"user_id":user.id,"username":user.username}
 
+
+def token_claims(token: str | None = Depends(oauth2_scheme)) -> dict | None:
+    """Claims of the bearer session token, None when the request has no token"""
+    if token is None:
+        return None
+    try:
+        return verify_token(token)
+    except InvalidToken as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+def resolve_user_id(claims: dict | None, user_id):
+    """User id from the session token; an explicit user_id must be the token's own"""
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Not authenticated",
+                            headers={"WWW-Authenticate": "Bearer"})
+    if user_id is not None and str(user_id) != str(claims["sub"]):
+        raise HTTPException(status_code=403, detail="Token belongs to another user")
+    return claims["sub"]
+
     
 
 
+def line_items_for(incomes: list[Income] | None, expenses: list[Expense] | None) -> list[BudgetLineItem]:
+    """Normalized line item rows for a journal's extracted incomes and expenses"""
+    rows = [BudgetLineItem(kind="income", label=i.source, amount=i.amount, period=i.period)
+            for i in incomes or []]
+    rows += [BudgetLineItem(kind="expense", label=e.category, amount=e.amount, period=e.period)
+             for e in expenses or []]
+    for position, row in enumerate(rows):
+        row.position = position
+    return rows
+
+
 #function to store extracted income, expenses, message
 def store_advice_message(
+    db: Session,
     user_id: int, 
     journal_note: str, 
-    income: str| None,
-    expenses: str|None,
+    income: list[Income] | None,
+    expenses: list[Expense] | None,
     advice: str|None,
-    budget: str|None
+    budget: str|None,
+    job_id: str|None = None
     ):
-    db = SessionLocal()
     try:
         if not advice.strip():  # Ensure ai advice message is not empty
-            print("Warning: Attempted to store an empty Advice message.")
+            logger.warning("Attempted to store an empty Advice message")
             return  # Exit function without storing
         
         # Create and add new chat entry
         _entry = FinanceJournal(user_id=user_id, journal_note=journal_note, 
-                                ai_financial_advice=advice, ai_extracted_income=income,
-                                ai_extracted_expenses=expenses, ai_budget_summary=budget)
+                                ai_financial_advice=advice, ai_extracted_income=dump_line_items(income or []),
+                                ai_extracted_expenses=dump_line_items(expenses or []), ai_budget_summary=budget,
+                                line_items=line_items_for(income, expenses), created_at=utcnow(),
+                                job_id=job_id)
         db.add(_entry)
+        # Monthly rollups are updated in the same transaction
+        apply_rollups(db, user_id, _entry.created_at, income, expenses)
         db.commit()
         db.refresh(_entry)  # Ensure the object is fully committed
         
         return _entry.id
 
           
-    except Exception as e:
+    except Exception:
         db.rollback()  # Rollback transaction if there's an error
-        print(f"Error storing advice message: {e}")
-    
-    finally:
-        db.close()  # Ensure session is always closed.
+        logger.exception("Error storing advice message")
+        raise
         
 
-@app.post("/user-advice")
-def user_get_advice(request:UserJournalNote):
-    #get user details
-    _user = get_user(password=request.password, username=request.username)
-    #Provide user with advice base on the finiancial journal note
-    result= chain.invoke({'user_input':request.message})
+#function to store many advice results in one transaction
+def store_advice_messages(db: Session, entries: list[dict]) -> list[int | None]:
+    """Bulk version of store_advice_message; entries take the same keyword arguments"""
+    try:
+        _entries = []
+        for entry in entries:
+            if not (entry.get("advice") or "").strip():  # Skip empty ai advice messages
+                _entries.append(None)
+                continue
+            _entries.append(FinanceJournal(user_id=entry["user_id"], journal_note=entry["journal_note"],
+                                           ai_financial_advice=entry["advice"],
+                                           ai_extracted_income=dump_line_items(entry["income"] or []),
+                                           ai_extracted_expenses=dump_line_items(entry["expenses"] or []),
+                                           ai_budget_summary=entry["budget"],
+                                           line_items=line_items_for(entry["income"], entry["expenses"]),
+                                           created_at=utcnow(), job_id=entry.get("job_id")))
+        db.add_all([e for e in _entries if e is not None])
+        for entry, _entry in zip(entries, _entries):
+            if _entry is not None:
+                apply_rollups(db, entry["user_id"], _entry.created_at, entry["income"], entry["expenses"])
+        db.commit()
+        return [e.id if e is not None else None for e in _entries]
+
+    except Exception:
+        db.rollback()  # Rollback transaction if there's an error
+        logger.exception("Error storing %d advice messages", len(entries))
+        raise
+
+
+def rerun_advice_messages(db: Session, entries: list[dict]) -> list[int | None]:
+    """
+    Replace the results of stored journals analyzed again (entries carry
+    their journal_id); their rollups are swapped in the same transaction
+    """
+    try:
+        ids = []
+        for entry in entries:
+            journal = db.get(FinanceJournal, entry["journal_id"])
+            if journal is None or not (entry.get("advice") or "").strip():
+                ids.append(None)
+                continue
+            remove_rollups(db, journal)
+            journal.ai_financial_advice = entry["advice"]
+            journal.ai_extracted_income = dump_line_items(entry["income"] or [])
+            journal.ai_extracted_expenses = dump_line_items(entry["expenses"] or [])
+            journal.ai_budget_summary = entry["budget"]
+            journal.line_items = line_items_for(entry["income"], entry["expenses"])
+            apply_rollups(db, journal.user_id, journal.created_at, entry["income"], entry["expenses"])
+            ids.append(journal.id)
+        db.commit()
+        return ids
+
+    except Exception:
+        db.rollback()  # Rollback transaction if there's an error
+        logger.exception("Error re-running %d advice messages", len(entries))
+        raise
+
+
+def write_journals(entries: list[dict]) -> list[int | None]:
+    """
+    Store the journals queued by journal_writer in one transaction. If it
+    fails they are stored one by one, so a bad journal fails only its own
+    request (its result is the exception)
+    """
+    with SessionLocal() as db:
+        try:
+            return store_advice_messages(db, entries)
+        except Exception:
+            if len(entries) == 1:
+                raise
+        results = []
+        for entry in entries:
+            try:
+                results.append(store_advice_messages(db, [entry])[0])
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+# Write-behind queue for /user-advice: one commit (and fsync) for many requests
+journal_writer = WriteBehindQueue(write_journals, max_batch=config.JOURNAL_WRITER_MAX_BATCH,
+                                  max_delay=config.JOURNAL_WRITER_MAX_DELAY_MS / 1000,
+                                  max_queue=config.JOURNAL_WRITER_MAX_QUEUE, name="journal-writer")
+
+
+async def astore_advice_message(db: Session, **entry) -> int | None:
+    """Store a journal through journal_writer, or directly when it is off, full or shutting down; returns its id"""
+    try:
+        return await journal_writer.awrite(entry)
+    except (QueueFull, WriterClosed):
+        return await run_in_threadpool(store_advice_message, db, **entry)
+
+
+def load_journal_notes(db: Session, journal_ids: list[int]) -> dict:
+    """Map journal id to its (user_id, journal_note)"""
+    rows = db.query(FinanceJournal.id, FinanceJournal.user_id, FinanceJournal.journal_note).filter(
+        FinanceJournal.id.in_(journal_ids)).all()
+    return {row.id: (row.user_id, row.journal_note) for row in rows}
+
+
+def _batch_results(items: list[dict], outputs: list) -> list[dict]:
+    results = []
+    for index, (item, output) in enumerate(zip(items, outputs)):
+        entry = {"index": index, "journal_id": item.get("journal_id")}
+        if isinstance(output, Exception):
+            entry["error"] = str(output) or type(output).__name__
+        else:
+            entry["result"] = {
+                "income": [i.model_dump() for i in output["branches"]["income"]],
+                "expenses": [e.model_dump() for e in output["branches"]["expenses"]],
+                "advice": output["advice"],
+                "summary": output["summary"],
+            }
+        results.append(entry)
+    return results
+
+
+def _persist_batch(db: Session | None, items: list[dict], results: list[dict]) -> None:
+    if db is None:
+        with SessionLocal() as db:
+            return _persist_batch(db, items, results)
+    stored = [(item, result) for item, result in zip(items, results)
+              if "result" in result and item.get("user_id") is not None]
+    entries = [
+        {"user_id": item["user_id"], "journal_note": item["message"], "journal_id": item.get("journal_id"),
+         "income": [Income(**i) for i in result["result"]["income"]],
+         "expenses": [Expense(**e) for e in result["result"]["expenses"]],
+         "advice": result["result"]["advice"], "budget": result["result"]["summary"]}
+        for item, result in stored
+    ]
+    # Stored journals are updated in place, new notes are stored
+    rerun = [i for i, entry in enumerate(entries) if entry["journal_id"] is not None]
+    new = [i for i, entry in enumerate(entries) if entry["journal_id"] is None]
+    ids = [None] * len(entries)
+    for positions, write in ((rerun, rerun_advice_messages), (new, store_advice_messages)):
+        if positions:
+            for position, history_id in zip(positions, write(db, [entries[i] for i in positions])):
+                ids[position] = history_id
+    for (_, result), history_id in zip(stored, ids):
+        result["history_id"] = history_id
+
+
+def run_advice_batch(items: list[dict], max_concurrency: int | None = None, persist: bool = False,
+                     db: Session | None = None) -> list[dict]:
+    """
+    Run many journal notes through the advice pipeline.
+    items are dicts with "message" and optionally "user_id"/"journal_id".
+    Failures are reported per item instead of failing the whole batch.
+    """
+    outputs = user_advice_chain.batch(
+        [{'user_input': item["message"]} for item in items],
+        config={"max_concurrency": max_concurrency or config.ADVICE_BATCH_MAX_CONCURRENCY},
+        return_exceptions=True)
+    results = _batch_results(items, outputs)
+    if persist:
+        _persist_batch(db, items, results)
+    return results
+
+
+async def arun_advice_batch(items: list[dict], max_concurrency: int | None = None, persist: bool = False,
+                            db: Session | None = None) -> list[dict]:
+    """Async version of run_advice_batch"""
+    outputs = await user_advice_chain.abatch(
+        [{'user_input': item["message"]} for item in items],
+        config={"max_concurrency": max_concurrency or config.ADVICE_BATCH_MAX_CONCURRENCY},
+        return_exceptions=True)
+    results = _batch_results(items, outputs)
+    if persist:
+        await run_in_threadpool(_persist_batch, db, items, results)
+    return results
+
+
+@router.post("/advice/batch")
+async def get_batch_advice(request:BatchJournalNotes, db: Session = Depends(get_db),
+                           claims: dict | None = Depends(token_claims)):
+    #Analyze many notes or the user's stored journals in one call
+    user_id = int(resolve_user_id(claims, request.user_id))
+    items = [{"message": message, "user_id": user_id} for message in request.messages]
+    if request.journal_ids:
+        notes = await run_in_threadpool(load_journal_notes, db, request.journal_ids)
+        missing = [i for i in request.journal_ids if i not in notes or notes[i][0] != user_id]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Unknown journal ids: {missing}")
+        items += [{"message": notes[i][1], "user_id": notes[i][0], "journal_id": i}
+                  for i in request.journal_ids]
+    if not items:
+        raise HTTPException(status_code=400, detail="No messages or journal ids given")
+    if len(items) > config.ADVICE_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch is limited to {config.ADVICE_BATCH_MAX_SIZE} items")
+
+    results = await arun_advice_batch(items, max_concurrency=request.max_concurrency,
+                                      persist=request.persist, db=db)
+    return JSONResponse({"results": results,
+                         "failed": sum(1 for r in results if "error" in r)})
+
+
+async def authenticate_journal_user(request: UserJournalNote, db: Session, claims: dict | None) -> dict:
+    #get user details from the session token, or check the password (off the event loop)
+    if claims is not None:
+        return {"user_id": claims["sub"], "username": claims["username"]}
+    if request.username and request.password:
+        return await get_user(db, password=request.password, username=request.username)
+    raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+
+def advice_response(journal: FinanceJournal) -> dict:
+    return {
+        "Financial Advice": journal.ai_financial_advice,
+        "Budget Summary": journal.ai_budget_summary,
+        "Financial history Id": journal.id
+    }
+
+
+async def user_advice(db: Session, user_id, message: str, job_id: str | None = None) -> dict:
+    """Advice and budget summary for a user's journal note, stored as a finance journal"""
+    result= await user_advice_chain.ainvoke({'user_input':message})
     income=result["branches"]["income"] #income extracted from user finance journal
     expenses=result["branches"]["expenses"] #expenses extracted from user finance journal
     advice= result["advice"] # advice given
     summary= result["summary"] #budget summary
     
     #Save output results for downloadable excel spreadsheet 
-    _save = store_advice_message(user_id=_user['user_id'], journal_note=request.message,income=income,
-                                 expenses=expenses,advice=advice,budget=summary)
-    return JSONResponse({
+    _save = await astore_advice_message(db, user_id=user_id, journal_note=message, income=income,
+                                        expenses=expenses, advice=advice, budget=summary, job_id=job_id)
+    return {
         "Financial Advice": advice,
         "Budget Summary": summary,
         "Financial history Id":_save
-                
-    })
-    
+    }
+
+
+@router.post("/user-advice")
+async def user_get_advice(request:UserJournalNote, db: Session = Depends(get_db),
+                          claims: dict | None = Depends(token_claims)):
+    _user = await authenticate_journal_user(request, db, claims)
+    #Provide user with advice base on the finiancial journal note
+    return JSONResponse(await user_advice(db, _user['user_id'], request.message))
+
+
+#Background jobs: submit returns a job id at once, clients poll for the result
+def job_journal(db: Session, job_id: str) -> FinanceJournal | None:
+    return db.query(FinanceJournal).filter(FinanceJournal.job_id == job_id).first()
+
+
+async def user_advice_job(payload: dict, job: Job) -> JobResult:
+    #The journal carries the job id: an attempt retried after it was stored returns it
+    #instead of storing it (and its rollups) a second time
+    with SessionLocal() as db:
+        stored = await run_in_threadpool(job_journal, db, job.id)
+        if stored is None:
+            try:
+                return JobResult(data=await user_advice(db, job.user_id, payload["message"], job_id=job.id))
+            except IntegrityError:
+                # An earlier attempt, still being written, stored it first (job_id is unique)
+                stored = await run_in_threadpool(job_journal, db, job.id)
+                if stored is None:
+                    raise
+        return JobResult(data=advice_response(stored))
+
+
+async def download_budget_job(payload: dict, job: Job) -> JobResult:
+    result = await budget_branches_chain.ainvoke({'user_input': payload["message"]})
+    #Written straight to JOB_RESULTS_DIR by the CPU pool; the job row keeps the path until it expires
+    os.makedirs(config.JOB_RESULTS_DIR, exist_ok=True)
+    with timed("spreadsheet"):
+        path = await cpu_pool.arun(write_budget_export, list(result["branches"]["income"]),
+                                   list(result["branches"]["expenses"]), payload["format"],
+                                   config.JOB_RESULTS_DIR)
+    return JobResult(path=path, media_type=export_media_type(payload["format"]))
+
+
+def retry_when_busy(handler):
+    #Jobs rate limited or turned away by a saturated CPU pool retry after the wait they were given
+    async def run(payload: dict, job: Job) -> JobResult:
+        try:
+            return await handler(payload, job)
+        except (RateLimitExceeded, PoolSaturated) as e:
+            raise JobRetryLater(e.retry_after, str(e))
+    return run
+
+
+job_runner = JobRunner({"user_advice": retry_when_busy(user_advice_job),
+                        "download_budget": retry_when_busy(download_budget_job)},
+                       workers=config.JOB_WORKERS, max_attempts=config.JOB_MAX_ATTEMPTS,
+                       retry_backoff=config.JOB_RETRY_BACKOFF_SECONDS, timeout=config.JOB_TIMEOUT_SECONDS,
+                       max_queued=config.JOB_MAX_QUEUED, sweep_interval=config.JOB_SWEEP_INTERVAL_SECONDS,
+                       retention_seconds=config.JOB_RETENTION_SECONDS)
+
+
+def job_status(job: Job) -> dict:
+    status = {"job_id": job.id, "kind": job.kind, "status": job.status, "attempts": job.attempts,
+              "max_attempts": job.max_attempts, "error": job.error,
+              "created_at": job.created_at.isoformat() if job.created_at else None,
+              "started_at": job.started_at.isoformat() if job.started_at else None,
+              "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+              "status_url": f"/jobs/{job.id}"}
+    if job.status == SUCCEEDED:
+        status["result_url"] = f"/jobs/{job.id}/result"
+    return status
+
+
+async def submit_job(kind: str, payload: dict, user_id=None) -> JSONResponse:
+    if not job_runner.started:
+        raise HTTPException(status_code=503, detail="Background jobs are disabled")
+    try:
+        job = await job_runner.submit(kind, payload, user_id=user_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return JSONResponse(job_status(job), status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+
+def load_job(db: Session, job_id: str, claims: dict | None) -> Job:
+    """
+    The job; a user's job needs that user's session token, anonymous jobs
+    (budget downloads) are read with their unguessable id
+    """
+    job = db.get(Job, job_id)
+    if job is not None and job.user_id is not None:
+        if claims is None:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        if str(job.user_id) != str(claims["sub"]):
+            job = None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs/user-advice", status_code=202)
+async def submit_user_advice_job(request:UserJournalNote, db: Session = Depends(get_db),
+                                 claims: dict | None = Depends(token_claims)):
+    #Same as /user-advice, run by the job workers
+    _user = await authenticate_journal_user(request, db, claims)
+    return await submit_job("user_advice", {"message": request.message}, user_id=int(_user["user_id"]))
+
+
+@router.post("/jobs/download-budget", status_code=202)
+async def submit_download_budget_job(request:JournalNote, format: str | None = None,
+                                     accept: str | None = Header(None)):
+    #Same as /download-budget, run by the job workers
+    try:
+        export_format = negotiate_export_format(format, accept)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    return await submit_job("download_budget", {"message": request.message, "format": export_format})
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_db), claims: dict | None = Depends(token_claims)):
+    #Poll a job's status
+    return job_status(load_job(db, job_id, claims))
+
+
+@router.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, db: Session = Depends(get_db), claims: dict | None = Depends(token_claims)):
+    #Finished JSON result, or the exported file
+    job = load_job(db, job_id, claims)
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    export_format = json.loads(job.payload).get("format", "xlsx")
+    if job.result_path is not None:
+        if not os.path.exists(job.result_path):
+            raise HTTPException(status_code=410, detail="Job result is no longer available")
+        return FileResponse(job.result_path, media_type=job.result_media_type,
+                            headers=export_headers(export_format))
+    if job.result_file is not None:
+        return Response(job.result_file, media_type=job.result_media_type,
+                        headers=export_headers(export_format))
+    return JSONResponse(json.loads(job.result))
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, db: Session = Depends(get_db), claims: dict | None = Depends(token_claims)):
+    #Cancel a queued or running job
+    job = await run_in_threadpool(load_job, db, job_id, claims)
+    if not await job_runner.cancel(job.id):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    db.expire(job)
+    return job_status(await run_in_threadpool(load_job, db, job_id, claims))
+
 
 #Retrieve previous conversation
-def retrieve_advice_income_expenses(user_id: int, journal_id: str):
-    db = SessionLocal()
+def retrieve_advice_income_expenses(db: Session, user_id: int, journal_id: str):
+    # Check if the user has previous advice
+    query = db.query(FinanceJournal).filter(
+        FinanceJournal.user_id == user_id,
+        FinanceJournal.id == journal_id
+    ).first()
+
+    # Return empty response if no messages found
+    if not query:
+        return {"response": ""}
+
+    items = db.query(BudgetLineItem).filter(
+        BudgetLineItem.journal_id == query.id).order_by(BudgetLineItem.position).all()
+    if not items:
+        # Rows stored before line items existed are parsed once and backfilled
+        query.line_items = line_items_for(load_incomes(query.ai_extracted_income),
+                                          load_expenses(query.ai_extracted_expenses))
+        db.commit()
+        items = query.line_items
+
+    return {
+        "income":[Income(source=i.label, amount=i.amount, period=i.period) for i in items if i.kind == "income"],
+        "expenses":[Expense(category=i.label, amount=i.amount, period=i.period) for i in items if i.kind == "expense"]
+    }
+
+
+# Rendered exports of stored journals, keyed by (journal id, user id, format)
+export_cache = ExportCache(max_bytes=config.EXPORT_CACHE_MAX_BYTES,
+                           max_entry_bytes=config.EXPORT_CACHE_MAX_ENTRY_BYTES)
+
+@event.listens_for(FinanceJournal, "after_update")
+@event.listens_for(FinanceJournal, "after_delete")
+def _invalidate_journal_exports(mapper, connection, target):
+    export_cache.invalidate(target.id)
+
+@event.listens_for(BudgetLineItem, "after_insert")
+@event.listens_for(BudgetLineItem, "after_update")
+@event.listens_for(BudgetLineItem, "after_delete")
+def _invalidate_line_item_exports(mapper, connection, target):
+    export_cache.invalidate(target.journal_id)
+
+
+@router.post("/create-budget-with-advice")
+def create_user_budget_with_advice(request:RetrieveJournalNote, format: str | None = None,
+                                   accept: str | None = Header(None), db: Session = Depends(get_db),
+                                   claims: dict | None = Depends(token_claims)):
+    user_id = resolve_user_id(claims, request.user_id)
     try:
-        # Check if the user has previous advice
-        query = db.query(FinanceJournal).filter(
-            FinanceJournal.user_id == user_id,
-            FinanceJournal.id == journal_id
-        ).first()
-
-        # Return empty response if no messages found
-        if not query:
-            return {"response": ""}
-
-        # Format and return history
-        return {
-            "income":query.ai_extracted_income,
-            "expenses":query.ai_extracted_expenses
-        }
-    
-    finally:
-        db.close()  # Ensure the session is closed    
+        export_format = negotiate_export_format(format, accept)
+        journal_id = int(request.journal_id)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Finance journal not found")
+    headers = export_headers(export_format)
+
+    #Serve repeat downloads straight from the export cache
+    cache_key = (journal_id, str(user_id), export_format)
+    cached = export_cache.get(cache_key)
+    if cached is not None:
+        return Response(cached, media_type=export_media_type(export_format), headers=headers)
 
-@app.post("/create-budget-with-advice")
-def create_user_budget_with_advice(request:RetrieveJournalNote):
     #Get user income and expenses from Financial advice
-    details= retrieve_advice_income_expenses(user_id=request.user_id,journal_id=request.journal_id)
+    details= retrieve_advice_income_expenses(db, user_id=user_id,journal_id=journal_id)
+    if "income" not in details:
+        raise HTTPException(status_code=404, detail="Finance journal not found")
     
-    #Generate Excel file 
-    excel_file=generate_budget_spreadsheet(
-        income=details["income"],
-        expenses=details["expenses"]
-        )
-    #for fastapi direct response link
-    return StreamingResponse(excel_file, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=budget.xlsx"})
+    #Stream the export (xlsx, csv or parquet) and cache it once complete
+    try:
+        chunks = budget_export_chunks(details["income"], details["expenses"], export_format)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    return StreamingResponse(export_cache.tee(cache_key, chunks),
+                             media_type=export_media_type(export_format), headers=headers)
     
     
-@app.post("/get-all-finance-record/advice")
-def retrieve_user_financial_record(user_id):
-    #Get all user income financial journal
-    db = SessionLocal()
-    try:
-        # Check if the user has previous advice
-        query = db.query(FinanceJournal).filter(
-            FinanceJournal.user_id == user_id,
-        ).all()
+HISTORY_FIELDS = ("id", "user_id", "journal_note", "ai_extracted_income", "ai_extracted_expenses",
+                  "ai_financial_advice", "ai_budget_summary")
 
-        # Return empty response if no messages found
-        if not query:
-            return {"response": ""}
+def history_columns(fields: str | None):
+    """Columns selected by a comma separated ?fields= list (id is always included)"""
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(HISTORY_FIELDS)
+    unknown = [name for name in names if name not in HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {unknown}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return [getattr(FinanceJournal, name) for name in names]
 
-        # Format and return history
-        
-        return query
-        
-    
-    finally:
-        db.close()  # Ensure the session is closed
+def history_query(db: Session, user_id, columns, after_id: int | None):
+    """Keyset query over the (user_id, id) index, oldest first"""
+    query = db.query(*columns).filter(FinanceJournal.user_id == user_id)
+    if after_id is not None:
+        query = query.filter(FinanceJournal.id > after_id)
+    return query.order_by(FinanceJournal.id)
+
+@router.post("/get-all-finance-record/advice")
+def retrieve_user_financial_record(user_id: str | None = None, after_id: int | None = None,
+                                   limit: int | None = Query(None, ge=1, le=config.HISTORY_MAX_PAGE_SIZE),
+                                   fields: str | None = None, format: str | None = None,
+                                   db: Session = Depends(get_db),
+                                   claims: dict | None = Depends(token_claims)):
+    #Get the user's financial journals one page at a time (pass X-Next-Cursor back as after_id)
+    user_id = resolve_user_id(claims, user_id)
+    columns = history_columns(fields)
+
+    if format == "ndjson":
+        #Stream every journal after the cursor, fetched in batches
+        def rows():
+            with SessionLocal() as stream_db:
+                query = history_query(stream_db, user_id, columns, after_id)
+                if limit is not None:
+                    query = query.limit(limit)
+                for row in query.execution_options(yield_per=config.HISTORY_YIELD_PER):
+                    yield json.dumps(row._asdict()) + "\n"
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    page_size = limit or config.HISTORY_PAGE_SIZE
+    page = history_query(db, user_id, columns, after_id).limit(page_size + 1).all()
+
+    # Return empty response if no messages found
+    if not page and after_id is None:
+        return {"response": ""}
+
+    headers = {}
+    if len(page) > page_size:
+        page = page[:page_size]
+        headers["X-Next-Cursor"] = str(page[-1].id)
+    return JSONResponse([row._asdict() for row in page], headers=headers)
     
         
+@router.get("/finance-trends")
+def retrieve_finance_trends(user_id: str | None = None, kind: str | None = Query(None, pattern="^(income|expense)$"),
+                            category: str | None = None, start: str | None = None, end: str | None = None,
+                            db: Session = Depends(get_db), claims: dict | None = Depends(token_claims)):
+    #Monthly totals and per-category trends, read from the rollups (start/end are "YYYY-MM")
+    user_id = resolve_user_id(claims, user_id)
+    return user_trends(db, user_id, kind=kind, category=category, start=start, end=end)
+
+
 #Function to create new user
-@app.post("/register")
-def register_user(request:CreateUser):
-    db = SessionLocal()
-    hash_password = bcrypt.hashpw(request.password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-    db_user = db.query(User).filter(User.username== request.username).first()
+@router.post("/register")
+async def register_user(request:CreateUser, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(lambda: db.query(User).filter(User.username== request.username).first())
     if db_user:
         raise HTTPException(status_code=400, detail="Username already exists")
+    hash_password = await ahash_password(request.password)
     new_user = User(username=request.username, hashed_password=hash_password, image=request.image,
                     first_name=request.first_name,last_name=request.last_name)
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    db.close()
+    def _save():
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+    await run_in_threadpool(_save)
     
     return {"message": "User registered successfully"}
 
 #function to authenticate user
-@app.post("/login")
-def login_user(form_data:OAuth2PasswordRequestForm =Depends()):
+@router.post("/login")
+async def login_user(form_data:OAuth2PasswordRequestForm =Depends(), db: Session = Depends(get_db)):
     #get user from database
-    db = SessionLocal()
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = await run_in_threadpool(lambda: db.query(User).filter(User.username == form_data.username).first())
     
-    if not user or not bcrypt.checkpw(form_data.password.encode("utf-8"), user.hashed_password.encode("utf-8")):
+    if not user or not await acheck_password(form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    #Signed session token, send it back as "Authorization: Bearer <token>"
+    session = issue_token(user.id, user.username)
     token_payload = {
         "username": user.username,
         "image": user.first_name,
-        "user_id": user.id
-        #"exp": datetime.datetime() + datetime.timedelta(hours=1)  # Token expires in 1 hour
+        "user_id": user.id,
+        "exp": session["claims"]["exp"]
     }
-    #jwt can be use to manage data validity here
     
-    return {"response": token_payload}
\ No newline at end of file
+    return {"response": token_payload, "access_token": session["token"], "token_type": "bearer"}
+
+#function to revoke the current session token
+@router.post("/logout")
+def logout_user(claims: dict | None = Depends(token_claims)):
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    revocations.revoke(claims)
+    return {"message": "Logged out"}
+
+
+@registry.collector
+def _component_metrics():
+    #Counters kept by the caches, the coalescer and the rate limiter
+    yield ("pipeline_coalescing_total", "counter", "Pipeline runs executed or coalesced.",
+           [({"result": key}, value) for key, value in pipeline_flight.stats().items() if key != "in_flight"])
+    export = export_cache.stats()
+    yield ("export_cache_requests_total", "counter", "Export cache lookups.",
+           [({"result": "hit"}, export["hits"]), ({"result": "miss"}, export["misses"])])
+    yield ("export_cache_bytes", "gauge", "Bytes held by the export cache.", [({}, export["bytes"])])
+    if llm_cache is not None:
+        yield ("llm_cache_requests_total", "counter", "LLM response cache lookups by tier.",
+               [({"result": key}, llm_cache.stats()[key]) for key in ("memory_hits", "disk_hits", "misses")])
+    if llm_rate_limiter is not None:
+        limits = llm_rate_limiter.stats()
+        yield ("llm_rate_limit_admissions_total", "counter", "LLM calls admitted, delayed or rejected.",
+               [({"result": key}, limits[key]) for key in ("admitted", "delayed", "rejected")])
+        yield ("llm_rate_limit_waiting", "gauge", "LLM calls waiting for rate limit capacity.",
+               [({}, limits["waiting"])])
+    if note_index is not None:
+        notes = note_index.stats()
+        yield ("near_duplicate_lookups_total", "counter", "Near-duplicate index lookups by result.",
+               [({"result": key}, notes[key]) for key in ("exact_hits", "near_hits", "rejected", "misses")])
+        yield ("near_duplicate_entries", "gauge", "Notes held by the near-duplicate index.",
+               [({}, notes["entries"])])
+    pool = cpu_pool.stats()
+    yield ("cpu_pool_tasks_total", "counter", "CPU pool tasks (bcrypt, exports) by result.",
+           [({"result": key}, pool[key]) for key in ("completed", "failed", "rejected")])
+    yield ("cpu_pool_queue_depth", "gauge", "CPU pool tasks waiting for a free worker process.",
+           [({}, pool["queued"])])
+    yield ("cpu_pool_running", "gauge", "CPU pool tasks running.", [({}, pool["running"])])
+    jobs = job_runner.stats()
+    yield ("jobs_total", "counter", "Background jobs by outcome.",
+           [({"result": key}, jobs[key]) for key in ("submitted", "succeeded", "failed", "retried", "cancelled")])
+    yield ("jobs_in_progress", "gauge", "Background jobs waiting or running in this worker.",
+           [({"state": "waiting"}, jobs["waiting"]), ({"state": "running"}, jobs["running"])])
+    writes = journal_writer.stats()
+    yield ("journal_writer_items_total", "counter", "Journals committed or failed by the write-behind queue.",
+           [({"result": key}, writes[key]) for key in ("written", "failed", "rejected")])
+    yield ("journal_writer_batches_total", "counter", "Transactions committed by the write-behind queue.",
+           [({}, writes["batches"])])
+    yield ("journal_writer_queue_depth", "gauge", "Journals waiting for the write-behind queue.",
+           [({}, writes["queued"])])
+
+@router.get("/metrics")
+def metrics():
+    #Prometheus text exposition of every metric above
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/coalescing/stats")
+def coalescing_stats():
+    #Pipeline runs executed and saved by request coalescing
+    return pipeline_flight.stats()
+
+
+@router.get("/export-cache/stats")
+def export_cache_stats():
+    #Hit/miss counters of the stored journal export cache
+    return export_cache.stats()
+
+
+@router.get("/journal-writer/stats")
+def journal_writer_stats():
+    #Batches, journals written and queue depth of the write-behind journal queue
+    return {"enabled": journal_writer.running, **journal_writer.stats()}
+
+
+@router.get("/rate-limit/stats")
+def rate_limit_stats():
+    #Admission counters and bucket levels of the Groq rate limiter
+    if llm_rate_limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_rate_limiter.stats()}
+
+
+@router.get("/llm-cache/stats")
+def llm_cache_stats():
+    #Hit/miss counters of the LLM response cache
+    if llm_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_cache.stats()}
+
+
+async def rate_limit_exceeded_handler(request, exc: RateLimitExceeded):
+    #Fail fast instead of queueing behind the Groq limits
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
+async def pool_saturated_handler(request, exc: PoolSaturated):
+    #Shed logins and exports while the CPU pool is full instead of queueing without bound
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #Open the database, the LLM cache and the Groq client once per worker
+    instrument_engine(init_db())
+    if not count_client_retries():
+        logger.info("Groq client retries are not counted: its logger drops INFO records (set GROQ_LOG=info)")
+    if llm_cache is not None:
+        llm_cache.setup()
+    llm.load()
+    if note_index is not None:
+        note_index.setup()
+    if config.JOURNAL_WRITER_ENABLED:
+        journal_writer.start()
+    if config.JOBS_ENABLED:
+        await job_runner.start()
+    await revocations.start()
+    # Last, so the worker processes' imports do not slow the steps above
+    cpu_pool.start()
+    yield
+    # Running jobs get a grace period; unfinished ones are queued for the next worker
+    await job_runner.stop(drain_seconds=config.JOB_DRAIN_SECONDS)
+    await revocations.stop()
+    # Commit the journals still queued before the database goes away
+    journal_writer.close(timeout=config.JOURNAL_WRITER_DRAIN_SECONDS)
+    if llm_cache is not None:
+        llm_cache.close()
+    if note_index is not None:
+        note_index.close()
+    cpu_pool.close()
+    dispose_db()
+
+
+def create_app() -> FastAPI:
+    """Build the API; nothing is opened or connected until the lifespan starts"""
+    application = FastAPI(lifespan=lifespan)
+    application.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+    application.add_exception_handler(PoolSaturated, pool_saturated_handler)
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allows all origins
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    application.add_middleware(TimingMiddleware, server_timing=config.SERVER_TIMING_ENABLED)
+    application.include_router(router)
+    application.include_router(budget_router)
+    return application
+
+
+# Initialize FastAPI (uvicorn app.main:app)
+app = create_app()
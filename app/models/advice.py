@@ -6,12 +6,26 @@ class Expense(BaseModel):
     category: str = Field(...,
                           description="Category of the expense (e.g., rent, groceries).")
     amount: float = Field(..., description="Expense amount.")
+    period: str = Field("monthly",
+                        description="How often the expense occurs (e.g., monthly, yearly, one-off).")
 
 
 class Income(BaseModel):
     source: str = Field(...,
                         description="Income source (e.g., salary, investments).")
     amount: float = Field(..., description="Income amount.")
+    period: str = Field("monthly",
+                        description="How often the income is received (e.g., monthly, yearly, one-off).")
+
+
+class IncomeExtraction(BaseModel):
+    incomes: List[Income] = Field(...,
+                                  description="Every income line item found in the input.")
+
+
+class ExpenseExtraction(BaseModel):
+    expenses: List[Expense] = Field(...,
+                                    description="Every expense line item found in the input.")
 
 
 class BudgetRequest(BaseModel):
@@ -36,3 +50,13 @@ class BudgetResponse(BaseModel):
         ..., description="Detailed breakdown of income and expenses.")
     message: str = Field(...,
                          description="Additional financial insights or advice.")
+
+
+class BulkBudgetRequest(BaseModel):
+    budgets: List[BudgetRequest] = Field(...,
+                                         description="Budget requests, computed together in one pass.")
+
+
+class BulkBudgetResponse(BaseModel):
+    budgets: List[BudgetResponse] = Field(...,
+                                          description="Budgets in the order of the requests.")
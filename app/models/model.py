@@ -1,15 +1,74 @@
 import os
+from datetime import datetime, timezone
 from pydantic import BaseModel
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy import create_engine,URL, Column, Integer, String, Text, ForeignKey, Date
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy import create_engine,URL, Column, Integer, String, Text, ForeignKey, Date, DateTime, Float, Index, LargeBinary
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship, Session
 from sqlalchemy.exc import SQLAlchemyError
+from app import config
 
 #Database setup
 #DATABASE_URL=URL.create("sqlite",host="localhost",database="chat_history.db")
-DATABASE_URL="sqlite:///financialjournal.db"
-engine = create_engine(DATABASE_URL,connect_args={"check_same_thread": False})
-SessionLocal=sessionmaker(bind=engine, autoflush=False,autocommit=False)
+DATABASE_URL=config.DATABASE_URL
+
+
+def create_db_engine(url: str):
+    """Engine tuned for concurrent request traffic (SQLite or a server database such as Postgres)"""
+    options = {"pool_size": config.DB_POOL_SIZE, "max_overflow": config.DB_MAX_OVERFLOW,
+               "pool_timeout": config.DB_POOL_TIMEOUT_SECONDS}
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_pre_ping=True, **options)
+
+    _engine = create_engine(url, connect_args={"check_same_thread": False,
+                                               "timeout": config.DB_BUSY_TIMEOUT_MS / 1000},
+                            **options)
+
+    @event.listens_for(_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the single writer, NORMAL sync is safe with WAL
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={config.DB_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+    return _engine
+
+
+# Created once per worker by init_db() (from the app lifespan), not at import
+engine = None
+SessionLocal=sessionmaker(autoflush=False,autocommit=False)
+
+
+def init_db(url: str | None = None):
+    """Create the engine, bind SessionLocal and bring the schema up to date; idempotent"""
+    global engine
+    if engine is None:
+        engine = create_db_engine(url or DATABASE_URL)
+        SessionLocal.configure(bind=engine)
+        upgrade_schema(engine)
+    return engine
+
+
+def dispose_db() -> None:
+    """Close every pooled connection, e.g. on shutdown"""
+    if engine is not None:
+        engine.dispose()
+
+
+def get_db():
+    """FastAPI dependency: one session per request, always closed"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp, as stored in DateTime columns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 
 #SQLAlchemy ORM model
 Base= declarative_base()
@@ -27,6 +86,8 @@ class User(Base):
 
 class FinanceJournal(Base):
     __tablename__ = "finance_journal" 
+    __table_args__ = (Index("ix_finance_journal_user_id_id", "user_id", "id"),
+                      Index("ix_finance_journal_job_id", "job_id", unique=True))
     
     id = Column(Integer,primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("user.id"))
@@ -35,17 +96,101 @@ class FinanceJournal(Base):
     ai_extracted_expenses= Column(String)
     ai_financial_advice= Column(String)
     ai_budget_summary= Column(String)
+    created_at= Column(DateTime, default=utcnow)  # NULL for journals stored before it existed
+    job_id= Column(String, nullable=True)  # background job that stored it, so retries do not store it twice
     
         
     user= relationship("User")
+    line_items= relationship("BudgetLineItem", order_by="BudgetLineItem.position",
+                             cascade="all, delete-orphan", back_populates="journal")
+
+
+class BudgetLineItem(Base):
+    """Parsed income/expense line item of a finance journal, stored at write time"""
+    __tablename__ = "budget_line_item"
+
+    id = Column(Integer, primary_key=True)
+    journal_id = Column(Integer, ForeignKey("finance_journal.id"), index=True, nullable=False)
+    kind = Column(String, nullable=False)  # "income" or "expense"
+    label = Column(String)
+    amount = Column(Float, nullable=False)
+    period = Column(String)
+    position = Column(Integer)
+
+    journal= relationship("FinanceJournal", back_populates="line_items")
 
   
         
-#Create Tables
-Base.metadata.create_all(bind=engine)
+class BudgetRollup(Base):
+    """
+    Per-user, per-month totals by category, updated incrementally as journals
+    are stored (see app.services.rollup_service)
+    """
+    __tablename__ = "budget_rollup"
+
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    period = Column(String, primary_key=True)  # "YYYY-MM", "undated" for journals without created_at
+    kind = Column(String, primary_key=True)  # "income" or "expense"
+    category = Column(String, primary_key=True)  # normalized line item label
+    total = Column(Float, nullable=False, default=0.0)  # monthly equivalent amount
+    item_count = Column(Integer, nullable=False, default=0)
+    journal_count = Column(Integer, nullable=False, default=0)
+
+
+class RevokedToken(Base):
+    """Session tokens revoked before their expiry (see app.utils.security)"""
+    __tablename__ = "revoked_token"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(Float, nullable=False, index=True)
+
+
+class Job(Base):
+    """Background advice/export job run by the job workers (see app.services.job_service)"""
+    __tablename__ = "job"
+    __table_args__ = (Index("ix_job_status_created_at", "status", "created_at"),)
+
+    id = Column(String, primary_key=True)  # random hex, also the capability to read the job
+    kind = Column(String, nullable=False)  # "user_advice" or "download_budget"
+    user_id = Column(Integer, ForeignKey("user.id"), index=True)  # NULL for anonymous jobs
+    status = Column(String, nullable=False)  # queued, running, succeeded, failed or cancelled
+    payload = Column(Text, nullable=False)  # JSON input of the job
+    result = Column(Text)  # JSON result
+    result_path = Column(String)  # exported workbook/csv/parquet, a file under JOB_RESULTS_DIR
+    result_file = Column(LargeBinary)  # exported file of jobs finished by earlier versions
+    result_media_type = Column(String)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=1)
+    run_after = Column(DateTime)  # not before this time (retry backoff)
+    created_at = Column(DateTime, default=utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+def upgrade_schema(bind):
+    """
+    Create missing tables, nullable columns and indexes.
+    Idempotent and portable (SQLite and Postgres), so it doubles as the
+    migration for databases created by earlier versions:
+    `DATABASE_URL=... python -m app.models.model`
+    """
+    Base.metadata.create_all(bind=bind)
+    existing = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            columns = {c["name"] for c in existing.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns and column.nullable:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
 
 #OAuth2 for authentication
-oauth2_scheme =OAuth2PasswordBearer(tokenUrl="Login")
+oauth2_scheme =OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 #pydantic models
 class CreateUser(BaseModel):
@@ -56,17 +201,28 @@ class CreateUser(BaseModel):
     image: str| None
 
 class UserJournalNote(BaseModel):
-    username: str
-    password: str
+    username: str | None = None  # not needed with a bearer token
+    password: str | None = None
     message: str
 
 
 class RetrieveJournalNote(BaseModel):
     journal_id: str
-    user_id: str 
+    user_id: str | None = None  # optional, must match the bearer token
     
         
 class JournalNote(BaseModel):
     message: str    
-    
- 
+
+
+class BatchJournalNotes(BaseModel):
+    messages: list[str] = []
+    journal_ids: list[int] = []
+    user_id: int | None = None  # optional, must match the bearer token
+    persist: bool = False
+    max_concurrency: int | None = None
+
+
+if __name__ == "__main__":
+    init_db()
+    print(f"Schema is up to date for {engine.url.render_as_string(hide_password=True)}")
@@ -1,5 +1,9 @@
 from fastapi import APIRouter, HTTPException, status
-from app.models.budget import BudgetRequest, BudgetResponse
+from fastapi.concurrency import run_in_threadpool
+
+from app import config
+from app.models.advice import BudgetRequest, BudgetResponse, BulkBudgetRequest, BulkBudgetResponse
+from app.services import budget_service
 
 router = APIRouter(prefix="/api/budget", tags=["Budget"])
 
@@ -10,24 +14,28 @@ async def generate_budget(budget_request: BudgetRequest):
     Generate a structured budget based on income and expenses.
     """
     try:
-        # Placeholder for calling the budgeting service
-        budget_response = {
-            "summary": {
-                "total_income": 5000.0,
-                "total_expenses": 3000.0,
-                "net_savings": 2000.0,
-                "savings_rate": 40.0
-            },
-            "details": {
-                "rent": 1200.0,
-                "groceries": 400.0,
-                "salary": 5000.0
-            },
-            "message": "You are saving 40% of your income. Good job!"
-        }
-        return BudgetResponse(**budget_response)
+        return budget_service.generate_budget(budget_request)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating budget: {str(e)}"
         )
+
+
+@router.post("/generate/bulk", response_model=BulkBudgetResponse)
+async def generate_budgets(bulk_request: BulkBudgetRequest):
+    """
+    Generate the budgets of many users in one vectorized pass.
+    """
+    if len(bulk_request.budgets) > config.BUDGET_BULK_MAX_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Bulk requests are limited to {config.BUDGET_BULK_MAX_SIZE} budgets")
+    try:
+        # Large batches take a few milliseconds of CPU; keep them off the event loop
+        budgets = await run_in_threadpool(budget_service.generate_budgets, bulk_request.budgets)
+        return BulkBudgetResponse(budgets=budgets)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error generating budgets: {str(e)}"
+        )
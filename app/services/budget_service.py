@@ -1,24 +1,106 @@
-from app.models.budget import BudgetRequest, BudgetResponse
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app.models.advice import BudgetRequest, BudgetResponse, BudgetSummary
+from app.utils.budget_parser import MONTHLY_FACTORS, normalize_label
+
+
+def _flatten(budget_requests: Sequence[BudgetRequest]):
+    """
+    Line items of every request as parallel arrays: owner (request index),
+    kind (0 income, 1 expense), category code and monthly amount, plus the
+    kind of each category code and, per (owner, code), the request's first
+    spelling of the label (used for display, in order of appearance).
+    """
+    owners, kinds, codes, amounts, factors = [], [], [], [], []
+    categories: Dict[tuple, int] = {}
+    seen: Dict[tuple, int] = {}  # exact (kind, label) -> code, skips normalizing repeats
+    code_kinds: List[int] = []
+    labels: Dict[tuple, str] = {}
+    for owner, request in enumerate(budget_requests):
+        items = ([(0, i.source, i.amount, i.period) for i in request.incomes]
+                 + [(1, e.category, e.amount, e.period) for e in request.expenses])
+        for kind, label, amount, period in items:
+            code = seen.get((kind, label))
+            if code is None:
+                key = (kind, normalize_label(label))
+                code = categories.get(key)
+                if code is None:
+                    code = categories[key] = len(code_kinds)
+                    code_kinds.append(kind)
+                seen[(kind, label)] = code
+            labels.setdefault((owner, code), label.strip())
+            owners.append(owner)
+            kinds.append(kind)
+            codes.append(code)
+            amounts.append(amount)
+            factors.append(MONTHLY_FACTORS.get(period, 1.0))
+    monthly = np.asarray(amounts, dtype=np.float64) * np.asarray(factors, dtype=np.float64)
+    return (np.asarray(owners, dtype=np.int64), np.asarray(kinds, dtype=np.int8),
+            np.asarray(codes, dtype=np.int64), monthly, code_kinds, labels)
+
+
+def _message(savings_rate: float, total_income: float) -> str:
+    if total_income <= 0:
+        return "Add your income sources to see how much of it you can save."
+    if savings_rate < 0:
+        return f"You are spending {-savings_rate:.0f}% more than you earn. Look for expenses to cut."
+    if savings_rate < 10:
+        return f"You are saving {savings_rate:.0f}% of your income. Aim for at least 10-20%."
+    if savings_rate < 20:
+        return f"You are saving {savings_rate:.0f}% of your income. Good start, 20% is a common target."
+    return f"You are saving {savings_rate:.0f}% of your income. Good job!"
+
+
+def generate_budgets(budget_requests: Sequence[BudgetRequest]) -> List[BudgetResponse]:
+    """
+    Compute the budgets of many requests in one pass over all their line items.
+    Amounts are converted to monthly figures (weekly x 52/12, yearly / 12);
+    details holds the monthly total of each income source and expense
+    category, keyed by its label.
+    """
+    n = len(budget_requests)
+    if n == 0:
+        return []
+    owners, kinds, codes, monthly, code_kinds, labels = _flatten(budget_requests)
+
+    is_expense = kinds == 1
+    total_income = np.bincount(owners, weights=np.where(is_expense, 0.0, monthly), minlength=n)
+    total_expenses = np.bincount(owners, weights=np.where(is_expense, monthly, 0.0), minlength=n)
+    net_savings = total_income - total_expenses
+    savings_rate = np.divide(net_savings * 100, total_income,
+                             out=np.zeros(n), where=total_income > 0)
+
+    # Per-category totals: one group per (request, category) pair
+    groups, inverse = np.unique(owners * max(len(code_kinds), 1) + codes, return_inverse=True)
+    group_totals = np.bincount(inverse, weights=monthly, minlength=len(groups))
+    group_owners, group_codes = np.divmod(groups, max(len(code_kinds), 1))
+    totals_by_group = dict(zip(zip(group_owners.tolist(), group_codes.tolist()),
+                               np.round(group_totals, 2).tolist()))
+
+    details: List[Dict[str, float]] = [{} for _ in range(n)]
+    for (owner, code), label in labels.items():  # each request's categories in order of appearance
+        kind, total = code_kinds[code], totals_by_group[(owner, code)]
+        breakdown = details[owner]
+        if label in breakdown:  # same label as an income and an expense
+            label = f"{label} ({'expense' if kind else 'income'})"
+        breakdown[label] = total
+
+    responses = []
+    for i, (income, expenses, net, rate) in enumerate(zip(
+            np.round(total_income, 2).tolist(), np.round(total_expenses, 2).tolist(),
+            np.round(net_savings, 2).tolist(), np.round(savings_rate, 2).tolist())):
+        responses.append(BudgetResponse(
+            summary=BudgetSummary(total_income=income, total_expenses=expenses,
+                                  net_savings=net, savings_rate=rate),
+            details=details[i],
+            message=_message(rate, income)))
+    return responses
 
 
 def generate_budget(budget_request: BudgetRequest) -> BudgetResponse:
     """
     Generate a structured budget from the given request.
-    Placeholder for the actual budget generation logic.
     """
-    # Placeholder response for now
-    budget_response = {
-        "summary": {
-            "total_income": 5000.0,
-            "total_expenses": 3000.0,
-            "net_savings": 2000.0,
-            "savings_rate": 40.0
-        },
-        "details": {
-            "rent": 1200.0,
-            "groceries": 400.0,
-            "salary": 5000.0
-        },
-        "message": "You are saving 40% of your income. Good job!"
-    }
-    return BudgetResponse(**budget_response)
+    return generate_budgets([budget_request])[0]
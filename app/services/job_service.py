@@ -0,0 +1,292 @@
+"""
+Background jobs: rows in the job table claimed by each worker's JobRunner,
+retried with backoff up to max_attempts and requeued after a crash or shutdown.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, update
+
+from app.models.model import Job, SessionLocal, utcnow
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobResult:
+    """What a job handler produced: JSON data, or the path of a file it wrote with its media type."""
+
+    def __init__(self, data: Any = None, path: Optional[str] = None, media_type: Optional[str] = None):
+        self.data = data
+        self.path = path
+        self.media_type = media_type
+
+
+def _remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.exception("Could not remove job result %s", path)
+
+
+class JobFailed(Exception):
+    """Raised by a handler for a failure that retrying cannot fix."""
+
+
+class JobQueueFull(Exception):
+    """Too many jobs are waiting in this worker."""
+
+
+class JobRetryLater(Exception):
+    """Raised by a handler to run again after `delay` seconds (e.g. rate limited); counts as an attempt."""
+
+    def __init__(self, delay: float, message: str = ""):
+        super().__init__(message or f"retry after {delay:.1f}s")
+        self.delay = delay
+
+
+JobHandler = Callable[[Dict[str, Any], Job], Awaitable[JobResult]]
+
+
+class JobRunner:
+    """
+    Pool of `workers` asyncio tasks running the jobs of this app worker.
+    handlers maps a job kind to a coroutine function (payload, job) -> JobResult.
+    """
+
+    def __init__(self, handlers: Dict[str, JobHandler], workers: int = 4, max_attempts: int = 3,
+                 retry_backoff: float = 2.0, timeout: float = 300.0, max_queued: int = 1000,
+                 sweep_interval: float = 15.0, retention_seconds: float = 24 * 3600):
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self.sweep_interval = sweep_interval
+        self.retention_seconds = retention_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._sweeper_task: Optional[asyncio.Task] = None
+        self._pending: Set[str] = set()  # queued or scheduled in this worker
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+        self._stopping = False
+        self._counters = {"submitted": 0, "succeeded": 0, "failed": 0, "retried": 0, "cancelled": 0}
+
+    @property
+    def started(self) -> bool:
+        return self._queue is not None and not self._stopping
+
+    # Database operations (sync, called through run_in_threadpool)
+
+    def _create(self, kind: str, payload: Dict[str, Any], user_id: Optional[int]) -> Job:
+        with SessionLocal() as db:
+            job = Job(id=secrets.token_hex(16), kind=kind, user_id=user_id, status=QUEUED,
+                      payload=json.dumps(payload), attempts=0, max_attempts=self.max_attempts,
+                      created_at=utcnow())
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+            return job
+
+    def _transition(self, job_id: str, from_status: str, **values) -> bool:
+        """Compare-and-set: update the job only if it still has from_status."""
+        with SessionLocal() as db:
+            changed = db.execute(update(Job).where(Job.id == job_id, Job.status == from_status)
+                                 .values(**values)).rowcount
+            db.commit()
+            return changed == 1
+
+    def _claim(self, job_id: str) -> Optional[Job]:
+        with SessionLocal() as db:
+            changed = db.execute(
+                update(Job).where(Job.id == job_id, Job.status == QUEUED,
+                                  or_(Job.run_after.is_(None), Job.run_after <= utcnow()))
+                .values(status=RUNNING, attempts=Job.attempts + 1, started_at=utcnow(), error=None)).rowcount
+            db.commit()
+            if changed != 1:
+                return None
+            job = db.get(Job, job_id)
+            db.expunge(job)
+            return job
+
+    def _sweep(self) -> List[str]:
+        """Requeue jobs of dead workers, drop expired jobs; returns queued jobs ready to run."""
+        now = utcnow()
+        with SessionLocal() as db:
+            # A job still running well past the timeout lost its worker
+            stale = now - timedelta(seconds=self.timeout + self.sweep_interval)
+            db.execute(update(Job).where(Job.status == RUNNING, Job.started_at < stale,
+                                         Job.attempts < Job.max_attempts)
+                       .values(status=QUEUED, error="worker stopped"))
+            db.execute(update(Job).where(Job.status == RUNNING, Job.started_at < stale)
+                       .values(status=FAILED, error="worker stopped", finished_at=now))
+            expired = db.query(Job).filter(Job.status.in_(FINISHED),
+                                           Job.finished_at < now - timedelta(seconds=self.retention_seconds))
+            files = [row.result_path for row in expired.with_entities(Job.result_path)
+                     if row.result_path is not None]
+            expired.delete(synchronize_session=False)
+            ready = [row.id for row in db.query(Job.id).filter(
+                Job.status == QUEUED, or_(Job.run_after.is_(None), Job.run_after <= now)
+            ).order_by(Job.created_at).limit(self.max_queued)]
+            db.commit()
+        _remove_files(files)
+        return ready
+
+    # Lifecycle
+
+    async def start(self) -> None:
+        if self._queue is not None:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._sweeper_task = asyncio.create_task(self._sweeper())
+
+    async def stop(self, drain_seconds: float = 30.0) -> None:
+        """Let running jobs finish for up to drain_seconds, then queue the rest again."""
+        if self._queue is None:
+            return
+        self._stopping = True
+        self._sweeper_task.cancel()
+        for _ in self._workers:
+            self._queue.put_nowait(None)  # wakes idle workers up
+        running = list(self._running.values())
+        if running:
+            await asyncio.wait(running, timeout=drain_seconds)
+        for task in list(self._running.values()):
+            task.cancel()
+        # Workers record the interrupted jobs as queued, then exit
+        await asyncio.gather(self._sweeper_task, *self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending.clear()
+
+    def _enqueue(self, job_id: str) -> None:
+        if self._queue is not None and job_id not in self._pending and job_id not in self._running:
+            self._pending.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def submit(self, kind: str, payload: Dict[str, Any], user_id: Optional[int] = None) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._queue is None or self._stopping:
+            raise RuntimeError("Job workers are not running")
+        if len(self._pending) >= self.max_queued:
+            raise JobQueueFull(f"{len(self._pending)} jobs are already waiting")
+        job = await run_in_threadpool(self._create, kind, payload, user_id)
+        self._counters["submitted"] += 1
+        self._enqueue(job.id)
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False when it already finished."""
+        if await run_in_threadpool(self._transition, job_id, QUEUED, status=CANCELLED, finished_at=utcnow()):
+            self._counters["cancelled"] += 1
+            return True
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+            await asyncio.wait([task])
+        # When running in another worker, that worker's result is discarded
+        if await run_in_threadpool(self._transition, job_id, RUNNING, status=CANCELLED, finished_at=utcnow()):
+            self._counters["cancelled"] += 1
+            return True
+        return False
+
+    # Workers
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            job_id = await self._queue.get()
+            if job_id is None:
+                break
+            self._pending.discard(job_id)
+            try:
+                await self._execute(job_id)
+            except Exception:
+                logger.exception("Job %s could not be run", job_id)
+
+    async def _sweeper(self) -> None:
+        while True:
+            try:
+                for job_id in await run_in_threadpool(self._sweep):
+                    self._enqueue(job_id)
+            except Exception:
+                logger.exception("Job sweep failed")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def _execute(self, job_id: str) -> None:
+        if self._stopping:
+            return
+        job = await run_in_threadpool(self._claim, job_id)
+        if job is None:
+            return  # cancelled, taken by another worker or not due yet
+        handler = self.handlers[job.kind]
+        task = asyncio.create_task(asyncio.wait_for(handler(json.loads(job.payload), job), self.timeout))
+        self._running[job_id] = task
+        try:
+            await asyncio.wait([task])
+        finally:
+            self._running.pop(job_id, None)
+
+        if task.cancelled():
+            if job_id in self._cancelled:
+                self._cancelled.discard(job_id)  # cancel() records it
+            else:
+                # Interrupted by shutdown: the next worker runs it again
+                await run_in_threadpool(self._transition, job_id, RUNNING, status=QUEUED,
+                                        attempts=job.attempts - 1)
+            return
+
+        error = task.exception()
+        if error is None:
+            result = task.result()
+            if await run_in_threadpool(self._transition, job_id, RUNNING, status=SUCCEEDED,
+                                       result=json.dumps(result.data) if result.data is not None else None,
+                                       result_path=result.path, result_media_type=result.media_type,
+                                       finished_at=utcnow()):
+                self._counters["succeeded"] += 1
+            elif result.path is not None:
+                _remove_files([result.path])  # cancelled meanwhile, nothing will serve the file
+            return
+
+        message = str(error) or type(error).__name__
+        if not isinstance(error, JobFailed) and job.attempts < job.max_attempts:
+            # Rate limited or CPU pool full: wait as long as asked, still an attempt so it cannot loop forever
+            delay = (error.delay if isinstance(error, JobRetryLater)
+                     else self.retry_backoff * 2 ** (job.attempts - 1))
+            await self._retry(job_id, delay, message)
+            return
+        logger.warning("Job %s failed after %d attempts: %s", job_id, job.attempts, message)
+        if await run_in_threadpool(self._transition, job_id, RUNNING, status=FAILED, error=message,
+                                   finished_at=utcnow()):
+            self._counters["failed"] += 1
+
+    async def _retry(self, job_id: str, delay: float, message: str) -> None:
+        if await run_in_threadpool(self._transition, job_id, RUNNING, status=QUEUED, error=message,
+                                   run_after=utcnow() + timedelta(seconds=delay)):
+            self._counters["retried"] += 1
+            self._pending.add(job_id)
+            asyncio.get_running_loop().call_later(delay + 0.05, self._requeue, job_id)
+
+    def _requeue(self, job_id: str) -> None:
+        self._pending.discard(job_id)
+        self._enqueue(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._counters, "waiting": len(self._pending), "running": len(self._running)}
@@ -0,0 +1,189 @@
+"""
+Materialized monthly rollups of the budget line items of every journal.
+
+store_advice_message adds each new journal to the budget_rollup table in
+the same transaction, so trend queries read O(periods x categories) rows
+instead of re-reading the user's whole journal history. Rebuild the table
+(e.g. after upgrading a database with existing journals) with:
+
+    DATABASE_URL=... python -m app.services.rollup_service [--user-id ID]
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from app.models.advice import Expense, Income
+from app.models.model import BudgetLineItem, BudgetRollup, FinanceJournal
+from app.utils.budget_parser import load_expenses, load_incomes, monthly_amount, normalize_label
+
+UNDATED = "undated"
+
+RollupKey = Tuple[str, str, str]  # (period, kind, category)
+
+# Rows per INSERT ... ON CONFLICT statement; 7 parameters a row stays well under
+# SQLite's bound parameter limit (32766) and keeps statements small for rebuilds
+UPSERT_BATCH_SIZE = 500
+
+
+def journal_period(created_at: Optional[datetime]) -> str:
+    """Rollup period of a journal: its "YYYY-MM" month"""
+    return created_at.strftime("%Y-%m") if created_at else UNDATED
+
+
+def _deltas(period: str, items: Iterable[Tuple[str, str, float, str]]) -> Dict[RollupKey, List[float]]:
+    """(period, kind, category) -> [total, items, journals] for one journal's line items"""
+    deltas: Dict[RollupKey, List[float]] = {}
+    for kind, label, amount, item_period in items:
+        delta = deltas.setdefault((period, kind, normalize_label(label)), [0.0, 0, 1])
+        delta[0] += monthly_amount(amount, item_period)
+        delta[1] += 1
+    return deltas
+
+
+def journal_items(incomes: Optional[List[Income]], expenses: Optional[List[Expense]]):
+    """(kind, label, amount, period) for typed incomes and expenses"""
+    return ([("income", i.source, i.amount, i.period) for i in incomes or []]
+            + [("expense", e.category, e.amount, e.period) for e in expenses or []])
+
+
+def _upsert(db: Session, user_id: int, deltas: Dict[RollupKey, List[float]]) -> None:
+    if not deltas:
+        return
+    rows = [{"user_id": user_id, "period": period, "kind": kind, "category": category,
+             "total": total, "item_count": count, "journal_count": journals}
+            for (period, kind, category), (total, count, journals) in deltas.items()]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        # Atomic increments, safe with concurrent writers for the same user and month
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            stmt = insert(BudgetRollup).values(rows[start:start + UPSERT_BATCH_SIZE])
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["user_id", "period", "kind", "category"],
+                set_={"total": BudgetRollup.total + stmt.excluded.total,
+                      "item_count": BudgetRollup.item_count + stmt.excluded.item_count,
+                      "journal_count": BudgetRollup.journal_count + stmt.excluded.journal_count}))
+        return
+    for row in rows:
+        rollup = db.get(BudgetRollup, (user_id, row["period"], row["kind"], row["category"]))
+        if rollup is None:
+            db.add(BudgetRollup(**row))
+        else:
+            rollup.total += row["total"]
+            rollup.item_count += row["item_count"]
+            rollup.journal_count += row["journal_count"]
+
+
+def _stored_items(journal: FinanceJournal):
+    """(kind, label, amount, period) of a stored journal, parsed from its JSON for legacy rows"""
+    items = [(i.kind, i.label, i.amount, i.period) for i in journal.line_items]
+    return items or journal_items(load_incomes(journal.ai_extracted_income),
+                                  load_expenses(journal.ai_extracted_expenses))
+
+
+def apply_rollups(db: Session, user_id: int, created_at: Optional[datetime],
+                  incomes: Optional[List[Income]], expenses: Optional[List[Expense]]) -> None:
+    """Add one journal to its user's rollups; the caller commits"""
+    _upsert(db, user_id, _deltas(journal_period(created_at), journal_items(incomes, expenses)))
+
+
+def remove_rollups(db: Session, journal: FinanceJournal) -> None:
+    """Take a stored journal out of its user's rollups before its items change; the caller commits"""
+    deltas = _deltas(journal_period(journal.created_at), _stored_items(journal))
+    _upsert(db, journal.user_id, {key: [-total, -items, -journals]
+                                  for key, (total, items, journals) in deltas.items()})
+    db.query(BudgetRollup).filter(BudgetRollup.user_id == journal.user_id,
+                                  BudgetRollup.journal_count <= 0).delete(synchronize_session=False)
+
+
+def rebuild_rollups(db: Session, user_id: Optional[int] = None, batch_size: int = 500) -> int:
+    """
+    Recompute the rollups of one user (or everyone) from the stored journals.
+    Journals stored before line items existed are parsed and backfilled.
+    Returns the number of journals read.
+    """
+    rollups = db.query(BudgetRollup)
+    journals = (select(FinanceJournal).options(selectinload(FinanceJournal.line_items))
+                .order_by(FinanceJournal.id))
+    if user_id is not None:
+        rollups = rollups.filter(BudgetRollup.user_id == user_id)
+        journals = journals.where(FinanceJournal.user_id == user_id)
+    rollups.delete(synchronize_session=False)
+
+    totals: Dict[int, Dict[RollupKey, List[float]]] = defaultdict(dict)
+    count = 0
+    for journal in db.scalars(journals.execution_options(yield_per=batch_size)):
+        items = _stored_items(journal)
+        if not journal.line_items:
+            # Legacy row: store its line items so later reads skip the parsing
+            journal.line_items = [BudgetLineItem(kind=kind, label=label, amount=amount, period=period,
+                                                 position=position)
+                                  for position, (kind, label, amount, period) in enumerate(items)]
+        user_totals = totals[journal.user_id]
+        for key, (total, items_count, journals_count) in _deltas(journal_period(journal.created_at),
+                                                                 items).items():
+            current = user_totals.setdefault(key, [0.0, 0, 0])
+            current[0] += total
+            current[1] += items_count
+            current[2] += journals_count
+        count += 1
+    for owner, deltas in totals.items():
+        if owner is not None:
+            _upsert(db, owner, deltas)
+    db.commit()
+    return count
+
+
+def user_trends(db: Session, user_id: int, kind: Optional[str] = None, category: Optional[str] = None,
+                start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+    """
+    Month-over-month totals and per-category series from the rollups.
+    Series are aligned with `periods` (0 where a category has no items);
+    undated journals are reported under "undated", after the months.
+    """
+    query = db.query(BudgetRollup).filter(BudgetRollup.user_id == user_id)
+    if kind is not None:
+        query = query.filter(BudgetRollup.kind == kind)
+    if category is not None:
+        query = query.filter(BudgetRollup.category == normalize_label(category))
+    if start is not None or end is not None:
+        query = query.filter(BudgetRollup.period != UNDATED)
+    if start is not None:
+        query = query.filter(BudgetRollup.period >= start)
+    if end is not None:
+        query = query.filter(BudgetRollup.period <= end)
+    rows = query.all()
+
+    periods = sorted({row.period for row in rows if row.period != UNDATED})
+    if any(row.period == UNDATED for row in rows):
+        periods.append(UNDATED)
+    index = {period: i for i, period in enumerate(periods)}
+    totals = [{"period": period, "income": 0.0, "expense": 0.0} for period in periods]
+    categories: Dict[str, Dict[str, List[float]]] = {}
+    for row in rows:
+        i = index[row.period]
+        totals[i][row.kind] = round(totals[i].get(row.kind, 0.0) + row.total, 2)
+        series = categories.setdefault(row.kind, {}).setdefault(row.category, [0.0] * len(periods))
+        series[i] = round(series[i] + row.total, 2)
+    for entry in totals:
+        entry["net"] = round(entry["income"] - entry["expense"], 2)
+    return {"periods": periods, "totals": totals, "categories": categories}
+
+
+if __name__ == "__main__":
+    from app.models.model import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Rebuild the budget_rollup table from stored journals")
+    parser.add_argument("--user-id", type=int, help="only rebuild this user's rollups")
+    args = parser.parse_args()
+    init_db()
+    with SessionLocal() as db:
+        journals = rebuild_rollups(db, args.user_id)
+    print(f"Rebuilt rollups from {journals} journals")
@@ -0,0 +1,127 @@
+import json
+import re
+from typing import Iterable, List, Tuple
+
+from app.models.advice import Expense, Income
+
+# "Label: value" lines, allowing list bullets/numbering and markdown bold
+_LINE = re.compile(
+    r"^[ \t]*(?:[-*+•]|\d+[.)])?[ \t]*\**(?P<label>[^:\n*]+?)\**[ \t]*:[ \t]*(?P<value>[^\n]*\d[^\n]*)$",
+    re.MULTILINE)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_PERIODS = (
+    ("weekly", ("weekly", "per week", "a week", "every week", "/week", "/wk")),
+    ("yearly", ("yearly", "annual", "per year", "a year", "every year", "per annum", "/year", "/yr")),
+    ("one-off", ("one-off", "one off", "one-time", "one time")),
+    ("monthly", ("monthly", "per month", "a month", "/month", "/mo")),
+)
+
+
+def parse_amount(value: str) -> float:
+    """
+    Numeric value of an amount string.
+    Thousands separators are ignored and ranges ("500-700") or several
+    numbers are averaged; 0 when there is no number.
+    """
+    numbers = [float(n) for n in _NUMBER.findall(value.replace(",", ""))]
+    if not numbers:
+        return 0.0
+    return sum(numbers) / len(numbers)
+
+
+def parse_period(value: str, default: str = "monthly") -> str:
+    """Period mentioned in a line item, or the default."""
+    value = value.lower()
+    for period, markers in _PERIODS:
+        if any(marker in value for marker in markers):
+            return period
+    return default
+
+
+def parse_line_items(text: str) -> List[Tuple[str, float, str]]:
+    """(label, amount, period) for every "Label: amount" line in free-form text."""
+    items = []
+    for match in _LINE.finditer(text or ""):
+        value = match.group("value")
+        items.append((match.group("label").strip(), parse_amount(value), parse_period(value)))
+    return items
+
+
+def parse_incomes(text: str) -> List[Income]:
+    return [Income(source=label, amount=amount, period=period)
+            for label, amount, period in parse_line_items(text)]
+
+
+def parse_expenses(text: str) -> List[Expense]:
+    return [Expense(category=label, amount=amount, period=period)
+            for label, amount, period in parse_line_items(text)]
+
+
+def format_line_items(items: List[Income] | List[Expense]) -> str:
+    """Render typed line items as "Label: amount (period)" lines for prompts."""
+    lines = []
+    for item in items:
+        label = item.source if isinstance(item, Income) else item.category
+        lines.append(f"{label}: {item.amount:.2f} ({item.period})")
+    return "\n".join(lines) or "None"
+
+
+# Occurrences per month of each period; one-off amounts count once, in their month
+MONTHLY_FACTORS = {"weekly": 52 / 12, "monthly": 1.0, "yearly": 1 / 12, "one-off": 1.0}
+
+
+def normalize_label(label: str) -> str:
+    """Case and whitespace insensitive form of a line item label."""
+    return " ".join(label.casefold().split())
+
+
+def monthly_amount(amount: float, period: str) -> float:
+    """Amount per month of a line item (unknown periods count as monthly)."""
+    return amount * MONTHLY_FACTORS.get(period, 1.0)
+
+
+def _item_key(item: Income | Expense) -> Tuple[str, float, str]:
+    label = item.source if isinstance(item, Income) else item.category
+    return normalize_label(label), round(item.amount, 2), item.period
+
+
+def merge_line_items(groups: Iterable[List[Income] | List[Expense]]) -> List[Income] | List[Expense]:
+    """
+    Merge the line items extracted from the chunks of one note into one list,
+    in order. An item that ends one chunk and opens the next (same label,
+    amount and period) is the same line seen from both sides of a cut block
+    and is kept once; other repeats were written twice in the note (a salary
+    listed every month) and are all kept.
+    """
+    merged: List[Income] | List[Expense] = []
+    for group in groups:
+        if merged and group and _item_key(merged[-1]) == _item_key(group[0]):
+            group = group[1:]
+        merged.extend(group)
+    return merged
+
+
+def dump_line_items(items: List[Income] | List[Expense]) -> str:
+    """JSON text stored in the ai_extracted_* columns."""
+    return json.dumps([item.model_dump() for item in items])
+
+
+def _load(text: str | None, model, parse):
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # Rows written before extraction was structured hold free-form text
+        return parse(text)
+    return [model.model_validate(item) for item in data]
+
+
+def load_incomes(text: str | None) -> List[Income]:
+    """Incomes from a stored ai_extracted_income value (JSON or legacy text)."""
+    return _load(text, Income, parse_incomes)
+
+
+def load_expenses(text: str | None) -> List[Expense]:
+    """Expenses from a stored ai_extracted_expenses value (JSON or legacy text)."""
+    return _load(text, Expense, parse_expenses)
@@ -0,0 +1,77 @@
+import math
+import re
+from typing import List
+
+# Lines that open a new dated entry: 2024-03-01, 01/03/2024, 1.3.24, Mar 1, 1 March, March 2024
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_DATE_LINE = re.compile(
+    rf"^[ \t]*(?:[-*•][ \t]*)?(?:\d{{4}}-\d{{1,2}}-\d{{1,2}}|\d{{1,2}}[/.]\d{{1,2}}[/.]\d{{2,4}}"
+    rf"|{_MONTH}[ \t]+\d{{1,4}}|\d{{1,2}}(?:st|nd|rd|th)?[ \t]+{_MONTH})\b",
+    re.IGNORECASE)
+
+
+def _blocks(text: str) -> List[str]:
+    """Transaction blocks: runs of lines separated by blank lines or starting with a date."""
+    blocks: List[List[str]] = []
+    current: List[str] = []
+    for line in text.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append(current)
+                current = []
+            continue
+        if current and _DATE_LINE.match(line):
+            blocks.append(current)
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(current)
+    return ["\n".join(block) for block in blocks]
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Split a single block that is too long, at line breaks and then at spaces."""
+    pieces: List[str] = []
+    for line in text.splitlines():
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip()
+        if line:
+            pieces.append(line)
+    return pieces
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_note(text: str, max_chars: int, max_chunks: int) -> List[str]:
+    """
+    Split a journal note into chunks of at most about max_chars characters.
+    Chunks end at dated entries or blank lines, so a transaction block is
+    never cut in two unless it is longer than a chunk on its own. Notes that
+    fit in one chunk are returned unchanged. At most max_chunks chunks are
+    produced; very long notes get proportionally larger chunks.
+    """
+    if len(text) <= max_chars:
+        return [text]
+    size = max(max_chars, math.ceil(len(text) / max_chunks))
+    while True:
+        pieces = []
+        for block in _blocks(text):
+            pieces.extend(_split_long(block, size) if len(block) > size else [block])
+        chunks = _pack(pieces, size)
+        if len(chunks) <= max_chunks:
+            return chunks
+        size = math.ceil(size * 1.25)
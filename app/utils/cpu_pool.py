@@ -0,0 +1,129 @@
+"""
+Process pool for CPU-bound work: bcrypt and building xlsx/parquet exports.
+
+Work submitted here runs in separate processes, so it does not hold the GIL
+of the app worker and LLM-bound requests keep their latency while logins and
+exports spike. Each uvicorn worker owns its own pool (a process pool cannot
+be shared between processes that were started independently); size
+CPU_POOL_WORKERS x uvicorn workers to the CPU cores available.
+
+When max_pending tasks are already queued or running, submit() raises
+PoolSaturated instead of queueing more work; the API answers 503 with a
+Retry-After estimate.
+"""
+import asyncio
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from app import config
+
+
+class PoolSaturated(Exception):
+    """Raised when the pool already holds max_pending tasks."""
+
+    def __init__(self, retry_after: float, name: str):
+        super().__init__(f"{name} pool is saturated, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def _warm_up() -> None:
+    # Import the heavy modules while the worker process is idle
+    import bcrypt  # noqa: F401
+    import openpyxl  # noqa: F401
+
+
+class CPUPool:
+    """
+    Runs picklable functions on `workers` processes (threads when processes
+    is False). The executor is started by start(), or by the first submit.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 64, processes: bool = True,
+                 start_method: str = "spawn", name: str = "cpu"):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.processes = processes
+        self.start_method = start_method
+        self.name = name
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._task_seconds = 0.0  # moving average, for Retry-After
+        self._counters = {"completed": 0, "failed": 0, "rejected": 0}
+
+    def start(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    # spawn: the app worker has threads and open connections a fork would copy
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method))
+                    for _ in range(self.workers):
+                        self._executor.submit(_warm_up)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix=self.name)
+            return self._executor
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _retry_after(self) -> float:
+        return max(1.0, math.ceil(self._task_seconds * self._pending / self.workers))
+
+    def submit(self, fn: Callable, *args: Any) -> Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters["rejected"] += 1
+                raise PoolSaturated(self._retry_after(), self.name)
+            self._pending += 1
+        try:
+            executor = self._executor or self.start()
+            future = executor.submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        started = time.perf_counter()
+        future.add_done_callback(lambda done: self._finished(done, time.perf_counter() - started, executor))
+        return future
+
+    def run(self, fn: Callable, *args: Any) -> Any:
+        """Run fn(*args) on the pool and wait for its result (from a sync caller)."""
+        return self.submit(fn, *args).result()
+
+    async def arun(self, fn: Callable, *args: Any) -> Any:
+        """Run fn(*args) on the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _finished(self, future: Future, seconds: float, executor: Executor) -> None:
+        error = None if future.cancelled() else future.exception()
+        broken = None
+        with self._lock:
+            self._pending -= 1
+            self._counters["failed" if error is not None else "completed"] += 1
+            self._task_seconds = seconds if not self._task_seconds else 0.8 * self._task_seconds + 0.2 * seconds
+            if isinstance(error, BrokenProcessPool) and self._executor is executor:
+                # A worker process died; the next submit starts a new pool
+                broken, self._executor = executor, None
+        if broken is not None:
+            # Reap the surviving workers; no waiting, this runs in the executor's own callback
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "pending": self._pending,
+                    "running": min(self._pending, self.workers),
+                    "queued": max(0, self._pending - self.workers)}
+
+
+cpu_pool = CPUPool(workers=config.CPU_POOL_WORKERS, max_pending=config.CPU_POOL_MAX_PENDING,
+                   processes=config.CPU_POOL_PROCESSES, start_method=config.CPU_POOL_START_METHOD)
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Iterator, Optional, Set, Tuple
+
+
+class ExportCache:
+    """
+    Byte-bounded LRU of rendered exports.
+    Keys are (journal_id, ...) tuples so every export of a journal can be
+    dropped at once when the journal changes.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._by_journal: Dict[Hashable, Set[Tuple]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def put(self, key: Tuple, value: bytes) -> None:
+        if len(value) > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = value
+            self._by_journal.setdefault(key[0], set()).add(key)
+            self._size += len(value)
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple) -> None:
+        value = self._entries.pop(key, None)
+        if value is None:
+            return
+        self._size -= len(value)
+        keys = self._by_journal.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_journal[key[0]]
+
+    def invalidate(self, journal_id: Hashable) -> None:
+        """Drop every cached export of a journal."""
+        with self._lock:
+            for key in list(self._by_journal.get(journal_id, ())):
+                self._remove(key)
+            self._counters["invalidations"] += 1
+
+    def tee(self, key: Tuple, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield chunks while recording them, caching the export once it completes."""
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size > self.max_entry_bytes:
+                    parts = None  # too large to cache, keep streaming
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            self.put(key, b"".join(parts))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "bytes": self._size}
@@ -0,0 +1,117 @@
+import re
+from typing import Dict, List, Optional
+
+from app.models.advice import Expense, Income
+from app.utils.budget_parser import parse_amount, parse_period
+
+# Words that make a line item an income or an expense on their own
+INCOME_WORDS = frozenset((
+    "salary", "salaries", "wage", "wages", "paycheck", "payroll", "income", "earnings", "freelance",
+    "freelancing", "consulting", "bonus", "bonuses", "commission", "dividend", "dividends", "pension",
+    "stipend", "allowance", "royalties", "tips", "revenue", "profit", "profits",
+))
+EXPENSE_WORDS = frozenset((
+    "rent", "mortgage", "groceries", "grocery", "food", "dining", "restaurants", "utilities", "utility",
+    "electricity", "electric", "water", "gas", "internet", "wifi", "phone", "mobile", "cable",
+    "insurance", "transport", "transportation", "commute", "fuel", "petrol", "parking", "car", "loan",
+    "debt", "subscription", "subscriptions", "streaming", "netflix", "spotify", "gym", "childcare",
+    "daycare", "tuition", "school", "medical", "health", "healthcare", "doctor", "entertainment",
+    "clothing", "clothes", "travel", "bills", "tax", "taxes", "fees", "repairs", "maintenance",
+    "coffee", "shopping", "household", "payment", "installment", "emi",
+))
+# Words that turn money coming back in into income even next to an expense word
+# ("tax refund", "car sale", "insurance payout"); such labels are left to the LLM
+INCOME_HINTS = frozenset((
+    "refund", "refunds", "refunded", "payout", "payouts", "sale", "sales", "sold", "reimbursement",
+    "reimbursements", "reimbursed", "received", "receive", "interest", "rebate", "rebates", "cashback",
+    "winnings", "proceeds", "gift", "gifts", "returned", "return", "returns", "settlement", "claim",
+))
+# Header lines that put the following items in a section
+_SECTIONS = {"income": "income", "incomes": "income", "earnings": "income",
+             "expenses": "expense", "expense": "expense", "spending": "expense", "costs": "expense",
+             "bills": "expense", "outgoings": "expense"}
+
+_WORD = re.compile(r"[a-z]+")
+_CURRENCY = r"(?:[$€£₦¥]|usd|eur|gbp|ngn|dollars|euros|pounds|naira)"
+_PERIOD = (r"(?:\s*(?:/\s*|per\s+|a\s+|every\s+)(?:month|mo|week|wk|year|yr|annum)"
+           r"|\s*\(?\s*(?:monthly|weekly|yearly|annually|annual|one-off|one off|one-time|one time)\s*\)?)")
+# "Label: amount [period]", with ":", "-", "=" or just a space between them
+_ITEM = re.compile(
+    rf"^(?:[-*+•]|\d+[.)])?\s*\**(?P<label>[a-z][a-z '&/()-]*?)\**\s*(?:[:=-]\s*|\s)\s*"
+    rf"(?P<value>{_CURRENCY}?\s*\d[\d,]*(?:\.\d+)?\s*k?\s*{_CURRENCY}?{_PERIOD}?)\s*[.!]?$",
+    re.IGNORECASE)
+_HEADER = re.compile(r"^(?:[-*+•#]\s*)*\**\s*(?P<name>[a-z]+)\s*\**\s*:?\s*\**$", re.IGNORECASE)
+# Items are split at line breaks, semicolons and commas that are not thousands separators
+_SEGMENTS = re.compile(r"\n|;|,(?=\s*[^\d\s])")
+
+# Labels whose kind a keyword cannot settle, even under a section header
+AMBIGUOUS = "ambiguous"
+
+# Share of the note that may be left unparsed (greetings, "my budget is", ...)
+MAX_UNPARSED_RATIO = 0.25
+
+
+def _classify(label: str) -> Optional[str]:
+    """income, expense, None when no keyword decides it, or AMBIGUOUS"""
+    words = set(_WORD.findall(label.lower()))
+    if words & INCOME_HINTS:
+        return AMBIGUOUS  # e.g. "tax refund", "car sale"
+    income, expense = bool(words & INCOME_WORDS), bool(words & EXPENSE_WORDS)
+    if income and expense:
+        return AMBIGUOUS  # e.g. "salary advance repayment loan"
+    if income or expense:
+        return "income" if income else "expense"
+    return None
+
+
+def _amount(value: str) -> float:
+    amount = parse_amount(value)
+    return amount * 1000 if re.search(r"\d\s*k\b", value, re.IGNORECASE) else amount
+
+
+def extract_budget(note: str) -> Optional[Dict[str, List[Income] | List[Expense]]]:
+    """
+    Income and expenses of a simple, well-structured note, parsed without the LLM.
+    Handles lists of "Label: amount" items, under "Income:"/"Expenses:"
+    headers or with labels such as "Salary" or "Rent" that leave no doubt.
+    Returns None as soon as anything is ambiguous: an amount that is not a
+    clean line item, an item that could be either kind (refunds, sales,
+    payouts, labels mixing income and expense words), or too much prose.
+    """
+    section = None
+    incomes: List[Income] = []
+    expenses: List[Expense] = []
+    unparsed = 0
+    for segment in _SEGMENTS.split(note or ""):
+        segment = segment.strip()
+        if not segment:
+            continue
+        header = _HEADER.match(segment)
+        if header and header.group("name").lower() in _SECTIONS:
+            section = _SECTIONS[header.group("name").lower()]
+            continue
+        item = _ITEM.match(segment)
+        if item is None:
+            if any(char.isdigit() for char in segment):
+                return None
+            unparsed += len(segment)
+            continue
+        label, value = item.group("label").strip(" -'&/"), item.group("value")
+        kind = _classify(label)
+        if kind == AMBIGUOUS:
+            return None
+        if section and kind not in (None, section):
+            return None  # e.g. "Rent" listed under "Income:"
+        kind = kind or section
+        if kind is None:
+            return None
+        amount, period = _amount(value), parse_period(value)
+        if kind == "income":
+            incomes.append(Income(source=label, amount=amount, period=period))
+        else:
+            expenses.append(Expense(category=label, amount=amount, period=period))
+    if not incomes and not expenses:
+        return None
+    if unparsed > MAX_UNPARSED_RATIO * len(note):
+        return None
+    return {"income": incomes, "expenses": expenses}
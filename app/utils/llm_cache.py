@@ -0,0 +1,200 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, delete, select
+
+from app.models.model import create_db_engine
+
+_WHITESPACE = re.compile(r"(?:\s|\\[nrt])+")
+
+metadata = MetaData()
+
+llm_cache_table = Table(
+    "llm_cache", metadata,
+    Column("key", String, primary_key=True),
+    Column("response", Text, nullable=False),
+    Column("created_at", Float, nullable=False, index=True),
+)
+
+
+def _dump_generations(generations: RETURN_VAL_TYPE) -> str:
+    items = []
+    for generation in generations:
+        item = {"text": generation.text, "generation_info": generation.generation_info}
+        if isinstance(generation, ChatGeneration):
+            item["message"] = message_to_dict(generation.message)
+        items.append(item)
+    return json.dumps(items)
+
+
+def _load_generations(raw: str) -> RETURN_VAL_TYPE:
+    generations = []
+    for item in json.loads(raw):
+        if "message" in item:
+            message = messages_from_dict([item["message"]])[0]
+            generations.append(ChatGeneration(message=message, generation_info=item["generation_info"]))
+        else:
+            generations.append(Generation(text=item["text"], generation_info=item["generation_info"]))
+    return generations
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace (including escaped newlines in serialized prompts)."""
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Cache key for a prompt on a given model.
+    llm_string is LangChain's serialization of the model parameters, so the
+    model name and temperature are part of the key.
+    """
+    raw = normalize_prompt(prompt) + "\x00" + llm_string
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TieredLLMCache(BaseCache):
+    """
+    Two tier LLM response cache.
+    Lookups hit a bounded in-process LRU first and fall back to a persistent
+    SQLite table; disk hits are promoted to memory. Entries older than the
+    TTL are ignored in both tiers; every evict_every writes the table drops
+    expired rows and is trimmed to max_rows, oldest first.
+    """
+
+    def __init__(self, database_url: str, memory_size: int = 1024,
+                 max_rows: int = 50000, ttl_seconds: int = 7 * 24 * 3600, evict_every: int = 100):
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = max(1, evict_every)
+        # key -> (stored at, generations)
+        self._memory: "OrderedDict[str, Tuple[float, RETURN_VAL_TYPE]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        self.database_url = database_url
+        self._engine = None  # opened by setup(), at startup or on first disk access
+
+    def setup(self):
+        """Open the database and create the cache table if needed."""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    # Same WAL / busy_timeout settings as the app database
+                    engine = create_db_engine(self.database_url)
+                    metadata.create_all(engine)
+                    self._engine = engine
+        return self._engine
+
+    def close(self) -> None:
+        if self._engine is not None:
+            self._engine.dispose()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _memory_get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if stored_at < time.time() - self.ttl_seconds:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._counters["memory_hits"] += 1
+            return value
+
+    def _memory_put(self, key: str, value: RETURN_VAL_TYPE, stored_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (stored_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, RETURN_VAL_TYPE]]:
+        with self.setup().connect() as conn:
+            row = conn.execute(
+                select(llm_cache_table.c.response, llm_cache_table.c.created_at)
+                .where(llm_cache_table.c.key == key)
+            ).first()
+        if row is None or row.created_at < time.time() - self.ttl_seconds:
+            return None
+        return row.created_at, _load_generations(row.response)
+
+    def _disk_put(self, key: str, value: RETURN_VAL_TYPE, stored_at: float) -> None:
+        response = _dump_generations(value)
+        with self._lock:
+            self._writes_since_evict += 1
+            evict = self._writes_since_evict >= self.evict_every
+            if evict:
+                self._writes_since_evict = 0
+        with self.setup().begin() as conn:
+            conn.execute(delete(llm_cache_table).where(llm_cache_table.c.key == key))
+            conn.execute(llm_cache_table.insert().values(
+                key=key, response=response, created_at=stored_at))
+            if evict:
+                self._evict(conn)
+
+    def _evict(self, conn) -> None:
+        """Drop expired rows and trim the table to max_rows, oldest first."""
+        conn.execute(delete(llm_cache_table).where(
+            llm_cache_table.c.created_at < time.time() - self.ttl_seconds))
+        # Newest row past the limit, found through the created_at index (no full count)
+        cutoff = conn.execute(
+            select(llm_cache_table.c.created_at)
+            .order_by(llm_cache_table.c.created_at.desc())
+            .offset(self.max_rows).limit(1)
+        ).scalar()
+        if cutoff is not None:
+            conn.execute(delete(llm_cache_table).where(llm_cache_table.c.created_at <= cutoff))
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        entry = self._disk_get(key)
+        if entry is None:
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        # Promoted entries keep their original age, so they expire with the row
+        self._memory_put(key, entry[1], entry[0])
+        return entry[1]
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        # Memory hits are answered inline, only the disk tier needs a thread
+        value = self._memory_get(cache_key(prompt, llm_string))
+        if value is not None:
+            return value
+        return await super().alookup(prompt, llm_string)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        stored_at = time.time()
+        self._memory_put(key, return_val, stored_at)
+        self._disk_put(key, return_val, stored_at)
+        self._count("writes")
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+        with self.setup().begin() as conn:
+            conn.execute(delete(llm_cache_table))
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current memory tier size."""
+        with self._lock:
+            return {**self._counters, "memory_entries": len(self._memory)}
@@ -0,0 +1,354 @@
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Default latency buckets in seconds, from a fast DB query to a slow LLM call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {value:g}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = 'le="%g"' % bound
+                yield f"{self.name}_bucket{_labels(self.labels, key, le)} {count:g}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labels, key, le)} {counts[-1]:g}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {counts[-2]:g}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {counts[-1]:g}"
+
+
+class Registry:
+    """
+    Metrics rendered in the Prometheus text exposition format.
+    Collectors are callables returning (name, kind, help, [(labels, value)])
+    tuples; they expose the stats() counters the caches already keep.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List]]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, List]]]) -> Callable:
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            for name, kind, help, values in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time to the end of the endpoint handler.",
+    ["method", "route", "status"])
+stage_seconds = registry.histogram(
+    "pipeline_stage_duration_seconds", "Latency of each advice pipeline stage.", ["stage", "status"])
+llm_seconds = registry.histogram(
+    "llm_call_duration_seconds", "Latency of each chat model call.", ["stage"])
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Prompt and completion tokens reported by the model.", ["stage", "type"])
+llm_calls = registry.counter(
+    "llm_calls_total", "Chat model calls by stage and outcome.", ["stage", "status"])
+llm_retries = registry.counter(
+    "llm_retries_total", "Requests to the Groq API retried by the client.")
+fast_path_results = registry.counter(
+    "extraction_fast_path_total",
+    "Notes whose income and expenses were parsed locally (hit) or left to the LLM (miss).", ["result"])
+operation_seconds = registry.histogram(
+    "operation_duration_seconds", "Latency of DB queries, bcrypt and spreadsheet building.",
+    ["operation"])
+
+# Per-request timing totals, read by TimingMiddleware for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Add to the current request's breakdown (no-op outside a request)."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def observe_operation(name: str, seconds: float) -> None:
+    operation_seconds.observe(seconds, operation=name)
+    record_timing(name, seconds)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Time a block as operation `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_operation(name, time.perf_counter() - start)
+
+
+def timed_iter(name: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Time the work done producing each chunk of a streamed export as one operation."""
+    elapsed = 0.0
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield chunk
+    finally:
+        operation_seconds.observe(elapsed, operation=name)
+
+
+_instrumented_engines: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def instrument_engine(engine, name: str = "db") -> None:
+    """Time every statement executed through a SQLAlchemy engine (once per engine)."""
+    from sqlalchemy import event
+
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        observe_operation(name, time.perf_counter() - conn.info["query_start"].pop())
+
+
+class _RetryLogHandler(logging.Handler):
+    # The Groq SDK retries inside the client and only reports it in its log
+    def emit(self, record: logging.LogRecord) -> None:
+        if str(record.msg).startswith("Retrying request"):
+            llm_retries.inc()
+
+
+def count_client_retries(logger_name: str = "groq._base_client") -> bool:
+    """
+    Count the Groq client's retries from its log. They are logged at INFO, so
+    they are only seen when logging lets them through (e.g. GROQ_LOG=info);
+    returns whether it currently does. The logger level is left as configured.
+    """
+    logger = logging.getLogger(logger_name)
+    if not any(isinstance(h, _RetryLogHandler) for h in logger.handlers):
+        logger.addHandler(_RetryLogHandler())
+    return logger.isEnabledFor(logging.INFO)
+
+
+class StageMetricsCallback(BaseCallbackHandler):
+    """
+    Times Pipeline stages and the chat model calls inside them.
+    Stages are the runs tagged "stage:<name>" by Pipeline; nested runs are
+    attributed to their stage through parent_run_id.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stage_of: Dict[UUID, str] = {}
+        self._started: Dict[UUID, float] = {}
+
+    def _enter(self, run_id: UUID, parent_run_id: Optional[UUID], tags: Optional[List[str]]) -> None:
+        stage = next((tag[6:] for tag in tags or () if tag.startswith("stage:")), None)
+        with self._lock:
+            if stage is None and parent_run_id is not None:
+                stage = self._stage_of.get(parent_run_id)
+                if stage is not None:
+                    self._stage_of[run_id] = stage
+            elif stage is not None:
+                self._stage_of[run_id] = stage
+                self._started[run_id] = time.perf_counter()
+
+    def _exit_chain(self, run_id: UUID, status: str) -> None:
+        with self._lock:
+            stage = self._stage_of.pop(run_id, None)
+            start = self._started.pop(run_id, None)
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            stage_seconds.observe(elapsed, stage=stage, status=status)
+            record_timing(stage, elapsed)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       tags: Optional[List[str]] = None, **kwargs: Any) -> None:
+        self._enter(run_id, parent_run_id, tags)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit_chain(run_id, "ok")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._exit_chain(run_id, "error")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, tags: Optional[List[str]] = None,
+                            **kwargs: Any) -> None:
+        self._enter(run_id, parent_run_id, tags)
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def _exit_llm(self, run_id: UUID) -> Tuple[str, float]:
+        with self._lock:
+            stage = self._stage_of.pop(run_id, None) or "none"
+            start = self._started.pop(run_id, time.perf_counter())
+        return stage, time.perf_counter() - start
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        stage, elapsed = self._exit_llm(run_id)
+        # Cache hits and streamed calls come back without usage
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        llm_calls.inc(stage=stage, status="ok")
+        llm_seconds.observe(elapsed, stage=stage)
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                llm_tokens.inc(usage[f"{kind}_tokens"], stage=stage, type=kind)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        stage, elapsed = self._exit_llm(run_id)
+        llm_calls.inc(stage=stage, status="error")
+        llm_seconds.observe(elapsed, stage=stage)
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    """Server-Timing header value, durations in milliseconds."""
+    entries = [f"{name};dur={1000 * seconds:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={1000 * total:.1f}")
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware recording request latency and, when enabled, a
+    Server-Timing header with the stage/DB/bcrypt breakdown of the request.
+    Work done after the headers are sent (streamed bodies) is not included.
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing:
+                    header = server_timing(timings, time.perf_counter() - start)
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _request_timings.reset(token)
+            route = scope.get("route")
+            http_request_seconds.observe(time.perf_counter() - start, method=scope["method"],
+                                         route=getattr(route, "path", "unmatched"),
+                                         status=status["code"])
@@ -0,0 +1,371 @@
+"""
+Near-duplicate index of processed journal notes.
+
+Notes are fingerprinted locally with a 64-bit SimHash of their words
+(amounts masked), so notes that differ in whitespace, punctuation, case,
+order or amounts land a few bits apart. A lookup finds the stored notes
+within the similarity threshold and reuses their extraction branches when
+the difference cannot change them:
+
+- the same words and items (each amount with the word before it) in any order:
+  income, expenses and concerns;
+- same words in the same order with some amounts changed: income and
+  expenses with those amounts patched, when every changed amount is one of
+  the extracted line items. Concerns are left to the LLM.
+
+Anything else (a word added or changed) is a miss.
+"""
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from sqlalchemy import BigInteger, Column, Float, MetaData, String, Table, Text, create_engine, delete, select
+
+from app.models.advice import Expense, Income
+from app.utils.write_behind import WriteBehindQueue, WriterClosed
+
+BRANCHES = ("income", "expenses", "concerns")
+
+_TOKEN = re.compile(r"\d[\d,]*(?:\.\d+)?|[^\W\d_]+")
+_BITS = 64
+
+metadata = MetaData()
+
+note_index_table = Table(
+    "note_index", metadata,
+    Column("key", String, primary_key=True),
+    Column("fingerprint", BigInteger, nullable=False),
+    Column("tokens", Text, nullable=False),
+    Column("branches", Text, nullable=False),
+    Column("created_at", Float, nullable=False, index=True),
+)
+
+
+def tokenize(note: str) -> List[str]:
+    """Lowercase words and numbers ("1,200.50" -> "1200.5") of a note, punctuation dropped."""
+    tokens = []
+    for token in _TOKEN.findall(note.lower()):
+        if token[0].isdigit():
+            token = f"{float(token.replace(',', '')):g}"
+        tokens.append(token)
+    return tokens
+
+
+def _is_number(token: str) -> bool:
+    return token[0].isdigit()
+
+
+def simhash(tokens: List[str]) -> int:
+    """
+    64-bit SimHash of words and word pairs, with every number masked as "#".
+    Words weigh 3 and pairs 1, so reordering moves a note only a few bits.
+    """
+    masked = ["#" if _is_number(token) else token for token in tokens]
+    features = [(word, 3) for word in masked] + [(f"{a} {b}", 1) for a, b in zip(masked, masked[1:])]
+    weights = [0] * _BITS
+    for feature, weight in features:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(_BITS):
+            weights[bit] += weight if digest >> bit & 1 else -weight
+    return sum(1 << bit for bit in range(_BITS) if weights[bit] > 0)
+
+
+def _signed(fingerprint: int) -> int:
+    # SQL BIGINT is signed
+    return fingerprint - (1 << _BITS) if fingerprint >= 1 << (_BITS - 1) else fingerprint
+
+
+def _dump_branches(branches: Dict[str, Any]) -> str:
+    return json.dumps({name: [item.model_dump() for item in value] if name != "concerns" else value
+                       for name, value in branches.items()})
+
+
+def _load_branches(raw: str) -> Dict[str, Any]:
+    branches = json.loads(raw)
+    if "income" in branches:
+        branches["income"] = [Income(**item) for item in branches["income"]]
+    if "expenses" in branches:
+        branches["expenses"] = [Expense(**item) for item in branches["expenses"]]
+    return branches
+
+
+def _items(tokens: List[str]) -> Counter:
+    """
+    Words of a note, and each amount with the word just before it: equal for
+    notes whose items or sentences were merely reordered.
+    """
+    items: Counter = Counter()
+    words: List[str] = []
+    for token in tokens:
+        if _is_number(token):
+            items[(tuple(words[-1:]), token)] += 1
+            words = []
+        else:
+            items[token] += 1
+            words.append(token)
+    return items
+
+
+def _amount_patch(old: List[str], new: List[str]) -> Optional[Dict[float, float]]:
+    """Old amount -> new amount when the notes only differ in some amounts, else None."""
+    if len(old) != len(new):
+        return None
+    patch: Dict[float, float] = {}
+    unchanged = set()
+    for a, b in zip(old, new):
+        if _is_number(a) != _is_number(b) or (not _is_number(a) and a != b):
+            return None
+        if not _is_number(a):
+            continue
+        if a == b:
+            unchanged.add(float(a))
+        elif patch.setdefault(float(a), float(b)) != float(b):
+            return None  # one amount changed into two different ones
+    if unchanged & patch.keys():
+        return None  # an amount that changed in one place and not in another
+    return patch
+
+
+def _patched(items: List[Income] | List[Expense], patch: Dict[float, float], found: set):
+    result = []
+    for item in items:
+        old = next((old for old in patch if math.isclose(item.amount, old, abs_tol=0.005)), None)
+        if old is None:
+            result.append(item)
+        else:
+            found.add(old)
+            result.append(item.model_copy(update={"amount": patch[old]}))
+    return result
+
+
+class _Entry:
+    __slots__ = ("key", "fingerprint", "tokens", "branches", "created_at")
+
+    def __init__(self, key: str, fingerprint: int, tokens: List[str], branches: Dict[str, Any],
+                 created_at: float):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.tokens = tokens
+        self.branches = branches
+        self.created_at = created_at
+
+
+class NoteIndex:
+    """
+    Bounded, persistent near-duplicate index of journal notes.
+    Entries live in memory (least recently used evicted first beyond
+    max_entries) and in a SQLite table that setup() loads at startup.
+    Writes go through a background write-behind queue.
+    Candidates are found with banded fingerprints: with max_distance + 1
+    bands, any fingerprint within max_distance bits shares a whole band.
+    """
+
+    def __init__(self, database_url: str, max_entries: int = 5000, threshold: float = 0.9):
+        self.database_url = database_url
+        self.max_entries = max_entries
+        self.max_distance = int((1 - threshold) * _BITS)
+        bands = self.max_distance + 1
+        bounds = [round(i * _BITS / bands) for i in range(bands + 1)]
+        self._bands = list(zip(bounds, bounds[1:]))
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[int, set]] = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+        self._engine = None
+        self._writer = WriteBehindQueue(self._write, max_batch=200, max_delay=0.05, name="note-index-writer")
+        self._counters = {"exact_hits": 0, "near_hits": 0, "rejected": 0, "misses": 0, "writes": 0}
+
+    def setup(self):
+        """Open the database, load the stored entries and start the writer."""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = create_engine(self.database_url, connect_args={"check_same_thread": False}
+                                           if self.database_url.startswith("sqlite") else {})
+                    metadata.create_all(engine)
+                    with engine.connect() as conn:
+                        rows = conn.execute(select(note_index_table)
+                                            .order_by(note_index_table.c.created_at.desc())
+                                            .limit(self.max_entries)).all()
+                    if len(rows) == self.max_entries:
+                        # Rows that no longer fit were evicted while the index was closed
+                        with engine.begin() as conn:
+                            conn.execute(delete(note_index_table).where(
+                                note_index_table.c.created_at < rows[-1].created_at))
+                    for row in reversed(rows):
+                        self._insert(_Entry(row.key, row.fingerprint % (1 << _BITS), json.loads(row.tokens),
+                                            _load_branches(row.branches), row.created_at))
+                    self._engine = engine
+        self._writer.start()
+        return self._engine
+
+    def close(self) -> None:
+        self._writer.close()
+        if self._engine is not None:
+            self._engine.dispose()
+
+    def _band_keys(self, fingerprint: int):
+        for i, (start, end) in enumerate(self._bands):
+            yield i, fingerprint >> start & ((1 << (end - start)) - 1)
+
+    def _insert(self, entry: _Entry) -> List[str]:
+        """Add an entry (lock held); returns the keys evicted to make room."""
+        self._remove(entry.key)
+        self._entries[entry.key] = entry
+        for i, band in self._band_keys(entry.fingerprint):
+            self._buckets[i].setdefault(band, set()).add(entry.key)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(next(iter(self._entries)))
+            self._remove(evicted[-1])
+        return evicted
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for i, band in self._band_keys(entry.fingerprint):
+            bucket = self._buckets[i].get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[i][band]
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def lookup(self, note: str) -> Optional[Dict[str, Any]]:
+        """Branches reusable for this note (a subset of income, expenses and concerns), or None."""
+        tokens = tokenize(note)
+        if not tokens:
+            return None
+        key = hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()
+        fingerprint = simhash(tokens)
+        with self._lock:
+            exact = self._entries.get(key)
+            if exact is not None:
+                self._entries.move_to_end(key)
+                self._counters["exact_hits"] += 1
+                return dict(exact.branches)
+            candidates = {k for i, band in self._band_keys(fingerprint)
+                          for k in self._buckets[i].get(band, ())}
+            candidates = sorted((bin(self._entries[k].fingerprint ^ fingerprint).count("1"), k)
+                                for k in candidates)
+            candidates = [self._entries[k] for distance, k in candidates if distance <= self.max_distance]
+        for entry in candidates:
+            reused = self._reuse(entry, tokens)
+            if reused:
+                with self._lock:
+                    if entry.key in self._entries:
+                        self._entries.move_to_end(entry.key)
+                    self._counters["near_hits"] += 1
+                return reused
+        self._count("rejected" if candidates else "misses")
+        return None
+
+    def _reuse(self, entry: _Entry, tokens: List[str]) -> Optional[Dict[str, Any]]:
+        if _items(entry.tokens) == _items(tokens):
+            return dict(entry.branches)  # only item order, spacing or punctuation changed
+        patch = _amount_patch(entry.tokens, tokens)
+        if not patch or "income" not in entry.branches or "expenses" not in entry.branches:
+            return None
+        found: set = set()
+        income = _patched(entry.branches["income"], patch, found)
+        expenses = _patched(entry.branches["expenses"], patch, found)
+        if found != patch.keys():
+            return None  # a changed number that is not an extracted amount (a date, "5k", ...)
+        return {"income": income, "expenses": expenses}
+
+    def add(self, note: str, branches: Dict[str, Any]) -> None:
+        """Remember the branches computed for a note, merged with what is already stored for it."""
+        branches = {name: value for name, value in branches.items() if name in BRANCHES and value is not None}
+        tokens = tokenize(note)
+        if not tokens or not branches:
+            return
+        key = hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None:
+                branches = {**current.branches, **branches}
+            entry = _Entry(key, simhash(tokens), tokens, branches, time.time())
+            evicted = self._insert(entry)
+        item = (entry, evicted)
+        try:
+            self._writer.submit(item)
+        except WriterClosed:
+            if self._engine is not None:
+                self._write([item])
+
+    def _write(self, items: List[Tuple[_Entry, List[str]]]) -> List[None]:
+        with self._engine.begin() as conn:
+            for entry, evicted in items:
+                keys = [entry.key, *evicted]
+                conn.execute(delete(note_index_table).where(note_index_table.c.key.in_(keys)))
+                conn.execute(note_index_table.insert().values(
+                    key=entry.key, fingerprint=_signed(entry.fingerprint), tokens=json.dumps(entry.tokens),
+                    branches=_dump_branches(entry.branches), created_at=entry.created_at))
+        with self._lock:
+            self._counters["writes"] += len(items)
+        return [None] * len(items)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries)}
+
+
+class NoteIndexRecorder(BaseCallbackHandler):
+    """
+    Adds the branches of every finished Pipeline run to a NoteIndex.
+    Pipeline runs are the chain runs whose input has a "user_input"; their
+    stage runs are tagged "stage:<name>". The fast_path stage value (branches
+    known without the LLM) is stored along with the branches the LLM computed.
+    Failed runs are not recorded.
+    """
+
+    run_inline = True
+
+    def __init__(self, index: NoteIndex, stages: Tuple[str, ...] = ("fast_path",) + BRANCHES):
+        self.index = index
+        self.stages = stages
+        self._lock = threading.Lock()
+        self._runs: Dict[UUID, Tuple[str, Dict[str, Any]]] = {}  # pipeline run -> (note, branches)
+        self._stage_runs: Dict[UUID, Tuple[UUID, str]] = {}  # stage run -> (pipeline run, stage)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       tags: Optional[List[str]] = None, **kwargs: Any) -> None:
+        stage = next((tag[6:] for tag in tags or () if tag.startswith("stage:")), None)
+        with self._lock:
+            if stage is not None and parent_run_id in self._runs:
+                if stage in self.stages:
+                    self._stage_runs[run_id] = (parent_run_id, stage)
+            elif isinstance(inputs, dict) and isinstance(inputs.get("user_input"), str):
+                self._runs[run_id] = (inputs["user_input"], {})
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            stage_run = self._stage_runs.pop(run_id, None)
+            if stage_run is not None:
+                pipeline_run, stage = stage_run
+                if pipeline_run in self._runs:
+                    branches = self._runs[pipeline_run][1]
+                    if stage == "fast_path":
+                        # Known branches first, so LLM results of the same run win
+                        branches.update({**(outputs or {}), **branches})
+                    else:
+                        branches[stage] = outputs
+                return
+            run = self._runs.pop(run_id, None)
+        if run is not None and run[1]:
+            self.index.add(*run)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._stage_runs.pop(run_id, None)
+            self._runs.pop(run_id, None)
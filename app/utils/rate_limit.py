@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call cannot be admitted within the wait budget."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"LLM rate limit exceeded ({reason}), retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute.
+    The balance may go negative: callers reserve capacity up front and wait
+    for the debt to be repaid, which serves waiters in arrival order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available."""
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class LLMRateLimiter(BaseRateLimiter):
+    """
+    Admission control for the Groq client.
+    Each LLM request takes one request token and an estimated number of LLM
+    tokens (settled against real usage by RateLimitUsageCallback). Calls wait
+    in a bounded queue; when the queue is full or the wait would exceed
+    max_wait_seconds they fail fast with RateLimitExceeded.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_queue: int,
+                 max_wait_seconds: float, estimated_tokens: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.estimated_tokens = estimated_tokens
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._counters = {"admitted": 0, "delayed": 0, "rejected": 0}
+
+    def _reserve(self, blocking: bool) -> Optional[float]:
+        """Reserve capacity and return how long to wait, None if not acquired."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now),
+                       self.tokens.wait_time(self.estimated_tokens, now))
+            if wait > 0:
+                if not blocking:
+                    return None
+                if self._waiting >= self.max_queue:
+                    self._counters["rejected"] += 1
+                    raise RateLimitExceeded(wait, "queue full")
+                if wait > self.max_wait_seconds:
+                    self._counters["rejected"] += 1
+                    raise RateLimitExceeded(wait, "wait exceeds deadline")
+                self._waiting += 1
+                self._counters["delayed"] += 1
+            self.requests.take(1)
+            self.tokens.take(self.estimated_tokens)
+            self._counters["admitted"] += 1
+            return wait
+
+    def _done_waiting(self) -> None:
+        with self._lock:
+            self._waiting -= 1
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        wait = self._reserve(blocking)
+        if wait is None:
+            return False
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        wait = self._reserve(blocking)
+        if wait is None:
+            return False
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+        return True
+
+    def record_usage(self, total_tokens: int) -> None:
+        """Settle the estimate taken at admission against the real token count."""
+        with self._lock:
+            self.tokens.take(total_tokens - self.estimated_tokens)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {**self._counters, "waiting": self._waiting,
+                    "requests_available": round(self.requests.tokens, 2),
+                    "tokens_available": round(self.tokens.tokens, 2)}
+
+
+class RateLimitUsageCallback(BaseCallbackHandler):
+    """Feeds the token usage reported by each LLM response back to the limiter."""
+
+    run_inline = True
+
+    def __init__(self, limiter: LLMRateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        # Cache hits carry no llm_output and were never admitted by the limiter
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("total_tokens"):
+            self.limiter.record_usage(usage["total_tokens"])
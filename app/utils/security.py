@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+import bcrypt
+from starlette.concurrency import run_in_threadpool
+
+from app import config
+from app.models.model import RevokedToken, SessionLocal
+from app.utils.cpu_pool import cpu_pool
+from app.utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+class InvalidToken(ValueError):
+    """Raised for malformed, tampered, expired or revoked session tokens."""
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def check_password(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+# bcrypt runs on the CPU pool so hashing never holds the app worker's GIL
+
+async def ahash_password(password: str) -> str:
+    with timed("bcrypt"):
+        return await cpu_pool.arun(hash_password, password)
+
+
+async def acheck_password(password: str, hashed_password: str) -> bool:
+    with timed("bcrypt"):
+        return await cpu_pool.arun(check_password, password, hashed_password)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(config.SESSION_SECRET.encode("utf-8"), payload.encode("ascii"),
+                               hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, username: str, ttl_seconds: Optional[int] = None) -> Dict:
+    """Signed, expiring session token; returns the token and its claims."""
+    now = int(time.time())
+    claims = {"sub": user_id, "username": username, "jti": uuid.uuid4().hex,
+              "iat": now, "exp": now + (ttl_seconds or config.SESSION_TOKEN_TTL_SECONDS)}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return {"token": f"{payload}.{_sign(payload)}", "claims": claims}
+
+
+def verify_token(token: str) -> Dict:
+    """Claims of a valid token; an HMAC and a set lookup, no bcrypt or DB round-trip."""
+    if not token.isascii():  # neither the HMAC input nor compare_digest take other characters
+        raise InvalidToken("Malformed token")
+    try:
+        payload, signature = token.split(".")
+    except ValueError:
+        raise InvalidToken("Malformed token")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidToken("Invalid token signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidToken("Malformed token")
+    if claims.get("exp", 0) < time.time():
+        raise InvalidToken("Token expired")
+    if revocations.is_revoked(claims.get("jti")):
+        raise InvalidToken("Token revoked")
+    return claims
+
+
+class RevocationList:
+    """
+    Revoked token ids, kept in memory and reloaded from the revoked_token table
+    every refresh_seconds so revocations made by other workers are picked up.
+    Expired rows are pruned by a background task (start()/stop() from the
+    lifespan), not on the request path.
+    """
+
+    def __init__(self, refresh_seconds: int, prune_seconds: int = 3600):
+        self.refresh_seconds = refresh_seconds
+        self.prune_seconds = prune_seconds
+        self._revoked: Set[str] = set()
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # one reload at a time
+        self._pruner_task: Optional[asyncio.Task] = None
+
+    def _refresh(self) -> None:
+        with self._refresh_lock:
+            # Another request may have reloaded while this one waited
+            if time.time() - self._loaded_at <= self.refresh_seconds:
+                return
+            with SessionLocal() as db:
+                revoked = {row.jti for row in db.query(RevokedToken.jti)
+                           .filter(RevokedToken.expires_at >= time.time())}
+            with self._lock:
+                self._revoked = revoked
+                self._loaded_at = time.time()
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if time.time() - self._loaded_at > self.refresh_seconds:
+            self._refresh()
+        return jti in self._revoked
+
+    def revoke(self, claims: Dict) -> None:
+        with SessionLocal() as db:
+            if db.get(RevokedToken, claims["jti"]) is None:
+                db.add(RevokedToken(jti=claims["jti"], expires_at=claims["exp"]))
+                db.commit()
+        with self._lock:
+            self._revoked.add(claims["jti"])
+
+    def prune(self) -> int:
+        """Delete revocations of tokens that have expired anyway; returns the number removed."""
+        with SessionLocal() as db:
+            removed = db.query(RevokedToken).filter(RevokedToken.expires_at < time.time()).delete()
+            db.commit()
+        return removed
+
+    async def start(self) -> None:
+        if self._pruner_task is None:
+            self._pruner_task = asyncio.create_task(self._pruner())
+
+    async def stop(self) -> None:
+        if self._pruner_task is not None:
+            self._pruner_task.cancel()
+            await asyncio.gather(self._pruner_task, return_exceptions=True)
+            self._pruner_task = None
+
+    async def _pruner(self) -> None:
+        while True:
+            try:
+                await run_in_threadpool(self.prune)
+            except Exception:
+                logger.exception("Pruning revoked tokens failed")
+            await asyncio.sleep(self.prune_seconds)
+
+
+revocations = RevocationList(refresh_seconds=config.TOKEN_REVOCATION_REFRESH_SECONDS,
+                             prune_seconds=config.TOKEN_REVOCATION_PRUNE_SECONDS)
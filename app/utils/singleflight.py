@@ -0,0 +1,116 @@
+import asyncio
+import re
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a note share a key."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+    The first caller runs the function, callers arriving while it is in
+    flight wait for and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self._counters = {"executions": 0, "coalesced": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) unless an identical call is already running."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters["executions"] += 1
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Async version of do; fn must return an awaitable."""
+        # Futures belong to one event loop, keep the keys per loop
+        loop_key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(loop_key)
+        if task is None:
+            # The shared work runs as its own task so that a cancelled
+            # caller does not cancel it for everyone else
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tasks[loop_key] = task
+            task.add_done_callback(lambda t: self._finish(loop_key, t))
+            self._count("executions")
+        else:
+            self._count("coalesced")
+        return await asyncio.shield(task)
+
+    def _finish(self, loop_key: Hashable, task: asyncio.Future) -> None:
+        self._tasks.pop(loop_key, None)
+        if not task.cancelled():
+            task.exception()  # mark as retrieved when every caller went away
+
+    def stats(self) -> Dict[str, int]:
+        """Number of executions and of calls saved by coalescing."""
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls) + len(self._tasks)}
+
+
+class CoalescedRunnable(Runnable[Dict[str, Any], Any]):
+    """
+    Wraps a runnable so that concurrent invocations with the same key share
+    one execution. batch/abatch go through invoke/ainvoke and are coalesced
+    as well.
+    """
+
+    def __init__(self, runnable: Runnable, flight: SingleFlight,
+                 key: Callable[[Any], Hashable], name: Optional[str] = None):
+        self.runnable = runnable
+        self.flight = flight
+        self.key = key
+        self.name = name or runnable.get_name()
+
+    def _flight_key(self, input: Any) -> Hashable:
+        return (self.name, self.key(input))
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.flight.do(self._flight_key(input), self.runnable.invoke, input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self.flight.ado(self._flight_key(input), self.runnable.ainvoke, input, config, **kwargs)
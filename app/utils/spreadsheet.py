@@ -1,6 +1,8 @@
-import pandas as pd
+import csv
+import io
 import os
-from typing import Dict
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 def generate_budget_spreadsheet(data: Dict, file_name: str) -> str:
@@ -8,6 +10,9 @@ def generate_budget_spreadsheet(data: Dict, file_name: str) -> str:
     Generate a structured spreadsheet from budget data.
     Returns the file path of the saved spreadsheet.
     """
+    # pandas is only needed here, keep it out of startup
+    import pandas as pd
+
     try:
         # Ensure the directory exists
         os.makedirs("./generated_budgets", exist_ok=True)
@@ -27,3 +32,228 @@ def generate_budget_spreadsheet(data: Dict, file_name: str) -> str:
         return file_path
     except Exception as e:
         raise RuntimeError(f"Error generating spreadsheet: {str(e)}")
+
+
+# Streaming budget exports
+# ------------------------
+# Line items are consumed from iterables and written row by row, so the
+# export never holds a DataFrame or a fully built workbook in memory.
+
+EXPORT_FORMATS = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+_ACCEPT_TYPES = {
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/vnd.apache.parquet": "parquet",
+    "application/parquet": "parquet",
+    "application/x-parquet": "parquet",
+}
+
+# Formats whose file is complete before the first byte; written to a file on the CPU pool
+BUFFERED_FORMATS = frozenset({"xlsx", "parquet"})
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024  # exports larger than this are spooled to disk
+PARQUET_ROW_GROUP = 10000
+
+
+class ExportFormatError(ValueError):
+    """Raised for unknown export formats or formats whose library is missing."""
+
+
+def negotiate_export_format(format: Optional[str] = None, accept: Optional[str] = None) -> str:
+    """
+    Pick an export format from an explicit ?format= value or the Accept header.
+    Defaults to xlsx when neither names a supported format.
+    """
+    if format:
+        format = format.lower()
+        if format not in EXPORT_FORMATS:
+            raise ExportFormatError(f"Unsupported export format: {format}")
+        return format
+    if accept:
+        ranked = []
+        for position, part in enumerate(accept.split(",")):
+            media_type, _, params = part.strip().partition(";")
+            quality = 1.0
+            for param in params.split(";"):
+                key, _, value = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if media_type.strip().lower() in _ACCEPT_TYPES and quality > 0:
+                ranked.append((-quality, position, _ACCEPT_TYPES[media_type.strip().lower()]))
+        if ranked:
+            return min(ranked)[2]
+    return "xlsx"
+
+
+def export_headers(format: str, file_name: str = "budget") -> Dict[str, str]:
+    return {"Content-Disposition": f"attachment; filename={file_name}.{EXPORT_FORMATS[format][1]}"}
+
+
+def export_media_type(format: str) -> str:
+    return EXPORT_FORMATS[format][0]
+
+
+def _item_row(item) -> Tuple[str, float, str]:
+    label = item.source if hasattr(item, "source") else item.category
+    return label, float(item.amount), item.period
+
+
+def _read_chunks(spool) -> Iterator[bytes]:
+    spool.seek(0)
+    try:
+        while chunk := spool.read(CHUNK_SIZE):
+            yield chunk
+    finally:
+        spool.close()
+
+
+def write_budget_xlsx(incomes: Iterable, expenses: Iterable, file) -> None:
+    """
+    Workbook with Income, Expenses and Summary sheets, written to a binary
+    file with openpyxl's write-only mode.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    totals = []
+    for title, header, items in (("Income", "Source", incomes), ("Expenses", "Category", expenses)):
+        sheet = workbook.create_sheet(title=title)
+        sheet.append([header, "Amount", "Period"])
+        total = 0.0
+        for item in items:
+            row = _item_row(item)
+            total += row[1]
+            sheet.append(row)
+        totals.append(total)
+
+    summary = workbook.create_sheet(title="Summary")
+    summary.append(["Total Income", totals[0]])
+    summary.append(["Total Expenses", totals[1]])
+    summary.append(["Savings", totals[0] - totals[1]])
+    workbook.save(file)
+
+
+def iter_budget_xlsx(incomes: Iterable, expenses: Iterable) -> Iterator[bytes]:
+    """
+    The workbook of write_budget_xlsx in chunks. The zip container can only
+    be produced once every row is written, so the output is spooled (in
+    memory up to SPOOL_SIZE, on disk beyond) and then yielded.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    write_budget_xlsx(incomes, expenses, spool)
+    yield from _read_chunks(spool)
+
+
+def iter_budget_csv(incomes: Iterable, expenses: Iterable) -> Iterator[bytes]:
+    """Single table of Type, Label, Amount, Period rows followed by the totals."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Type", "Label", "Amount", "Period"])
+    totals = {"income": 0.0, "expense": 0.0}
+    for kind, items in (("income", incomes), ("expense", expenses)):
+        for item in items:
+            label, amount, period = _item_row(item)
+            totals[kind] += amount
+            writer.writerow([kind, label, amount, period])
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    writer.writerow(["summary", "Total Income", totals["income"], ""])
+    writer.writerow(["summary", "Total Expenses", totals["expense"], ""])
+    writer.writerow(["summary", "Savings", totals["income"] - totals["expense"], ""])
+    yield buffer.getvalue().encode("utf-8")
+
+
+def write_budget_csv(incomes: Iterable, expenses: Iterable, file) -> None:
+    """The CSV export written to a binary file."""
+    for chunk in iter_budget_csv(incomes, expenses):
+        file.write(chunk)
+
+
+def write_budget_parquet(incomes: Iterable, expenses: Iterable, file) -> None:
+    """Same rows as the CSV export written in row groups to a binary file; needs pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportFormatError("Parquet export requires the pyarrow package")
+
+    schema = pa.schema([("type", pa.string()), ("label", pa.string()),
+                        ("amount", pa.float64()), ("period", pa.string())])
+    with pq.ParquetWriter(file, schema) as writer:
+        rows: List[Tuple[str, str, float, str]] = []
+        for kind, items in (("income", incomes), ("expense", expenses)):
+            for item in items:
+                rows.append((kind, *_item_row(item)))
+                if len(rows) >= PARQUET_ROW_GROUP:
+                    writer.write_table(pa.Table.from_pylist(
+                        [dict(zip(schema.names, row)) for row in rows], schema=schema))
+                    rows.clear()
+        if rows:
+            writer.write_table(pa.Table.from_pylist(
+                [dict(zip(schema.names, row)) for row in rows], schema=schema))
+
+
+def iter_budget_parquet(incomes: Iterable, expenses: Iterable) -> Iterator[bytes]:
+    """The file of write_budget_parquet, spooled like the xlsx export and yielded in chunks."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    write_budget_parquet(incomes, expenses, spool)
+    yield from _read_chunks(spool)
+
+
+def iter_budget_export(incomes: Iterable, expenses: Iterable, format: str = "xlsx") -> Iterator[bytes]:
+    """Byte chunks of a budget export in the given format."""
+    if format == "csv":
+        return iter_budget_csv(incomes, expenses)
+    if format == "parquet":
+        # Fail before the response starts when pyarrow is not installed
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportFormatError("Parquet export requires the pyarrow package")
+        return iter_budget_parquet(incomes, expenses)
+    if format == "xlsx":
+        return iter_budget_xlsx(incomes, expenses)
+    raise ExportFormatError(f"Unsupported export format: {format}")
+
+
+def write_budget_export(incomes: Iterable, expenses: Iterable, format: str = "xlsx",
+                        directory: Optional[str] = None) -> str:
+    """
+    Write an export to a new file in directory (the temp directory by
+    default) and return its path. Run in a CPU pool worker: the rows are
+    written as they are read and only the path goes back, so memory stays
+    flat however large the export is.
+    """
+    writers = {"xlsx": write_budget_xlsx, "parquet": write_budget_parquet, "csv": write_budget_csv}
+    if format not in writers:
+        raise ExportFormatError(f"Unsupported export format: {format}")
+    fd, path = tempfile.mkstemp(prefix="budget-export-", suffix=f".{EXPORT_FORMATS[format][1]}", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            writers[format](incomes, expenses, file)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def iter_export_file(path: str) -> Iterator[bytes]:
+    """Chunks of a file written by write_budget_export, deleted once read (or abandoned)."""
+    try:
+        with open(path, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                yield chunk
+    finally:
+        os.unlink(path)
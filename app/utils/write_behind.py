@@ -0,0 +1,135 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+_STOP = object()
+
+
+class QueueFull(Exception):
+    """The writer already holds max_queue pending items."""
+
+
+class WriterClosed(Exception):
+    """The writer is not running: not started yet, or closed (e.g. during shutdown)."""
+
+
+class WriteBehindQueue:
+    """
+    Groups writes from many requests into one transaction.
+    submit() queues an item and returns a future; a single background thread
+    takes everything queued (up to max_batch items, waiting at most
+    max_delay seconds for more) and passes it to write_batch, which returns
+    one result per item. Every future gets its item's result, or the
+    exception when the batch fails (or when the item's result is an
+    exception instance). close() writes what is still queued; submit() raises
+    WriterClosed once it has started, so callers can write directly instead.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Any]], List[Any]], max_batch: int = 100,
+                 max_delay: float = 0.005, max_queue: int = 10000, name: str = "write-behind"):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._counters = {"batches": 0, "written": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting items and wait until every queued item is written."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        with self._lock:
+            # Under the lock close() takes, so an accepted item is queued before its stop marker
+            if not self.running:
+                raise WriterClosed(f"{self.name} is not running")
+            try:
+                self._queue.put_nowait((item, future))
+            except queue.Full:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"{self.name} queue is full")
+        return future
+
+    async def awrite(self, item: Any) -> Any:
+        """Queue an item and wait for its result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _collect(self, first) -> tuple:
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                # Take what is already queued, then linger up to max_delay for more
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if pending is _STOP:
+                return batch, True
+            batch.append(pending)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while True:
+            try:
+                first = self._queue.get(timeout=0.1 if stopping else None)
+            except queue.Empty:
+                return  # stopped and drained
+            if first is _STOP:
+                stopping = True
+                continue
+            batch, stop = self._collect(first)
+            stopping = stopping or stop
+            self._write([item for item, _ in batch], [future for _, future in batch])
+
+    def _write(self, items: List[Any], futures: List[Future]) -> None:
+        try:
+            results = self.write_batch(items)
+        except BaseException as e:
+            self._count("failed", len(items))
+            for future in futures:
+                future.set_exception(e)
+            return
+        failed = [isinstance(result, BaseException) for result in results]
+        self._count("batches")
+        self._count("written", len(items) - sum(failed))
+        self._count("failed", sum(failed))
+        for future, result, error in zip(futures, results, failed):
+            if error:
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "queued": self._queue.qsize()}
@@ -0,0 +1,174 @@
+"""
+Offline load benchmark for the API endpoints.
+
+Runs the app in-process over ASGI with ChatGroq replaced by the fake model
+from benchmarks/fake_llm.py, so results do not depend on Groq quota or the
+network. For every endpoint and concurrency level it reports p50/p95/p99
+latency, throughput and the peak RSS of the process.
+
+    python -m benchmarks.bench_endpoints
+    python -m benchmarks.bench_endpoints --endpoints advice user-advice --concurrency 1 16 64 \
+        --requests 128 --latency lognormal --latency-mean 0.4 --json results.json
+
+Requires httpx (already needed by FastAPI's TestClient).
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+from benchmarks import fake_llm
+from benchmarks.harness import peak_rss_mb, percentile, prepare_app, print_table
+
+NOTE = ("This month I earned {salary} from my salary and about 650 from freelance design work. "
+        "Rent is 1450, groceries around 420, transport 160 and utilities 210. "
+        "I pay 900 a year for car insurance and have no savings yet. (entry {n})")
+
+ENDPOINTS = ("advice", "download-budget", "user-advice", "create-budget-with-advice", "history")
+
+
+def journal_note(n: int) -> str:
+    # Every request gets its own note so coalescing and caches do not hide the work
+    return NOTE.format(salary=5000 + n, n=n)
+
+
+class Session:
+    """A registered and logged in benchmark user with some stored journals"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.headers: Dict[str, str] = {}
+        self.journal_ids: List[int] = []
+
+    async def setup(self, journals: int) -> None:
+        credentials = {"username": "bench", "password": "bench-password"}
+        response = await self.client.post("/register", json={**credentials, "first_name": "Bench",
+                                                             "last_name": "User", "image": None})
+        response.raise_for_status()
+        response = await self.client.post("/login", data=credentials)
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        for n in range(journals):
+            response = await self.client.post("/user-advice", headers=self.headers,
+                                              json={"message": journal_note(-1 - n)})
+            response.raise_for_status()
+            self.journal_ids.append(response.json()["Financial history Id"])
+
+
+def scenarios(session: Session, export_format: str) -> Dict[str, Callable[[int], Awaitable[httpx.Response]]]:
+    client = session.client
+
+    def advice(n):
+        return client.post("/advice", json={"message": journal_note(n)})
+
+    def download_budget(n):
+        return client.post("/download-budget", params={"format": export_format},
+                           json={"message": journal_note(n)})
+
+    def user_advice(n):
+        return client.post("/user-advice", headers=session.headers, json={"message": journal_note(n)})
+
+    def create_budget(n):
+        journal_id = session.journal_ids[n % len(session.journal_ids)]
+        return client.post("/create-budget-with-advice", headers=session.headers,
+                           params={"format": export_format}, json={"journal_id": str(journal_id)})
+
+    def history(n):
+        return client.post("/get-all-finance-record/advice", headers=session.headers,
+                           params={"limit": 50})
+
+    return {
+        "advice": advice,
+        "download-budget": download_budget,
+        "user-advice": user_advice,
+        "create-budget-with-advice": create_budget,
+        "history": history,
+    }
+
+
+async def run_level(request: Callable[[int], Awaitable[httpx.Response]], concurrency: int,
+                    total: int, offset: int) -> Dict:
+    """Send `total` requests keeping `concurrency` of them in flight"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(offset, offset + total))
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            start = time.perf_counter()
+            response = await request(n)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    ms = [1000 * latency for latency in latencies] or [float("nan")]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentile(ms, 50), 1),
+        "p95_ms": round(percentile(ms, 95), 1),
+        "p99_ms": round(percentile(ms, 99), 1),
+        "req_per_s": round(len(latencies) / wall, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+async def main(args) -> List[Dict]:
+    latency = fake_llm.LatencyModel(args.latency, mean=args.latency_mean,
+                                    jitter=args.latency_jitter, sigma=args.latency_sigma,
+                                    seed=args.seed)
+    module = prepare_app(latency, llm_cache=args.llm_cache, export_cache=args.export_cache)
+    transport = httpx.ASGITransport(app=module.app)
+    results = []
+    async with module.app.router.lifespan_context(module.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        session = Session(client)
+        await session.setup(args.journals)
+        requests = scenarios(session, args.format)
+        offset = 0
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                row = await run_level(requests[endpoint], concurrency, args.requests, offset)
+                offset += args.requests
+                results.append({"endpoint": endpoint, **row})
+                print_table([results[-1]], list(results[-1]))
+                print()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--journals", type=int, default=20, help="journals stored before the run")
+    parser.add_argument("--format", default="xlsx", help="export format for the budget endpoints")
+    parser.add_argument("--latency", default="lognormal", choices=["constant", "uniform", "lognormal"])
+    parser.add_argument("--latency-mean", type=float, default=0.25, help="seconds per LLM call")
+    parser.add_argument("--latency-jitter", type=float, default=0.1)
+    parser.add_argument("--latency-sigma", type=float, default=0.35)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM response cache on")
+    parser.add_argument("--export-cache", action="store_true", help="keep the export cache on")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    print("Summary")
+    print_table(results, list(results[0]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
@@ -0,0 +1,86 @@
+"""
+Microbenchmarks for budget exports with large numbers of line items.
+
+Times app.main.generate_budget_spreadsheet and the streaming exporters for
+each export format, and records the peak Python allocation of one run of
+each (tracemalloc).
+
+    python -m benchmarks.bench_spreadsheet
+    python -m benchmarks.bench_spreadsheet --items 1000 100000 --repeat 3 --formats xlsx csv
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.harness import peak_rss_mb, prepare_app, print_table
+
+
+def line_items(count: int, Income, Expense):
+    """`count` line items split evenly between incomes and expenses"""
+    periods = ("monthly", "weekly", "yearly")
+    incomes = [Income(source=f"Income source {n}", amount=1000 + n % 997, period=periods[n % 3])
+               for n in range(count // 2)]
+    expenses = [Expense(category=f"Expense category {n}", amount=10 + n % 541, period=periods[n % 3])
+                for n in range(count - count // 2)]
+    return incomes, expenses
+
+
+def measure(fn: Callable[[], int], repeat: int) -> Dict:
+    size = fn()  # warm up, and the output size
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "best_ms": round(1000 * min(timings), 1),
+        "mean_ms": round(1000 * statistics.mean(timings), 1),
+        "output_kb": round(size / 1024, 1),
+        "peak_alloc_mb": round(peak / (1024 * 1024), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main(args) -> List[Dict]:
+    module = prepare_app()
+    results = []
+    for count in args.items:
+        incomes, expenses = line_items(count, module.Income, module.Expense)
+        cases = {"generate_budget_spreadsheet":
+                 lambda: sum(len(chunk) for chunk in
+                             module.iter_export_file(module.generate_budget_spreadsheet(incomes, expenses)))}
+        for export_format in args.formats:
+            cases[f"iter_budget_export[{export_format}]"] = (
+                lambda f=export_format: sum(len(chunk) for chunk in
+                                            module.iter_budget_export(incomes, expenses, f)))
+        for name, fn in cases.items():
+            results.append({"case": name, "items": count, **measure(fn, args.repeat)})
+            print_table([results[-1]], list(results[-1]))
+            print()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", nargs="+", type=int, default=[100, 10_000, 100_000])
+    parser.add_argument("--formats", nargs="+", default=["xlsx", "csv", "parquet"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = main(args)
+    print("Summary")
+    print_table(results, list(results[0]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
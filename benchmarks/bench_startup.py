@@ -0,0 +1,84 @@
+"""
+Startup-time budget for a worker.
+
+Imports app.main and runs the app lifespan in fresh interpreters, the way a
+new uvicorn worker starts, and fails (exit status 1) when the median import
+or startup time exceeds its budget. It also fails when importing app.main
+loads a module that should only load on demand, or touches the database.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --import-budget-ms 1500 --startup-budget-ms 2500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Loaded on first export or by the lifespan, never by the import
+LAZY_MODULES = ("pandas", "openpyxl", "pyarrow", "langchain_groq", "groq")
+
+PROBE = """
+import asyncio, json, os, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+loaded = [name for name in {lazy!r} if name in sys.modules]
+files = sorted(os.listdir("."))
+
+async def startup():
+    async with app.main.app.router.lifespan_context(app.main.app):
+        return time.perf_counter()
+
+started = asyncio.run(startup())
+print(json.dumps({{"import_ms": 1000 * (imported - start), "startup_ms": 1000 * (started - start),
+                  "lifespan_ms": 1000 * (started - imported), "loaded_at_import": loaded,
+                  "files_at_import": files}}))
+"""
+
+
+def probe(repo: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix="budget-startup-")
+    env = {**os.environ, "PYTHONPATH": repo, "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "startup-probe"),
+           "DATABASE_URL": "sqlite:///startup.db", "LLM_CACHE_DATABASE_URL": "sqlite:///llm_cache.db"}
+    output = subprocess.run([sys.executable, "-c", PROBE.format(lazy=LAZY_MODULES)], cwd=workdir,
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args) -> int:
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    probe(repo)  # warm the bytecode cache
+    runs = [probe(repo) for _ in range(args.runs)]
+    result = {key: round(statistics.median(run[key] for run in runs), 1)
+              for key in ("import_ms", "lifespan_ms", "startup_ms")}
+    print(json.dumps(result))
+
+    failures = []
+    if result["import_ms"] > args.import_budget_ms:
+        failures.append(f"import took {result['import_ms']} ms, budget {args.import_budget_ms} ms")
+    if result["startup_ms"] > args.startup_budget_ms:
+        failures.append(f"startup took {result['startup_ms']} ms, budget {args.startup_budget_ms} ms")
+    loaded = sorted({name for run in runs for name in run["loaded_at_import"]})
+    if loaded:
+        failures.append(f"importing app.main loaded {', '.join(loaded)}")
+    files = sorted({name for run in runs for name in run["files_at_import"]})
+    if files:
+        failures.append(f"importing app.main created {', '.join(files)}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=2000)
+    parser.add_argument("--startup-budget-ms", type=float, default=3000)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
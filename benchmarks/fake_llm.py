@@ -0,0 +1,174 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Canned answers shaped like what llama-3.3 returns for each prompt of the pipeline
+INCOMES = [
+    {"source": "Salary", "amount": 5200.0, "period": "monthly"},
+    {"source": "Freelance design", "amount": 650.0, "period": "monthly"},
+    {"source": "Dividends", "amount": 1800.0, "period": "yearly"},
+]
+EXPENSES = [
+    {"category": "Rent", "amount": 1450.0, "period": "monthly"},
+    {"category": "Groceries", "amount": 420.0, "period": "monthly"},
+    {"category": "Transport", "amount": 160.0, "period": "monthly"},
+    {"category": "Utilities", "amount": 210.0, "period": "monthly"},
+    {"category": "Car insurance", "amount": 900.0, "period": "yearly"},
+]
+INSIGHT = (
+    "**Income:** a monthly salary of $5,200, freelance design work bringing in about $650 a month "
+    "and $1,800 of yearly dividends.\n"
+    "**Expenses:** rent $1,450, groceries $420, transport $160, utilities $210 and car insurance "
+    "of $900 per year.\n"
+    "**Concerns:** no emergency fund, irregular freelance income and rising rent."
+)
+CONCERNS = (
+    "1. No emergency fund to absorb unexpected costs.\n"
+    "2. Freelance income is irregular.\n"
+    "3. Rent takes more than a quarter of take-home pay."
+)
+ADVICE = (
+    "1. Build an emergency fund covering three to six months of expenses.\n"
+    "2. Budget on the salary alone and save freelance income as it arrives.\n"
+    "3. Set aside $75 a month for the yearly car insurance premium.\n"
+    "4. Review the lease before renewal and compare rents nearby."
+)
+SUMMARY = (
+    "| Category | Monthly amount |\n|---|---|\n"
+    "| Income | $5,850 |\n| Rent | $1,450 |\n| Groceries | $420 |\n"
+    "| Transport | $160 |\n| Utilities | $210 |\n| Insurance | $75 |\n"
+    "| **Surplus** | **$3,535** |"
+)
+
+
+def canned_answer(prompt: str, json_mode: bool) -> str:
+    """Answer for one pipeline prompt, picked from its wording"""
+    text = prompt.lower()
+    if "webpage" in text:
+        # The format prompt echoes its input back as HTML
+        body = prompt.split("formatted input:", 1)[-1].strip()
+        return "<div>" + body.replace("\n", "<br>") + "</div>"
+    if "extract the income" in text:
+        return json.dumps({"incomes": INCOMES}) if json_mode else "\n".join(
+            f"{i['source']}: ${i['amount']:,.0f} {i['period']}" for i in INCOMES)
+    if "expense categories" in text:
+        return json.dumps({"expenses": EXPENSES}) if json_mode else "\n".join(
+            f"{e['category']}: ${e['amount']:,.0f} {e['period']}" for e in EXPENSES)
+    if "financial concerns" in text and "identify" in text:
+        return CONCERNS
+    if "financial insight" in text:
+        return INSIGHT
+    if "financial advice" in text:
+        return ADVICE
+    if "structured budget" in text:
+        return SUMMARY
+    return "Noted."
+
+
+class LatencyModel:
+    """
+    Seeded latency distribution for fake LLM calls, in seconds.
+    kind is "constant" (mean), "uniform" (mean +/- jitter) or "lognormal"
+    (median mean, shape sigma) which has the long tail of a real API.
+    """
+
+    def __init__(self, kind: str = "lognormal", mean: float = 0.25, jitter: float = 0.1,
+                 sigma: float = 0.35, seed: int = 0):
+        if kind not in ("constant", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.kind = kind
+        self.mean = mean
+        self.jitter = jitter
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "constant":
+                return self.mean
+            if self.kind == "uniform":
+                return max(0.0, self._random.uniform(self.mean - self.jitter, self.mean + self.jitter))
+            return self._random.lognormvariate(0.0, self.sigma) * self.mean
+
+    def __repr__(self):
+        return f"LatencyModel({self.kind!r}, mean={self.mean}, jitter={self.jitter}, sigma={self.sigma})"
+
+
+# Shared by every FakeChatGroq; set with install()
+latency = LatencyModel()
+
+
+class FakeChatGroq(BaseChatModel):
+    """
+    Local stand-in for ChatGroq.
+    Accepts the ChatGroq constructor arguments used by app.main, sleeps for
+    a sampled latency and returns canned answers. Cache, rate limiter and
+    callbacks behave as they do with the real client.
+    """
+
+    model_name: str = "fake-llama"
+    temperature: float = 0.2
+
+    def __init__(self, api_key: Any = None, model: str = "fake-llama", temperature: float = 0.2,
+                 max_retries: int = 0, **kwargs: Any):
+        super().__init__(model_name=model, temperature=temperature, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    def _answer(self, messages: List[BaseMessage], kwargs: Dict[str, Any]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        return canned_answer(prompt, json_mode=kwargs.get("response_format") is not None)
+
+    def _result(self, messages: List[BaseMessage], content: str) -> ChatResult:
+        # Roughly four characters per token, like the usage Groq reports
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))],
+                          llm_output={"token_usage": usage, "model_name": self.model_name})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(latency.sample())
+        return self._result(messages, self._answer(messages, kwargs))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(latency.sample())
+        return self._result(messages, self._answer(messages, kwargs))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        words = self._answer(messages, kwargs).split(" ")
+        delay = latency.sample() / max(len(words), 1)
+        for word in words:
+            await asyncio.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def install(model: Optional[LatencyModel] = None) -> None:
+    """
+    Replace ChatGroq with FakeChatGroq.
+    Must run before app.main is imported, the chains bind the llm at import.
+    """
+    global latency
+    import langchain_groq
+
+    if model is not None:
+        latency = model
+    langchain_groq.ChatGroq = FakeChatGroq
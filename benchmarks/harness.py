@@ -0,0 +1,55 @@
+import os
+import resource
+import sys
+import tempfile
+from typing import Dict, List, Optional, Sequence
+
+from benchmarks import fake_llm
+
+
+def prepare_app(latency: Optional[fake_llm.LatencyModel] = None, llm_cache: bool = False,
+                export_cache: bool = False, workdir: Optional[str] = None):
+    """
+    Import app.main against a throwaway SQLite database and the fake LLM.
+    Response caches are off by default so every request pays for the work
+    it would do on a cold key; the Groq rate limiter is always off.
+    """
+    if "app.main" in sys.modules:
+        raise RuntimeError("app.main was imported before the benchmark could swap the LLM")
+    workdir = workdir or tempfile.mkdtemp(prefix="budget-bench-")
+    os.environ.update({
+        "GROQ_API_KEY": "fake",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LLM_CACHE_ENABLED": "true" if llm_cache else "false",
+        "LLM_CACHE_DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'llm_cache.db')}",
+        "LLM_RATE_LIMIT_ENABLED": "false",
+        "SESSION_SECRET": "benchmark",
+    })
+    if not export_cache:
+        os.environ["EXPORT_CACHE_MAX_ENTRY_BYTES"] = "0"
+    fake_llm.install(latency)
+
+    import app.main
+    return app.main
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100.0 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def print_table(rows: List[Dict], columns: Sequence[str]) -> None:
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    print("  ".join("-" * widths[c] for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The app is run from the repository root (uvicorn app.main:app)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Settings are read when app.config is imported: throwaway databases, no Groq
+# limits or caches shared between tests, threads instead of worker processes
+_workdir = tempfile.mkdtemp(prefix="budget-tests-")
+os.environ.update({
+    "GROQ_API_KEY": "test",
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    "LLM_CACHE_ENABLED": "false",
+    "LLM_CACHE_DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'llm_cache.db')}",
+    "LLM_RATE_LIMIT_ENABLED": "false",
+    "NEAR_DUPLICATE_ENABLED": "false",
+    "SESSION_SECRET": "test",
+    "CPU_POOL_PROCESSES": "false",
+    "JOB_RESULTS_DIR": os.path.join(_workdir, "job_results"),
+})
+
+
+@pytest.fixture(scope="session")
+def database():
+    """SessionLocal bound to a fresh SQLite database for the whole test run"""
+    from app.models.model import dispose_db, init_db
+
+    engine = init_db()
+    yield engine
+    dispose_db()
+
+
+@pytest.fixture(scope="session")
+def app_main(database):
+    """app.main with the benchmarks' fake Groq client (canned answers, 20 ms per call)"""
+    from benchmarks import fake_llm
+
+    fake_llm.install(fake_llm.LatencyModel("constant", mean=0.02))
+    import app.main
+
+    return app.main
+
+
+@pytest.fixture
+def run_app(app_main):
+    """run_app(scenario) runs `await scenario(client)` inside the app lifespan"""
+    import httpx
+
+    def run(scenario):
+        async def main():
+            async with app_main.app.router.lifespan_context(app_main.app):
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app),
+                                             base_url="http://test") as client:
+                    return await scenario(client)
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from benchmarks import fake_llm
+
+# Prose, so the local parser leaves it to the LLM stages
+NOTE = "I earn a salary and do some freelance work; rent keeps going up and I never manage to save."
+
+
+class StageTimes(BaseCallbackHandler):
+    """Start and end time of every pipeline stage run"""
+
+    def __init__(self):
+        self.runs = {}
+        self.times = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, **kwargs):
+        stage = next((tag[len("stage:"):] for tag in tags or () if tag.startswith("stage:")), None)
+        if stage is not None and stage not in self.times:
+            self.runs[run_id] = stage
+            self.times[stage] = [time.perf_counter(), None]
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if run_id in self.runs:
+            self.times[self.runs.pop(run_id)][1] = time.perf_counter()
+
+
+def test_advice_returns_the_formatted_advice_and_summary(run_app):
+    async def scenario(client):
+        return await client.post("/advice", json={"message": NOTE})
+
+    response = run_app(scenario)
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body) == {"Financial Advice", "Budget Summary"}
+    # Each value went through the format prompt (the fake echoes it as HTML)
+    assert body["Financial Advice"].startswith("<div>")
+    assert fake_llm.ADVICE.splitlines()[0] in body["Financial Advice"]
+    assert body["Budget Summary"].startswith("<div>")
+    assert "| Category | Monthly amount |" in body["Budget Summary"]
+
+
+def test_advice_and_summary_run_concurrently(app_main):
+    times = StageTimes()
+    result = asyncio.run(app_main.anonymous_advice_pipeline.ainvoke(
+        {"user_input": NOTE}, config={"callbacks": [times]}))
+    assert set(result) == {"formatted_advice", "formatted_summary"}
+    (advice_start, advice_end), (summary_start, summary_end) = times.times["advice"], times.times["summary"]
+    assert advice_start < summary_end and summary_start < advice_end
+    # Each format call starts once its own input is ready, before the other branch is formatted
+    assert times.times["formatted_advice"][0] >= advice_end
+    assert times.times["formatted_summary"][0] >= summary_end
@@ -0,0 +1,37 @@
+from app.models.advice import Expense, Income
+from app.utils.budget_parser import merge_line_items
+from app.utils.chunking import split_note
+
+NOTE = "\n\n".join(f"2024-{month:02d}-01\nSalary: 5000\nRent: 1200" for month in range(1, 13))
+
+
+def test_split_note_keeps_every_line_once():
+    for size in (40, 100, 300, 10000):
+        chunks = split_note(NOTE, size, 12)
+        assert " ".join(chunks).split() == NOTE.split()
+
+
+def test_merge_keeps_repeats_inside_and_across_chunks():
+    salary = Income(source="Salary", amount=5000, period="monthly")
+    bonus = Income(source="Bonus", amount=800, period="one-off")
+    assert merge_line_items([[salary, bonus], [salary, salary], []]) == [salary, bonus, salary, salary]
+
+
+def test_merge_drops_the_item_repeated_on_both_sides_of_a_boundary():
+    rent = Expense(category="Rent", amount=1200, period="monthly")
+    same_rent = Expense(category="  rent ", amount=1200.001, period="monthly")
+    food = Expense(category="Food", amount=300, period="monthly")
+    assert merge_line_items([[food, rent], [same_rent, food], [], [food]]) == [food, rent, food]
+    # Same label but another amount or period is a different item
+    yearly_rent = Expense(category="Rent", amount=1200, period="yearly")
+    assert merge_line_items([[rent], [yearly_rent]]) == [rent, yearly_rent]
+
+
+
+def test_merged_chunks_give_one_deduplicated_list():
+    salary = Income(source="Salary", amount=5000, period="monthly")
+    freelance = Income(source="Freelance", amount=700, period="monthly")
+    # A block cut in two: its last line was extracted from both chunks
+    groups = [[salary, freelance], [freelance], [salary, salary]]
+    assert merge_line_items(groups) == [salary, freelance, salary, salary]
+    assert sum(item.amount for item in merge_line_items(groups)) == 15700
@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from app.models.advice import BudgetRequest, Expense, Income
+from app.services.budget_service import _message, generate_budget, generate_budgets
+from app.utils.budget_parser import MONTHLY_FACTORS, normalize_label
+
+LABELS = ["Salary", "salary ", "Rent", "RENT", "Groceries", "Freelance", "Insurance", "Gym"]
+PERIODS = ["monthly", "weekly", "yearly", "one-off", "fortnightly"]
+
+
+def loop_budget(request: BudgetRequest) -> dict:
+    """Reference: one line item at a time, in plain Python"""
+    totals = {"income": 0.0, "expense": 0.0}
+    details, keys = {}, {}
+    for kind, items in (("income", [(i.source, i.amount, i.period) for i in request.incomes]),
+                        ("expense", [(e.category, e.amount, e.period) for e in request.expenses])):
+        for label, amount, period in items:
+            monthly = amount * MONTHLY_FACTORS.get(period, 1.0)
+            totals[kind] += monthly
+            key = keys.setdefault((kind, normalize_label(label)), label.strip())
+            details[(kind, key)] = details.get((kind, key), 0.0) + monthly
+    net = totals["income"] - totals["expense"]
+    rate = net * 100 / totals["income"] if totals["income"] > 0 else 0.0
+    named = {}
+    for (kind, label), total in details.items():
+        if label in named:
+            label = f"{label} ({kind})"
+        named[label] = round(total, 2)
+    return {"summary": {"total_income": round(totals["income"], 2), "total_expenses": round(totals["expense"], 2),
+                        "net_savings": round(net, 2), "savings_rate": round(rate, 2)},
+            "details": named, "message": _message(round(rate, 2), round(totals["income"], 2))}
+
+
+def random_request(rng: random.Random, user: int) -> BudgetRequest:
+    def items(model, field):
+        return [model(**{field: rng.choice(LABELS), "amount": round(rng.uniform(0, 5000), 2),
+                         "period": rng.choice(PERIODS)}) for _ in range(rng.randint(0, 12))]
+    return BudgetRequest(user_id=str(user), incomes=items(Income, "source"), expenses=items(Expense, "category"))
+
+
+def test_vectorized_budgets_match_the_per_item_loop():
+    rng = random.Random(21)
+    requests = [random_request(rng, user) for user in range(200)]
+    for request, response in zip(requests, generate_budgets(requests)):
+        expected = loop_budget(request)
+        assert response.summary.model_dump() == pytest.approx(expected["summary"], abs=0.011)
+        assert response.details == pytest.approx(expected["details"], abs=0.011)
+        assert response.message == expected["message"]
+        # A request's budget does not depend on the others in the batch
+        assert response == generate_budget(request)
+
+
+def test_single_budget():
+    request = BudgetRequest(user_id="1", incomes=[Income(source="Salary", amount=5000)],
+                            expenses=[Expense(category="Rent", amount=1200),
+                                      Expense(category="rent", amount=100, period="weekly"),
+                                      Expense(category="Salary", amount=120, period="yearly")])
+    response = generate_budget(request)
+    assert response.summary.model_dump() == {"total_income": 5000.0, "total_expenses": 1643.33,
+                                             "net_savings": 3356.67, "savings_rate": 67.13}
+    assert response.details == {"Salary": 5000.0, "Rent": 1633.33, "Salary (expense)": 10.0}
+    assert response.message.endswith("Good job!")
+
+
+def test_empty_requests():
+    assert generate_budgets([]) == []
+    response = generate_budget(BudgetRequest(user_id="1", incomes=[], expenses=[]))
+    assert response.summary.total_income == 0 and response.details == {}
+    assert response.message.startswith("Add your income")
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.utils.cpu_pool import CPUPool, PoolSaturated
+
+
+def test_runs_sync_and_async_calls():
+    pool = CPUPool(workers=2, processes=False)
+    try:
+        assert pool.run(pow, 2, 10) == 1024
+        assert asyncio.run(pool.arun(pow, 3, 2)) == 9
+        assert pool.stats()["completed"] == 2
+    finally:
+        pool.close()
+
+
+def test_saturated_pool_rejects_work():
+    release = threading.Event()
+    pool = CPUPool(workers=1, max_pending=2, processes=False)
+    try:
+        futures = [pool.submit(release.wait) for _ in range(2)]
+        assert pool.stats()["queued"] == 1
+        with pytest.raises(PoolSaturated) as rejected:
+            pool.submit(release.wait)
+        assert rejected.value.retry_after >= 1
+        release.set()
+        assert all(f.result() for f in futures)
+        assert pool.stats() == {"completed": 2, "failed": 0, "rejected": 1, "pending": 0,
+                                "running": 0, "queued": 0}
+    finally:
+        release.set()
+        pool.close()
+
+
+def test_broken_process_pool_is_shut_down_and_replaced():
+    import os
+    from concurrent.futures.process import BrokenProcessPool
+
+    pool = CPUPool(workers=1)
+    try:
+        broken = pool.start()
+        with pytest.raises(BrokenProcessPool):
+            pool.run(os._exit, 1)  # the worker process dies
+        assert pool._executor is None
+        assert broken._shutdown_thread  # shut down, not left behind
+        assert pool.run(pow, 2, 5) == 32  # on a new pool
+        assert pool._executor is not broken
+    finally:
+        pool.close()
+
+
+def test_job_export_streams_from_its_file(run_app):
+    import os
+
+    async def scenario(client):
+        submitted = await client.post("/jobs/download-budget?format=csv",
+                                      json={"message": "Salary: 3000 monthly\nRent: 1200 monthly"})
+        job_id = submitted.json()["job_id"]
+        for _ in range(200):
+            status = (await client.get(f"/jobs/{job_id}")).json()["status"]
+            if status not in ("queued", "running"):
+                break
+            await asyncio.sleep(0.02)
+        return job_id, status, await client.get(f"/jobs/{job_id}/result")
+
+    job_id, status, response = run_app(scenario)
+    assert status == "succeeded"
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines()[0] == "Type,Label,Amount,Period"
+
+    from app.models.model import Job, SessionLocal
+    with SessionLocal() as db:
+        job = db.get(Job, job_id)
+        assert job.result_file is None and os.path.exists(job.result_path)
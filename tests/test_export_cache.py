@@ -0,0 +1,48 @@
+from app.utils.export_cache import ExportCache
+
+
+def test_hit_and_miss():
+    cache = ExportCache(max_bytes=100, max_entry_bytes=50)
+    assert cache.get((1, "7", "csv")) is None
+    cache.put((1, "7", "csv"), b"a,b\n")
+    assert cache.get((1, "7", "csv")) == b"a,b\n"
+    assert cache.stats() == {"hits": 1, "misses": 1, "invalidations": 0, "entries": 1, "bytes": 4}
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ExportCache(max_bytes=30, max_entry_bytes=20)
+    cache.put((1, "csv"), b"x" * 10)
+    cache.put((2, "csv"), b"y" * 10)
+    cache.get((1, "csv"))
+    cache.put((3, "csv"), b"z" * 15)
+    assert cache.get((2, "csv")) is None
+    assert cache.get((1, "csv")) is not None
+    assert cache.stats()["bytes"] == 25
+    # Larger than max_entry_bytes: never cached
+    cache.put((4, "csv"), b"w" * 21)
+    assert cache.get((4, "csv")) is None
+
+
+def test_invalidate_drops_every_format_of_a_journal():
+    cache = ExportCache(max_bytes=100, max_entry_bytes=50)
+    cache.put((1, "7", "csv"), b"csv")
+    cache.put((1, "7", "xlsx"), b"xlsx")
+    cache.put((2, "7", "csv"), b"other")
+    cache.invalidate(1)
+    assert cache.get((1, "7", "csv")) is None and cache.get((1, "7", "xlsx")) is None
+    assert cache.get((2, "7", "csv")) == b"other"
+    assert cache.stats()["bytes"] == 5
+
+
+def test_tee_caches_complete_exports_only():
+    cache = ExportCache(max_bytes=100, max_entry_bytes=10)
+    assert list(cache.tee((1, "csv"), [b"ab", b"cd"])) == [b"ab", b"cd"]
+    assert cache.get((1, "csv")) == b"abcd"
+    # Too large: still streamed in full, not cached
+    assert b"".join(cache.tee((2, "csv"), [b"x" * 6, b"y" * 6])) == b"x" * 6 + b"y" * 6
+    assert cache.get((2, "csv")) is None
+    # Abandoned mid-stream: not cached
+    chunks = cache.tee((3, "csv"), [b"ab", b"cd"])
+    next(chunks)
+    chunks.close()
+    assert cache.get((3, "csv")) is None
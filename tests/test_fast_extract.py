@@ -0,0 +1,57 @@
+import pytest
+
+from app.utils.fast_extract import extract_budget
+
+
+def labels(result):
+    return ([(i.source, i.amount, i.period) for i in result["income"]],
+            [(e.category, e.amount, e.period) for e in result["expenses"]])
+
+
+def test_parses_labelled_items():
+    incomes, expenses = labels(extract_budget("Salary: 5000\nRent: 1200\nGroceries: 300 per week"))
+    assert incomes == [("Salary", 5000.0, "monthly")]
+    assert expenses == [("Rent", 1200.0, "monthly"), ("Groceries", 300.0, "weekly")]
+
+
+def test_section_headers_classify_unknown_labels():
+    incomes, expenses = labels(extract_budget("Income:\n- Acme: 4000\nExpenses:\n- Landlord: 1500"))
+    assert incomes == [("Acme", 4000.0, "monthly")]
+    assert expenses == [("Landlord", 1500.0, "monthly")]
+
+
+def test_k_suffix():
+    incomes, _ = labels(extract_budget("Salary: 5k monthly, Rent: 1200"))
+    assert incomes == [("Salary", 5000.0, "monthly")]
+
+
+@pytest.mark.parametrize("note", [
+    "Tax refund: 800",
+    "car sale 3000",
+    "Insurance payout: 2000",
+    "Expense reimbursement: 150",
+    "Interest received: 40",
+    "Salary: 5000\nTax refund: 800\nRent: 1200",
+    "Expenses:\n- Tax refund: 800",
+])
+def test_money_coming_back_falls_through_to_the_llm(note):
+    assert extract_budget(note) is None
+
+
+@pytest.mark.parametrize("note", [
+    "Salary loan: 500",
+    "Income:\n- Bonus rent: 300",
+])
+def test_mixed_income_and_expense_words_fall_through(note):
+    assert extract_budget(note) is None
+
+
+@pytest.mark.parametrize("note", [
+    "Rent: 1200 listed under",  # amount inside prose
+    "Income:\n- Rent: 1200",  # conflicts with its section
+    "Widgets: 40",  # no keyword, no section
+    "Hello, I want to get better with money and I earn about 5000 dollars",
+    "",
+])
+def test_ambiguous_notes_return_none(note):
+    assert extract_budget(note) is None
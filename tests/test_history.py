@@ -0,0 +1,40 @@
+from app.models.model import FinanceJournal, SessionLocal
+from app.utils.security import issue_token
+
+USER_ID = 4242
+
+
+def add_journals(user_id, notes):
+    with SessionLocal() as db:
+        journals = [FinanceJournal(user_id=user_id, journal_note=note) for note in notes]
+        db.add_all(journals)
+        db.commit()
+        return [journal.id for journal in journals]
+
+
+def test_history_pages_walk_every_journal_once(run_app):
+    first = add_journals(USER_ID, [f"note {i}" for i in range(7)])
+    add_journals(USER_ID + 1, ["someone else's note"])
+    headers = {"Authorization": f"Bearer {issue_token(USER_ID, 'pager')['token']}"}
+
+    async def scenario(client):
+        pages, cursor, added = [], None, []
+        while True:
+            params = {"limit": 3, "fields": "id,journal_note"}
+            if cursor is not None:
+                params["after_id"] = cursor
+            response = await client.post("/get-all-finance-record/advice", params=params, headers=headers)
+            assert response.status_code == 200
+            pages.append(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return pages, added
+            if not added:
+                # Written while paging: shows up on a later page, shifts nothing
+                added = add_journals(USER_ID, ["written mid-walk"])
+
+    pages, added = run_app(scenario)
+    ids = [row["id"] for page in pages for row in page]
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert ids == first + added
+    assert all(set(row) == {"id", "journal_note"} for page in pages for row in page)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+import pytest
+
+from app.models.model import Job, SessionLocal
+from app.services.job_service import (CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobFailed, JobResult,
+                                      JobRetryLater, JobRunner)
+
+
+@pytest.fixture(autouse=True)
+def _clean_jobs(database):
+    yield
+    with SessionLocal() as db:
+        db.query(Job).delete()
+        db.commit()
+
+
+def load(job_id: str) -> Job:
+    with SessionLocal() as db:
+        return db.get(Job, job_id)
+
+
+async def wait_for(job_id: str, *statuses: str) -> Job:
+    for _ in range(500):
+        job = load(job_id)
+        if job.status in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} is still {job.status}")
+
+
+def run_jobs(handler, scenario, **options):
+    """Run scenario(runner) against a started JobRunner with one `test` handler."""
+    async def main():
+        runner = JobRunner({"test": handler}, **{"retry_backoff": 0.01, "sweep_interval": 60, **options})
+        await runner.start()
+        try:
+            return await scenario(runner)
+        finally:
+            await runner.stop(drain_seconds=0.1)
+    return asyncio.run(main())
+
+
+def test_successful_job_records_its_result():
+    async def handler(payload, job):
+        return JobResult(data={"echo": payload["value"]})
+
+    async def scenario(runner):
+        job = await runner.submit("test", {"value": 3}, user_id=None)
+        return await wait_for(job.id, SUCCEEDED, FAILED)
+
+    job = run_jobs(handler, scenario)
+    assert (job.status, job.attempts, json.loads(job.result)) == (SUCCEEDED, 1, {"echo": 3})
+
+
+def test_failed_attempt_is_retried():
+    calls = []
+
+    async def handler(payload, job):
+        calls.append(job.attempts)
+        if len(calls) == 1:
+            raise RuntimeError("flaky")
+        return JobResult(data="ok")
+
+    async def scenario(runner):
+        job = await runner.submit("test", {})
+        return await wait_for(job.id, SUCCEEDED, FAILED), runner.stats()
+
+    job, stats = run_jobs(handler, scenario)
+    assert (job.status, job.attempts, calls) == (SUCCEEDED, 2, [1, 2])
+    assert stats["retried"] == 1
+
+
+def test_job_fails_after_max_attempts():
+    async def handler(payload, job):
+        raise RuntimeError("broken")
+
+    async def scenario(runner):
+        job = await runner.submit("test", {})
+        return await wait_for(job.id, SUCCEEDED, FAILED)
+
+    job = run_jobs(handler, scenario, max_attempts=2)
+    assert (job.status, job.attempts, job.error) == (FAILED, 2, "broken")
+
+
+def test_job_failed_is_not_retried():
+    async def handler(payload, job):
+        raise JobFailed("bad input")
+
+    async def scenario(runner):
+        job = await runner.submit("test", {})
+        return await wait_for(job.id, SUCCEEDED, FAILED)
+
+    job = run_jobs(handler, scenario, max_attempts=3)
+    assert (job.status, job.attempts) == (FAILED, 1)
+
+
+def test_retry_later_waits_as_asked_and_counts_as_an_attempt():
+    calls = []
+
+    async def handler(payload, job):
+        calls.append(job.attempts)
+        if len(calls) <= 2:
+            raise JobRetryLater(0.01, "rate limited")
+        return JobResult(data="ok")
+
+    async def scenario(runner):
+        job = await runner.submit("test", {})
+        return await wait_for(job.id, SUCCEEDED, FAILED)
+
+    # Far shorter than the backoff: the handler's delay is used
+    job = run_jobs(handler, scenario, max_attempts=3, retry_backoff=60)
+    assert (job.status, job.attempts, calls) == (SUCCEEDED, 3, [1, 2, 3])
+
+
+def test_retry_later_gives_up_after_max_attempts():
+    calls = []
+
+    async def handler(payload, job):
+        calls.append(job.attempts)
+        raise JobRetryLater(0.01, "rate limited")
+
+    async def scenario(runner):
+        job = await runner.submit("test", {})
+        return await wait_for(job.id, SUCCEEDED, FAILED)
+
+    job = run_jobs(handler, scenario, max_attempts=2)
+    assert (job.status, job.attempts, job.error, calls) == (FAILED, 2, "rate limited", [1, 2])
+
+
+def test_cancel_running_and_queued_jobs():
+    started = []
+
+    async def handler(payload, job):
+        started.append(payload["n"])
+        await asyncio.sleep(30)
+        return JobResult(data="late")
+
+    async def scenario(runner):
+        running = await runner.submit("test", {"n": 1})
+        queued = await runner.submit("test", {"n": 2})  # waits for the only worker
+        await wait_for(running.id, RUNNING)
+        results = [await runner.cancel(queued.id), await runner.cancel(running.id),
+                   await runner.cancel(running.id)]
+        return results, load(running.id), load(queued.id)
+
+    results, running, queued = run_jobs(handler, scenario, workers=1)
+    assert results == [True, True, False]  # finished jobs cannot be cancelled again
+    assert (running.status, queued.status) == (CANCELLED, CANCELLED)
+    assert started == [1]
+
+
+def test_stop_requeues_interrupted_jobs():
+    async def handler(payload, job):
+        await asyncio.sleep(30)
+
+    async def scenario(runner):
+        job = await runner.submit("test", {})
+        await wait_for(job.id, RUNNING)
+        return job.id
+
+    job = load(run_jobs(handler, scenario))
+    assert (job.status, job.attempts) == (QUEUED, 0)
+
+
+def test_submit_needs_a_started_runner():
+    runner = JobRunner({"test": None})
+    with pytest.raises(RuntimeError):
+        asyncio.run(runner.submit("test", {}))
+
+
+def test_expired_jobs_take_their_result_files_with_them(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_bytes(b"Type,Label,Amount,Period\n")
+
+    async def handler(payload, job):
+        return JobResult(path=str(path), media_type="text/csv")
+
+    async def scenario(runner):
+        job = await runner.submit("test", {})
+        await wait_for(job.id, SUCCEEDED)
+        assert path.exists()
+        runner.retention_seconds = -1  # already expired
+        runner._sweep()
+        return load(job.id)
+
+    assert run_jobs(handler, scenario) is None
+    assert not path.exists()
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+from sqlalchemy import func, select
+
+from app.utils.llm_cache import TieredLLMCache, cache_key, llm_cache_table
+
+LLM = "groq-llama3-70b-8192-temperature-0"
+
+
+def answer(text):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TieredLLMCache(f"sqlite:///{tmp_path / 'cache.db'}", memory_size=4, max_rows=10, evict_every=5)
+    cache.setup()
+    yield cache
+    cache.close()
+
+
+def rows(cache):
+    with cache.setup().connect() as conn:
+        return conn.execute(select(func.count()).select_from(llm_cache_table)).scalar()
+
+
+def test_miss_then_hit(cache):
+    assert cache.lookup("What is my budget?", LLM) is None
+    cache.update("What is my budget?", LLM, answer("2000"))
+    # Whitespace differences map to the same entry, another model does not
+    assert cache.lookup("What  is my\nbudget?", LLM)[0].message.content == "2000"
+    assert cache.lookup("What is my budget?", LLM + "-other") is None
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_persisted_tier_survives_a_new_process(cache):
+    cache.update("prompt", LLM, answer("from disk"))
+    reopened = TieredLLMCache(cache.database_url)
+    try:
+        assert reopened.lookup("prompt", LLM)[0].message.content == "from disk"
+        assert reopened.stats()["disk_hits"] == 1
+        # Promoted to memory on the way out
+        assert reopened.lookup("prompt", LLM)[0].message.content == "from disk"
+        assert reopened.stats()["memory_hits"] == 1
+    finally:
+        reopened.close()
+
+
+def test_sqlite_engine_uses_wal(cache):
+    with cache.setup().connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+
+
+def test_memory_tier_is_a_bounded_lru(cache):
+    for i in range(5):
+        cache.update(f"prompt {i}", LLM, answer(str(i)))
+    assert cache.stats()["memory_entries"] == 4
+    # The oldest entry left memory but is still answered from disk
+    assert cache.lookup("prompt 0", LLM)[0].message.content == "0"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_table_is_trimmed_every_few_writes(cache):
+    for i in range(14):
+        cache.update(f"prompt {i}", LLM, answer(str(i)))
+    # Nothing to trim on the 5th and 10th write, the next check is on the 15th
+    assert rows(cache) == 14
+    cache.update("prompt 14", LLM, answer("14"))
+    assert rows(cache) == 10
+    assert cache.lookup("prompt 14", LLM) is not None
+    with cache.setup().connect() as conn:
+        kept = set(conn.execute(select(llm_cache_table.c.key)).scalars())
+    assert cache_key("prompt 0", LLM) not in kept
+    assert cache_key("prompt 14", LLM) in kept
+
+
+def test_expired_entries_are_ignored_in_both_tiers(cache, monkeypatch):
+    cache.update("prompt", LLM, answer("stale"))
+    later = time.time() + cache.ttl_seconds + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.lookup("prompt", LLM) is None
+    assert cache.stats()["memory_entries"] == 0
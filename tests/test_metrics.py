@@ -0,0 +1,26 @@
+import logging
+
+from app.utils.metrics import count_client_retries, llm_retries
+
+
+def retries():
+    return sum(llm_retries._values.values())
+
+
+def test_client_retries_are_counted_without_touching_the_logger_level():
+    logger = logging.getLogger("test.groq_client")
+    logger.setLevel(logging.WARNING)
+    assert count_client_retries("test.groq_client") is False
+    assert logger.level == logging.WARNING
+    count_client_retries("test.groq_client")  # installed once
+    assert len(logger.handlers) == 1
+
+    before = retries()
+    logger.info("Retrying request to %s in %f seconds", "/chat/completions", 0.5)
+    assert retries() == before
+
+    logger.setLevel(logging.INFO)
+    assert count_client_retries("test.groq_client") is True
+    logger.info("Retrying request to %s in %f seconds", "/chat/completions", 0.5)
+    logger.info("HTTP Request: POST /chat/completions")
+    assert retries() == before + 1
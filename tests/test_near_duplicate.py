@@ -0,0 +1,81 @@
+import pytest
+
+from app.models.advice import Expense, Income
+from app.utils.near_duplicate import NoteIndex
+
+NOTE = "Salary: 5000 every month. Rent: 1200. Groceries: 300 and transport 80."
+BRANCHES = {
+    "income": [Income(source="Salary", amount=5000, period="monthly")],
+    "expenses": [Expense(category="Rent", amount=1200, period="monthly"),
+                 Expense(category="Groceries", amount=300, period="monthly"),
+                 Expense(category="Transport", amount=80, period="monthly")],
+    "concerns": "Little room for savings.",
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = NoteIndex(f"sqlite:///{tmp_path / 'notes.db'}", max_entries=10)
+    index.setup()
+    index.add(NOTE, BRANCHES)
+    yield index
+    index.close()
+
+
+def amounts(branches):
+    return ([i.amount for i in branches["income"]], [e.amount for e in branches["expenses"]])
+
+
+def test_exact_note_reuses_every_branch(index):
+    assert index.lookup(NOTE) == BRANCHES
+    assert index.stats()["exact_hits"] == 1
+
+
+def test_reordered_and_respaced_note_is_reused(index):
+    note = "Rent:  1200.  Salary: 5000 every month.\nTransport 80 and Groceries: 300."
+    assert index.lookup(note) == BRANCHES
+
+
+def test_changed_amount_is_patched_into_the_items(index):
+    reused = index.lookup(NOTE.replace("1200", "1350"))
+    assert amounts(reused) == ([5000], [1350, 300, 80])
+    assert "concerns" not in reused  # the concerns were written for the old amounts
+
+
+def test_swapped_amounts_follow_their_labels(index):
+    note = NOTE.replace("1200", "X").replace("300", "1200").replace("X", "300")
+    assert amounts(index.lookup(note)) == ([5000], [300, 1200, 80])
+
+
+def test_changed_number_that_is_not_an_amount_is_rejected(index):
+    note = "Budget for March 2024. " + NOTE
+    index.add(note, BRANCHES)
+    assert index.lookup(note.replace("2024", "2025")) is None
+    assert index.stats()["rejected"] == 1
+
+
+def test_unrelated_note_misses(index):
+    assert index.lookup("I earn 4000 from consulting and pay 900 for childcare.") is None
+    assert index.stats()["misses"] == 1
+
+
+def test_entries_survive_a_restart(index, tmp_path):
+    index.close()  # writes what is queued
+    reopened = NoteIndex(index.database_url, max_entries=10)
+    reopened.setup()
+    try:
+        assert reopened.lookup(NOTE) == BRANCHES
+    finally:
+        reopened.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    index = NoteIndex(f"sqlite:///{tmp_path / 'notes.db'}", max_entries=2)
+    index.setup()
+    try:
+        for n in range(3):
+            index.add(f"Salary: {5000 + n}, savings goal {n} for the trip", {"concerns": str(n)})
+        assert index.stats()["entries"] == 2
+        assert index.lookup("Salary: 5000, savings goal 0 for the trip") is None
+    finally:
+        index.close()
@@ -0,0 +1,79 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from app.chains.pipeline import Pipeline, Stage
+
+
+def build(known=None):
+    calls = Counter()
+
+    def step(name, fn):
+        def run(x):
+            calls[name] += 1
+            return fn(x)
+        return RunnableLambda(run)
+
+    pipeline = Pipeline([
+        Stage("known", step("known", lambda x: known), internal=True),
+        Stage("insight", step("insight", lambda x: f"insight({x['note']})")),
+        Stage("income", step("income", lambda insight: ["salary"]), deps=["known", "insight"], group="branches",
+              shortcut=("known", lambda k: k.get("income") if k else None)),
+        Stage("expenses", step("expenses", lambda insight: ["rent"]), deps=["insight"], group="branches"),
+        Stage("advice", step("advice", lambda d: f"{d['income']}/{d['expenses']}"), deps=["income", "expenses"]),
+    ])
+    return pipeline, calls
+
+
+def test_runs_every_stage_and_nests_groups():
+    pipeline, calls = build()
+    result = pipeline.invoke({"note": "n"})
+    assert result == {"insight": "insight(n)",
+                      "branches": {"income": ["salary"], "expenses": ["rent"]},
+                      "advice": "['salary']/['rent']"}
+    assert "known" not in result
+    assert all(count == 1 for count in calls.values())
+
+
+def test_select_only_runs_what_the_outputs_need():
+    pipeline, calls = build()
+    result = pipeline.select("expenses").invoke({"note": "n"})
+    assert result == {"branches": {"expenses": ["rent"]}}
+    assert set(calls) == {"insight", "expenses"}
+
+
+def test_select_rejects_unknown_outputs():
+    pipeline, _ = build()
+    with pytest.raises(ValueError):
+        pipeline.select("nope")
+
+
+@pytest.mark.parametrize("run", ["invoke", "ainvoke"])
+def test_shortcut_skips_the_stage_and_its_other_deps(run):
+    pipeline, calls = build(known={"income": ["bonus"]})
+    selected = pipeline.select("income")
+    if run == "invoke":
+        result = selected.invoke({"note": "n"})
+    else:
+        result = asyncio.run(selected.ainvoke({"note": "n"}))
+    assert result == {"branches": {"income": ["bonus"]}}
+    assert set(calls) == {"known"}
+
+
+@pytest.mark.parametrize("run", ["invoke", "ainvoke"])
+def test_unresolved_shortcut_runs_the_stage(run):
+    pipeline, calls = build(known={"expenses": ["rent"]})
+    selected = pipeline.select("income")
+    if run == "invoke":
+        result = selected.invoke({"note": "n"})
+    else:
+        result = asyncio.run(selected.ainvoke({"note": "n"}))
+    assert result == {"branches": {"income": ["salary"]}}
+    assert set(calls) == {"known", "insight", "income"}
+
+
+def test_shortcut_dependency_must_be_a_dependency():
+    with pytest.raises(ValueError):
+        Stage("income", RunnableLambda(lambda x: x), deps=["insight"], shortcut=("known", lambda k: k))
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+from langchain_core.outputs import LLMResult
+
+from app.utils.rate_limit import LLMRateLimiter, RateLimitExceeded, RateLimitUsageCallback, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.monotonic frozen at a value the test moves forward"""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_refills_continuously_up_to_capacity():
+    bucket = TokenBucket(per_minute=60)  # one token a second
+    bucket.updated = 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now=0.0) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now=1.0) == 0.0
+    assert bucket.wait_time(61, now=1000.0) == pytest.approx(1.0)  # capped at capacity
+    assert bucket.tokens == 60
+
+
+def test_debt_is_repaid_before_the_next_caller():
+    bucket = TokenBucket(per_minute=60)
+    bucket.updated = 0.0
+    bucket.take(62)  # two callers reserved past the balance
+    assert bucket.wait_time(1, now=0.0) == pytest.approx(3.0)
+
+
+def limiter(**overrides):
+    settings = dict(requests_per_minute=60, tokens_per_minute=6000, max_queue=4,
+                    max_wait_seconds=0.5, estimated_tokens=100)
+    return LLMRateLimiter(**{**settings, **overrides})
+
+
+def test_calls_past_the_deadline_fail_with_retry_after(clock):
+    limit = limiter(requests_per_minute=2)
+    assert limit.acquire() and limit.acquire()
+    with pytest.raises(RateLimitExceeded) as raised:
+        limit.acquire()
+    assert raised.value.retry_after == pytest.approx(30.0)
+    assert raised.value.reason == "wait exceeds deadline"
+    clock[0] += 30
+    assert limit.acquire()
+    assert limit.stats()["rejected"] == 1
+
+
+def test_full_queue_fails_fast(clock):
+    limit = limiter(requests_per_minute=1, max_queue=0, max_wait_seconds=120)
+    assert limit.acquire()
+    with pytest.raises(RateLimitExceeded, match="queue full") as raised:
+        limit.acquire()
+    assert raised.value.retry_after == pytest.approx(60.0)
+
+
+def test_non_blocking_acquire_does_not_reserve(clock):
+    limit = limiter(requests_per_minute=1)
+    assert limit.acquire(blocking=False)
+    assert not limit.acquire(blocking=False)
+    assert limit.stats()["admitted"] == 1
+
+
+def test_token_budget_is_settled_against_real_usage(clock):
+    limit = limiter(tokens_per_minute=1000, estimated_tokens=100)
+    callback = RateLimitUsageCallback(limit)
+    assert limit.acquire()
+    callback.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": {"total_tokens": 950}}))
+    assert limit.stats()["tokens_available"] == 50
+    # 100 more estimated tokens need 50 more to come back: 3 s at 1000 a minute
+    with pytest.raises(RateLimitExceeded) as raised:
+        limit.acquire()
+    assert raised.value.retry_after == pytest.approx(3.0)
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+from app.models.advice import Expense, Income
+from app.models.model import BudgetLineItem, BudgetRollup, FinanceJournal, SessionLocal
+from app.services import rollup_service
+from app.services.rollup_service import apply_rollups, rebuild_rollups, remove_rollups, user_trends
+
+
+@pytest.fixture(autouse=True)
+def _database(database):
+    pass
+
+
+def store(db, user_id, created_at, incomes, expenses):
+    """What store_advice_message does: the journal, its line items and the rollup increments"""
+    items = ([BudgetLineItem(kind="income", label=i.source, amount=i.amount, period=i.period) for i in incomes]
+             + [BudgetLineItem(kind="expense", label=e.category, amount=e.amount, period=e.period)
+                for e in expenses])
+    for position, item in enumerate(items):
+        item.position = position
+    journal = FinanceJournal(user_id=user_id, journal_note="note", created_at=created_at, line_items=items)
+    db.add(journal)
+    apply_rollups(db, user_id, created_at, incomes, expenses)
+    db.commit()
+    return journal
+
+
+def snapshot(db, user_id):
+    return {(r.period, r.kind, r.category): (round(r.total, 6), r.item_count, r.journal_count)
+            for r in db.query(BudgetRollup).filter(BudgetRollup.user_id == user_id)}
+
+
+def test_incremental_rollups_match_a_rebuild():
+    user_id = 501
+    with SessionLocal() as db:
+        store(db, user_id, datetime(2024, 1, 5), [Income(source="Salary", amount=5000)],
+              [Expense(category="Rent", amount=1200), Expense(category="Insurance", amount=600, period="yearly")])
+        store(db, user_id, datetime(2024, 1, 20), [Income(source="salary ", amount=5000)],
+              [Expense(category="Groceries", amount=80, period="weekly")])
+        changed = store(db, user_id, datetime(2024, 2, 1), [Income(source="Bonus", amount=900, period="one-off")],
+                        [Expense(category="Rent", amount=1200)])
+        store(db, user_id + 1, datetime(2024, 1, 1), [Income(source="Salary", amount=1)], [])
+
+        # A journal analyzed again: its old items leave the rollups, the new ones go in
+        remove_rollups(db, changed)
+        changed.line_items = [BudgetLineItem(kind="expense", label="Rent", amount=1300, period="monthly",
+                                             position=0)]
+        apply_rollups(db, user_id, changed.created_at, [], [Expense(category="Rent", amount=1300)])
+        db.commit()
+
+        incremental = snapshot(db, user_id)
+        other_user = snapshot(db, user_id + 1)
+        assert incremental[("2024-01", "income", "salary")] == (10000, 2, 2)
+        assert ("2024-02", "income", "bonus") not in incremental
+        assert incremental[("2024-02", "expense", "rent")] == (1300, 1, 1)
+
+        assert rebuild_rollups(db, user_id) == 3
+        assert snapshot(db, user_id) == incremental
+        assert snapshot(db, user_id + 1) == other_user
+        assert user_trends(db, user_id)["periods"] == ["2024-01", "2024-02"]
+
+
+def test_large_upserts_are_batched(monkeypatch):
+    user_id = 502
+    statements = []
+    monkeypatch.setattr(rollup_service, "UPSERT_BATCH_SIZE", 3)
+    expenses = [Expense(category=f"category {i}", amount=i) for i in range(8)]
+    with SessionLocal() as db:
+        from sqlalchemy import event
+
+        listen = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.get_bind(), "before_cursor_execute", listen)
+        try:
+            store(db, user_id, datetime(2024, 3, 1), [], expenses)
+            store(db, user_id, datetime(2024, 3, 2), [], expenses)
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listen)
+        assert sum("INSERT INTO budget_rollup" in s for s in statements) == 6
+        assert snapshot(db, user_id)[("2024-03", "expense", "category 7")] == (14, 2, 2)
@@ -0,0 +1,88 @@
+import pytest
+
+from app.utils.security import InvalidToken, issue_token, revocations, verify_token
+
+
+@pytest.fixture(autouse=True)
+def _database(database):
+    pass
+
+
+def test_issued_token_verifies():
+    issued = issue_token(7, "ada")
+    claims = verify_token(issued["token"])
+    assert claims == issued["claims"]
+    assert (claims["sub"], claims["username"]) == (7, "ada")
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda token: token[:-2] + ("AA" if not token.endswith("AA") else "BB"),  # signature
+    lambda token: "e30" + token[token.index("."):],  # payload
+    lambda token: token.replace(".", ""),
+    lambda token: token + "é",
+    lambda token: "é" + token,
+])
+def test_tampered_tokens_are_rejected(mangle):
+    with pytest.raises(InvalidToken):
+        verify_token(mangle(issue_token(7, "ada")["token"]))
+
+
+def test_expired_token_is_rejected():
+    with pytest.raises(InvalidToken, match="expired"):
+        verify_token(issue_token(7, "ada", ttl_seconds=-1)["token"])
+
+
+def test_revoked_token_is_rejected_and_others_still_verify():
+    revoked, kept = issue_token(7, "ada"), issue_token(7, "ada")
+    revocations.revoke(revoked["claims"])
+    with pytest.raises(InvalidToken, match="revoked"):
+        verify_token(revoked["token"])
+    assert verify_token(kept["token"])["jti"] == kept["claims"]["jti"]
+
+
+def test_revocations_are_reloaded_from_the_database():
+    issued = issue_token(8, "grace")
+    revocations.revoke(issued["claims"])
+    revocations._revoked = set()  # as in another worker
+    revocations._loaded_at = 0.0
+    with pytest.raises(InvalidToken, match="revoked"):
+        verify_token(issued["token"])
+
+
+def test_expired_revocations_are_pruned_off_the_request_path():
+    from app.models.model import RevokedToken, SessionLocal
+
+    expired = issue_token(9, "linus", ttl_seconds=-1)["claims"]
+    live = issue_token(9, "linus")["claims"]
+    revocations.revoke(expired)
+    revocations.revoke(live)
+    revocations._loaded_at = 0.0
+    revocations.is_revoked(live["jti"])  # a reload only reads
+    with SessionLocal() as db:
+        assert db.get(RevokedToken, expired["jti"]) is not None
+    assert revocations.prune() >= 1
+    with SessionLocal() as db:
+        assert db.get(RevokedToken, expired["jti"]) is None
+        assert db.get(RevokedToken, live["jti"]) is not None
+
+
+def test_concurrent_checks_reload_once(monkeypatch):
+    import threading
+
+    from app.utils import security
+
+    queries = []
+    session_local = security.SessionLocal
+
+    def counting_session():
+        queries.append(1)
+        return session_local()
+
+    monkeypatch.setattr(security, "SessionLocal", counting_session)
+    revocations._loaded_at = 0.0
+    threads = [threading.Thread(target=revocations.is_revoked, args=("jti",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(queries) == 1
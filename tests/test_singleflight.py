@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from app.utils.singleflight import CoalescedRunnable, SingleFlight, normalize_text
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["coalesced"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["result"] * 5
+    assert calls == [1]
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_error_reaches_every_thread():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", work)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["coalesced"] < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 3 and all(str(e) == "upstream failed" for e in errors)
+    # The failed call is not remembered: the next caller runs again
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_async_callers_share_one_call_and_its_error():
+    flight = SingleFlight()
+    calls = []
+
+    async def work(fail):
+        calls.append(fail)
+        await asyncio.sleep(0.01)
+        if fail:
+            raise ValueError("upstream failed")
+        return "result"
+
+    async def main():
+        ok = await asyncio.gather(*(flight.ado("ok", work, False) for _ in range(4)))
+        failed = await asyncio.gather(*(flight.ado("bad", work, True) for _ in range(3)),
+                                      return_exceptions=True)
+        return ok, failed
+
+    ok, failed = asyncio.run(main())
+    assert ok == ["result"] * 4
+    assert len(failed) == 3 and all(isinstance(e, ValueError) for e in failed)
+    assert calls == [False, True]
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado("key", work))
+        second = asyncio.ensure_future(flight.ado("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_coalesced_runnable_keys_on_normalized_input():
+    flight = SingleFlight()
+    calls = []
+
+    async def analyze(inputs):
+        calls.append(inputs["user_input"])
+        await asyncio.sleep(0.01)
+        return inputs["user_input"].upper()
+
+    runnable = CoalescedRunnable(RunnableLambda(analyze), flight,
+                                 key=lambda inputs: normalize_text(inputs["user_input"]))
+
+    async def main():
+        return await asyncio.gather(runnable.ainvoke({"user_input": "rent 900"}),
+                                    runnable.ainvoke({"user_input": "  rent\n900 "}))
+
+    assert asyncio.run(main()) == ["RENT 900", "RENT 900"]
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("text", ["a  b", " a\tb\n", "a\n\nb"])
+def test_normalize_text(text):
+    assert normalize_text(text) == "a b"
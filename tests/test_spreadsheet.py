@@ -0,0 +1,88 @@
+import csv
+import io
+import os
+
+import pytest
+
+from app.models.advice import Expense, Income
+from app.utils.spreadsheet import (ExportFormatError, iter_budget_csv, iter_budget_export, iter_export_file,
+                                   negotiate_export_format, write_budget_export)
+
+INCOMES = [Income(source="salary", amount=3000, period="monthly"),
+           Income(source="freelance", amount=450.5, period="monthly")]
+EXPENSES = [Expense(category="rent", amount=1200, period="monthly"),
+            Expense(category="insurance", amount=600, period="yearly")]
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@pytest.mark.parametrize("format, accept, expected", [
+    (None, None, "xlsx"),
+    ("CSV", XLSX, "csv"),  # ?format= wins over the Accept header
+    (None, "text/csv", "csv"),
+    (None, f"{XLSX};q=0.5, application/vnd.apache.parquet;q=0.9", "parquet"),
+    (None, f"text/csv;q=0.8, {XLSX};q=0.8", "csv"),  # same quality: first listed
+    (None, "text/csv;q=0, application/x-parquet", "parquet"),
+    (None, "text/csv;q=bogus, application/json", "xlsx"),
+    (None, "text/html, */*", "xlsx"),
+])
+def test_negotiate_export_format(format, accept, expected):
+    assert negotiate_export_format(format, accept) == expected
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ExportFormatError):
+        negotiate_export_format("pdf")
+    with pytest.raises(ExportFormatError):
+        iter_budget_export(INCOMES, EXPENSES, "pdf")
+
+
+def test_unknown_format_answers_406(run_app):
+    async def scenario(client):
+        return await client.post("/download-budget?format=pdf", json={"message": "salary 3000 monthly"})
+
+    response = run_app(scenario)
+    assert response.status_code == 406
+    assert "pdf" in response.json()["detail"]
+
+
+def test_csv_export():
+    rows = list(csv.reader(io.StringIO(b"".join(iter_budget_csv(iter(INCOMES), iter(EXPENSES))).decode())))
+    assert rows == [
+        ["Type", "Label", "Amount", "Period"],
+        ["income", "salary", "3000.0", "monthly"],
+        ["income", "freelance", "450.5", "monthly"],
+        ["expense", "rent", "1200.0", "monthly"],
+        ["expense", "insurance", "600.0", "yearly"],
+        ["summary", "Total Income", "3450.5", ""],
+        ["summary", "Total Expenses", "1800.0", ""],
+        ["summary", "Savings", "1650.5", ""],
+    ]
+
+
+def test_xlsx_export():
+    from openpyxl import load_workbook
+
+    path = write_budget_export(iter(INCOMES), iter(EXPENSES), "xlsx")
+    workbook = load_workbook(io.BytesIO(b"".join(iter_export_file(path))), read_only=True)
+    assert not os.path.exists(path)
+    sheets = {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook}
+    assert sheets["Income"] == [["Source", "Amount", "Period"],
+                                ["salary", 3000, "monthly"], ["freelance", 450.5, "monthly"]]
+    assert sheets["Expenses"] == [["Category", "Amount", "Period"],
+                                  ["rent", 1200, "monthly"], ["insurance", 600, "yearly"]]
+    assert sheets["Summary"] == [["Total Income", 3450.5], ["Total Expenses", 1800], ["Savings", 1650.5]]
+
+
+def test_parquet_export():
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    path = write_budget_export(iter(INCOMES), iter(EXPENSES), "parquet")
+    table = pq.read_table(io.BytesIO(b"".join(iter_export_file(path))))
+    assert table.to_pylist() == [
+        {"type": "income", "label": "salary", "amount": 3000.0, "period": "monthly"},
+        {"type": "income", "label": "freelance", "amount": 450.5, "period": "monthly"},
+        {"type": "expense", "label": "rent", "amount": 1200.0, "period": "monthly"},
+        {"type": "expense", "label": "insurance", "amount": 600.0, "period": "yearly"},
+    ]
+
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from app.utils.write_behind import QueueFull, WriteBehindQueue, WriterClosed
+
+
+def test_items_are_written_in_batches_and_drained_on_close():
+    batches = []
+    queue = WriteBehindQueue(lambda items: batches.append(list(items)) or [i * 2 for i in items],
+                             max_batch=10, max_delay=0.05)
+    queue.start()
+    futures = [queue.submit(i) for i in range(25)]
+    queue.close()
+    assert [f.result() for f in futures] == [i * 2 for i in range(25)]
+    assert sum(len(b) for b in batches) == 25 and all(len(b) <= 10 for b in batches)
+    assert queue.stats()["written"] == 25
+
+
+def test_exception_results_fail_only_their_item():
+    def write(items):
+        return [ValueError(item) if item == "bad" else item.upper() for item in items]
+
+    queue = WriteBehindQueue(write, max_delay=0.05)
+    queue.start()
+    futures = [queue.submit(item) for item in ("a", "bad", "b")]
+    queue.close()
+    assert futures[0].result() == "A" and futures[2].result() == "B"
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert (queue.stats()["written"], queue.stats()["failed"]) == (2, 1)
+
+
+def test_failed_batch_fails_every_item():
+    def write(items):
+        raise RuntimeError("db down")
+
+    queue = WriteBehindQueue(write)
+    queue.start()
+    futures = [queue.submit(i) for i in range(3)]
+    queue.close()
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result()
+    assert queue.stats()["failed"] == 3
+
+
+def test_full_queue_rejects_items():
+    release = threading.Event()
+    queue = WriteBehindQueue(lambda items: release.wait() and [None] * len(items), max_batch=1,
+                             max_queue=1)
+    queue.start()
+    futures = [queue.submit(0)]
+    with pytest.raises(QueueFull):
+        for i in range(1, 5):
+            futures.append(queue.submit(i))
+    release.set()
+    queue.close()
+    assert queue.stats()["rejected"] == 1
+
+
+def test_closed_writer_rejects_items():
+    queue = WriteBehindQueue(lambda items: items)
+    with pytest.raises(WriterClosed):
+        queue.submit("before start")
+    queue.start()
+    queue.close()
+    with pytest.raises(WriterClosed):
+        queue.submit("after close")
+
+
+def test_items_submitted_while_closing_are_written_or_rejected():
+    queue = WriteBehindQueue(lambda items: items, max_delay=0.001)
+    queue.start()
+    outcomes = []
+
+    def submit_many():
+        for i in range(2000):
+            try:
+                outcomes.append(queue.submit(i))
+            except WriterClosed:
+                outcomes.append(None)
+
+    thread = threading.Thread(target=submit_many)
+    thread.start()
+    queue.close()
+    thread.join()
+    # Every accepted item got its result: none was queued after the writer stopped
+    assert all(f.result(timeout=1) is not None for f in outcomes if f is not None)
+
+
+def test_journals_are_stored_directly_when_the_writer_is_closed(app_main):
+    import asyncio
+
+    from app.models.model import FinanceJournal, SessionLocal
+
+    assert not app_main.journal_writer.running
+    with SessionLocal() as db:
+        journal_id = asyncio.run(app_main.astore_advice_message(
+            db, user_id=77, journal_note="salary 100", income=[], expenses=[], advice="save", budget="b"))
+        assert db.get(FinanceJournal, journal_id).journal_note == "salary 100"